@@ -0,0 +1,88 @@
+"""Async facade over `storage` for use inside FastAPI handlers.
+
+File I/O and JSON (de)serialization run on a bounded thread pool so a slow
+disk or a large conversation never stalls the event loop. Writes to the same
+conversation are serialized with a per-conversation lock, so two messages
+arriving together cannot clobber each other's read-modify-write.
+"""
+
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from . import storage, tracing
+from .config import STORAGE_WORKERS
+
+_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage") if STORAGE_WORKERS > 0 else None
+_locks = weakref.WeakValueDictionary()
+
+
+async def _run(fn, *args):
+    with tracing.span(f"storage.{fn.__name__}"):
+        if _executor is None:
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args))
+
+
+async def run(fn, *args):
+    """`fn(*args)`, a function that reads or writes stored conversations, on the storage workers."""
+    return await _run(fn, *args)
+
+
+def conversation_lock(cid) -> asyncio.Lock:
+    """Lock guarding writes to one conversation; dropped once nobody holds it."""
+    lock = _locks.get(cid)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[cid] = lock
+    return lock
+
+
+async def create_conversation(cid):
+    return await _run(storage.create_conversation, cid)
+
+
+async def get_conversation(cid):
+    convo = await _run(storage.get_conversation, cid)
+    if convo is not None and "history" not in convo:
+        async with conversation_lock(cid):
+            convo = await _run(storage.attach_history, cid)
+    return convo
+
+
+async def get_messages(cid, before=None, limit=None, include_vrt=False):
+    return await _run(storage.get_messages, cid, before, limit, include_vrt)
+
+
+async def get_message_vrt(cid, idx):
+    return await _run(storage.get_message_vrt, cid, idx)
+
+
+async def list_conversations(offset=0, limit=None, sort_by="created_at", descending=True):
+    return await _run(storage.list_conversations, offset, limit, sort_by, descending)
+
+
+async def count_conversations():
+    return await _run(storage.count_conversations)
+
+
+async def add_user_message(cid, content):
+    async with conversation_lock(cid):
+        return await _run(storage.add_user_message, cid, content)
+
+
+async def add_assistant_message(cid, s1, s2, s3, vrt=None, question=None):
+    async with conversation_lock(cid):
+        return await _run(storage.add_assistant_message, cid, s1, s2, s3, vrt, question)
+
+
+async def update_conversation_title(cid, title):
+    async with conversation_lock(cid):
+        return await _run(storage.update_conversation_title, cid, title)
+
+
+async def delete_conversation(cid):
+    async with conversation_lock(cid):
+        return await _run(storage.delete_conversation, cid)
@@ -0,0 +1,221 @@
+"""Batch council runs over a JSONL file of questions.
+
+Each input line is a JSON object with a "question" (or "content") and an
+optional "id", or a bare JSON string. Items run as independent council
+turns, without creating conversations, at most `concurrency` at a time.
+Their model calls still pass through the upstream limiter (global and
+per-model concurrency, per-model rate), the response cache and
+single-flight, so repeated questions and identical calls are shared across
+the batch. Results come out as JSON lines in completion order:
+
+    {"id": ..., "question": ..., "status": "ok", "elapsed_s": ...,
+     "stage1": [...], "stage2": [...], "stage3": {...}, "metadata": {...},
+     "aggregate_ranking": {...}, "analytics": {...}}
+
+    python -m backend.batch questions.jsonl -o results.jsonl --concurrency 8
+
+`--upstream-url` points the runs elsewhere (for offline throughput runs, a
+`backend.tests.mock_upstream` started separately); `--resume` skips ids
+already in the output file.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+from . import compute, history, metrics, openrouter, tracing
+from .config import BATCH_CONCURRENCY
+from .council import run_full_council
+from .ratelimit import AdmissionController, UpstreamLimiter
+
+# VRT entries copied into each result's "analytics"
+ANALYTICS_KEYS = ("similarity_matrix", "contradiction_matrix", "consensus_scores", "ranking_agreement",
+                  "input_tokens")
+
+
+def parse_items(lines: Iterable[str]) -> List[Dict[str, str]]:
+    """Items of a JSONL batch; ids default to the 1-based line number. Raises ValueError on bad lines."""
+    items = []
+    seen = set()
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {n}: {e}")
+        if isinstance(data, str):
+            data = {"question": data}
+        question = (data.get("question") or data.get("content")) if isinstance(data, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError(f"line {n}: expected a question")
+        item_id = str(data.get("id", n))
+        if item_id in seen:
+            raise ValueError(f"line {n}: duplicate id {item_id!r}")
+        seen.add(item_id)
+        items.append({"id": item_id, "question": question})
+    return items
+
+
+async def run_item(item: Dict[str, str]) -> Dict[str, Any]:
+    record = {"id": item["id"], "question": item["question"]}
+    start = time.perf_counter()
+    try:
+        with tracing.turn("council.turn", endpoint="batch", item_id=item["id"]) as turn:
+            s1, s2, s3, meta, vrt = await run_full_council(item["question"])
+            record["trace_id"] = turn.trace_id
+    except Exception as e:
+        print(f"Batch item {item['id']} failed: {e}")
+        record.update(status="error", error=str(e), elapsed_s=round(time.perf_counter() - start, 3))
+        return record
+    record["elapsed_s"] = round(time.perf_counter() - start, 3)
+    if not s1:
+        record.update(status="error", error="No responses from Stage 1")
+        return record
+    if not s2:
+        record.update(status="error", error="No rankings from Stage 2")
+        return record
+    if not history.answered(s3):
+        record.update(status="error", error=f"No synthesis from Stage 3: {(s3 or {}).get('response')!r}")
+        return record
+    record.update(
+        status="ok",
+        stage1=s1,
+        stage2=s2,
+        stage3=s3,
+        metadata=meta,
+        aggregate_ranking=vrt.get("aggregate_ranking"),
+        analytics={k: vrt[k] for k in ANALYTICS_KEYS if k in vrt},
+    )
+    return record
+
+
+async def run_batch(items: List[Dict[str, str]], concurrency: int = BATCH_CONCURRENCY,
+                    admission: Optional[AdmissionController] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Results of `items` as they finish, with at most `concurrency` council runs at a time.
+
+    With `admission`, each item also waits for one of its run slots, so the
+    batch counts against the same bound as every other council run.
+    Closing the iterator early cancels the runs still going.
+    """
+    pending = iter(items)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        # Workers share one iterator, so each item is taken exactly once
+        for item in pending:
+            if admission is None:
+                results.put_nowait(await run_item(item))
+                continue
+            await admission.acquire(block=True)
+            try:
+                record = await run_item(item)
+            finally:
+                admission.release()
+            results.put_nowait(record)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(items))))]
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _append(f, line: str):
+    f.write(line)
+    f.flush()
+
+
+def _done_ids(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+    return {f"p{int(q * 100)}": values[min(len(values) - 1, int(q * len(values)))] for q in (0.5, 0.95, 0.99)}
+
+
+async def run_file(input_path: str, output_path: str, concurrency: int = BATCH_CONCURRENCY,
+                   resume: bool = False) -> Dict[str, Any]:
+    """Run a JSONL file of questions, appending each result to `output_path` as it finishes. Returns a summary."""
+    with open(input_path) as f:
+        items = parse_items(f)
+    if resume:
+        done = await asyncio.to_thread(_done_ids, output_path)
+        items = [item for item in items if item["id"] not in done]
+    before = metrics.counters()
+    statuses: Dict[str, int] = {}
+    latencies = []
+    start = time.perf_counter()
+    with open(output_path, "a" if resume else "w") as out:
+        async for record in run_batch(items, concurrency):
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+            if record["status"] == "ok":
+                latencies.append(record["elapsed_s"])
+            await asyncio.to_thread(_append, out, json.dumps(record) + "\n")
+    wall = time.perf_counter() - start
+    after = metrics.counters()
+    return {
+        "items": len(items),
+        "statuses": statuses,
+        "wall_s": round(wall, 3),
+        "throughput_per_min": round(60 * statuses.get("ok", 0) / wall, 2) if wall else None,
+        "latency_s": _percentiles(latencies),
+        "counters": {k: v - before.get(k, 0) for k, v in after.items() if v != before.get(k, 0)},
+    }
+
+
+async def _main(args):
+    if args.upstream_url:
+        openrouter.OPENROUTER_API_URL = args.upstream_url
+    if args.upstream_concurrency is not None or args.model_concurrency is not None or args.model_rpm is not None:
+        limiter = openrouter.limiter or UpstreamLimiter()
+        openrouter.limiter = UpstreamLimiter(
+            max_concurrency=limiter.max_concurrency if args.upstream_concurrency is None else args.upstream_concurrency,
+            model_concurrency=limiter.model_concurrency if args.model_concurrency is None else args.model_concurrency,
+            model_rpm=limiter.model_rate * 60 if args.model_rpm is None else args.model_rpm,
+        )
+    openrouter.init_client()
+    try:
+        summary = await run_file(args.input, args.output, args.concurrency, args.resume)
+    finally:
+        await openrouter.close_client()
+        compute.shutdown()
+        await metrics.flush_async()
+        if tracing.TRACE_EXPORTER != "none":
+            await tracing.flush_async()
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the council over a JSONL file of questions")
+    parser.add_argument("input", help="JSONL file: one question (or {\"id\", \"question\"}) per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results, written as items finish")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="council runs at a time")
+    parser.add_argument("--upstream-concurrency", type=int, help="model calls at a time, all models")
+    parser.add_argument("--model-concurrency", type=int, help="model calls at a time, per model")
+    parser.add_argument("--model-rpm", type=float, help="requests per minute per model (0 = no limit)")
+    parser.add_argument("--resume", action="store_true", help="skip ids already answered in the output file")
+    parser.add_argument("--upstream-url", help="chat completions URL (e.g. a mock_upstream started separately)")
+    asyncio.run(_main(parser.parse_args()))
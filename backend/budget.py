@@ -0,0 +1,113 @@
+"""Input-token budgets for the Stage 2 and Stage 3 prompts.
+
+Both prompts paste every Stage 1 answer (Stage 3 sometimes the ranker
+critiques too), so their size grows with answer length and council size.
+`fit` makes a list of input texts fit a budget of estimated tokens:
+
+1. Nothing changes when everything fits.
+2. Answers nearly identical to an earlier one (per the VRT similarity
+   matrix) are replaced by a one-line note.
+3. The remaining budget is shared out evenly; inputs longer than their
+   share are cut to whole sentences, shorter ones are kept as they are.
+
+Token counts are a local estimate (one token per short word or
+punctuation mark, more for long words), close enough to budget by without
+a model-specific tokenizer.
+"""
+
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import metrics
+from .config import (
+    MODEL_REGISTRY,
+    STAGE_INPUT_BUDGETS,
+    BUDGET_DEDUP_SIMILARITY,
+    BUDGET_OUTPUT_RESERVE,
+    DEFAULT_CONTEXT_WINDOW,
+)
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_SENTENCES = re.compile(r"[^.!?\n]*(?:[.!?]+|\n|$)\s*")
+TRIM_MARK = "\n[... trimmed to fit the prompt budget]"
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(1 + len(piece) // 8 for piece in _PIECES.findall(text or ""))
+
+
+def stage_budget(stage: str, models: Sequence[str]) -> int:
+    """STAGE_INPUT_BUDGETS[stage], capped by the smallest context window among `models`."""
+    contexts = {m["id"]: m.get("context", DEFAULT_CONTEXT_WINDOW) for m in MODEL_REGISTRY}
+    windows = [contexts.get(model, DEFAULT_CONTEXT_WINDOW) - BUDGET_OUTPUT_RESERVE for model in models]
+    return min([STAGE_INPUT_BUDGETS.get(stage, DEFAULT_CONTEXT_WINDOW)] + windows)
+
+
+def trim_text(text: str, max_tokens: int, mark: str = TRIM_MARK) -> str:
+    """Leading whole sentences of `text` within `max_tokens`, followed by `mark`."""
+    room = max_tokens - estimate_tokens(mark)
+    kept = []
+    for sentence in _SENTENCES.findall(text):
+        cost = estimate_tokens(sentence)
+        if cost > room:
+            break
+        kept.append(sentence)
+        room -= cost
+    if not kept:
+        # Not even the first sentence fits: keep its leading words
+        for word in text.split():
+            cost = estimate_tokens(word)
+            if cost > room:
+                break
+            kept.append(word + " ")
+            room -= cost
+    return "".join(kept).rstrip() + mark
+
+
+def fit(texts: Sequence[str], labels: Sequence[str], budget: int, overhead: int = 0,
+        similarity: Optional[List[List[float]]] = None) -> Tuple[List[str], Dict[str, Any]]:
+    """Fit `texts` into `budget` tokens next to `overhead` tokens of fixed prompt.
+
+    `similarity` covers the first len(similarity) texts (the Stage 1
+    answers). Returns the texts to use and a report of what was done.
+    """
+    texts = list(texts)
+    sizes = [estimate_tokens(t) for t in texts]
+    report = {"budget": budget, "original": overhead + sum(sizes), "deduplicated": [], "trimmed": []}
+    if report["original"] <= budget:
+        report["estimated"] = report["original"]
+        return texts, report
+
+    if similarity:
+        for j in range(len(similarity)):
+            for i in range(j):
+                if similarity[i][j] >= BUDGET_DEDUP_SIMILARITY and labels[i] not in report["deduplicated"]:
+                    texts[j] = f"(Nearly identical to {labels[i]}; omitted.)"
+                    sizes[j] = estimate_tokens(texts[j])
+                    report["deduplicated"].append(labels[j])
+                    break
+
+    available = budget - overhead
+    if sum(sizes) > available:
+        # Even share per input; inputs under their share give the rest back
+        order = sorted(range(len(texts)), key=lambda k: sizes[k])
+        for n, k in enumerate(order):
+            share = available // (len(order) - n)
+            if sizes[k] > share:
+                texts[k] = trim_text(texts[k], share)
+                sizes[k] = estimate_tokens(texts[k])
+                report["trimmed"].append(labels[k])
+            available -= sizes[k]
+    report["estimated"] = overhead + sum(sizes)
+    return texts, report
+
+
+def record(stage: str, report: Dict[str, Any]):
+    """Log one stage's prompt size to the metrics sink and counters."""
+    metrics.record({"timestamp": time.time(), "type": "prompt_budget", "stage": stage, **report})
+    metrics.increment(f"{stage}_input_tokens", report["estimated"])
+    if report["deduplicated"]:
+        metrics.increment("prompt_inputs_deduplicated", len(report["deduplicated"]))
+    if report["trimmed"]:
+        metrics.increment("prompt_inputs_trimmed", len(report["trimmed"]))
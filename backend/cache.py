@@ -0,0 +1,145 @@
+"""Response cache for model calls.
+
+Keyed by a hash of the model id and the exact message list. A bounded
+in-memory LRU with TTL sits in front of an optional SQLite tier that
+survives restarts. Stage 1 prompts are deterministic for a given query, so
+a resubmitted question hits here for Stage 1 and, because the later prompts
+are built from those answers, for Stage 2 and 3 as well.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from . import metrics
+from .config import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_DISK_PATH,
+    RESPONSE_CACHE_DISK_MAX_ENTRIES,
+)
+
+
+def cache_key(model: str, messages: List[Dict[str, str]]) -> str:
+    payload = json.dumps([model, messages], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class MemoryTier:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, expires: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (expires or time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskTier:
+    """SQLite-backed tier; blocking, so callers run it off the event loop."""
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL,
+                 disk_path=RESPONSE_CACHE_DISK_PATH, disk_max_entries=RESPONSE_CACHE_DISK_MAX_ENTRIES):
+        self.memory = MemoryTier(max_entries, ttl)
+        self.disk = DiskTier(disk_path, disk_max_entries, ttl) if disk_path else None
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.increment("cache_hits")
+            return value
+        if self.disk is not None:
+            found = await asyncio.to_thread(self.disk.get, key)
+            if found is not None:
+                value, expires = found
+                self.memory.set(key, value, expires)
+                metrics.increment("cache_hits")
+                metrics.increment("cache_disk_hits")
+                return value
+        metrics.increment("cache_misses")
+        return None
+
+    async def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
@@ -0,0 +1,86 @@
+"""CPU-bound post-processing off the event loop.
+
+Tokenizing long answers for the VRT analytics, parsing rankings and
+serializing large SSE payloads are pure CPU work. `run_cpu` sends such
+work to the executor chosen by COMPUTE_EXECUTOR:
+
+- "process": a ProcessPoolExecutor, so the work also escapes the GIL and
+  other streams keep flowing. Functions and arguments must be picklable
+  (module-level functions, plain data).
+- "thread": a thread pool. The loop stays responsive between GIL switches,
+  but Python-heavy work still competes with it.
+- "inline": run on the loop, as before.
+
+Process workers are spawned (not forked, the app has threads running) and
+warm up the analytics vectorizer once when they start.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .config import COMPUTE_EXECUTOR, COMPUTE_WORKERS
+
+EXECUTORS = ("process", "thread", "inline")
+
+_kind = COMPUTE_EXECUTOR
+_executor: Optional[Executor] = None
+
+
+def _init_worker():
+    from . import vrt_analytics
+    vrt_analytics.warm_up()
+
+
+def configure(kind: str = COMPUTE_EXECUTOR, workers: int = COMPUTE_WORKERS):
+    """Switch executor kind; the previous pool is shut down."""
+    global _kind
+    if kind not in EXECUTORS:
+        raise ValueError(f"Unknown compute executor {kind!r}; expected one of {EXECUTORS}")
+    shutdown()
+    _kind = kind
+    _start(workers)
+
+
+def _start(workers: int = COMPUTE_WORKERS) -> Optional[Executor]:
+    global _executor
+    if _executor is None and _kind != "inline":
+        if _kind == "process":
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compute")
+    return _executor
+
+
+def start():
+    """Create the pool and spawn its workers now, rather than on the first request."""
+    executor = _start()
+    if isinstance(executor, ProcessPoolExecutor):
+        for _ in range(COMPUTE_WORKERS):
+            executor.submit(int)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_cpu(fn: Callable[..., Any], *args: Any) -> Any:
+    global _executor
+    executor = _start()
+    if executor is None:
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, functools.partial(fn, *args))
+    except BrokenExecutor as e:
+        # A worker died (or could not start); the next call gets a fresh pool
+        print(f"Compute pool broken ({e!r}), running {fn.__name__} inline")
+        if _executor is executor:
+            _executor = None
+        return fn(*args)
@@ -37,19 +37,163 @@ RANKER_MODELS = [
 
 # Dynamic Agent Pool Registry (Task E)
 MODEL_REGISTRY = [
-    {"id": "deepseek/deepseek-chat", "tags": ["code", "reasoning", "science"], "cost": 1, "trust": 0.9, "latency": 1.0},
-    {"id": "deepseek/deepseek-r1", "tags": ["reasoning", "math", "complex"], "cost": 1, "trust": 0.85, "latency": 1.2},
-    {"id": "qwen/qwen-2.5-7b-instruct", "tags": ["general", "strategy", "creative"], "cost": 0.5, "trust": 0.8, "latency": 0.5},
-    {"id": "meta-llama/llama-3.1-8b-instruct", "tags": ["general", "fast", "chat"], "cost": 0.5, "trust": 0.8, "latency": 0.4},
-    {"id": "meta-llama/llama-3.1-70b-instruct", "tags": ["critic", "nuance", "writing"], "cost": 2, "trust": 0.95, "latency": 1.5},
-    {"id": "mistralai/mistral-nemo", "tags": ["explanation", "summary", "chairman"], "cost": 1, "trust": 0.9, "latency": 0.8},
-    {"id": "mistralai/mistral-small", "tags": ["fast", "efficient"], "cost": 0.3, "trust": 0.7, "latency": 0.3},
-    {"id": "microsoft/phi-3-medium-instruct", "tags": ["reasoning", "math"], "cost": 0.8, "trust": 0.8, "latency": 0.7},
+    {"id": "deepseek/deepseek-chat", "tags": ["code", "reasoning", "science"], "cost": 1, "trust": 0.9, "latency": 1.0, "context": 65536},
+    {"id": "deepseek/deepseek-r1", "tags": ["reasoning", "math", "complex"], "cost": 1, "trust": 0.85, "latency": 1.2, "context": 65536},
+    {"id": "qwen/qwen-2.5-7b-instruct", "tags": ["general", "strategy", "creative"], "cost": 0.5, "trust": 0.8, "latency": 0.5, "context": 32768},
+    {"id": "meta-llama/llama-3.1-8b-instruct", "tags": ["general", "fast", "chat"], "cost": 0.5, "trust": 0.8, "latency": 0.4, "context": 131072},
+    {"id": "meta-llama/llama-3.1-70b-instruct", "tags": ["critic", "nuance", "writing"], "cost": 2, "trust": 0.95, "latency": 1.5, "context": 131072},
+    {"id": "mistralai/mistral-nemo", "tags": ["explanation", "summary", "chairman"], "cost": 1, "trust": 0.9, "latency": 0.8, "context": 131072},
+    {"id": "mistralai/mistral-small", "tags": ["fast", "efficient"], "cost": 0.3, "trust": 0.7, "latency": 0.3, "context": 32768},
+    {"id": "microsoft/phi-3-medium-instruct", "tags": ["reasoning", "math"], "cost": 0.8, "trust": 0.8, "latency": 0.7, "context": 128000},
 ]
 
+# Live model selection: the registry values above are priors, refined by
+# EWMA latency / tokens per second and a discounted success rate from real
+# calls. "thompson" samples success rates to keep exploring; "greedy" always
+# takes the current best. A model is benched for BREAKER_COOLDOWN seconds
+# after BREAKER_FAILURES consecutive failures.
+SELECTOR_POLICY = os.getenv("SELECTOR_POLICY", "thompson")
+SELECTOR_EWMA_ALPHA = float(os.getenv("SELECTOR_EWMA_ALPHA", "0.2"))
+SELECTOR_DECAY = float(os.getenv("SELECTOR_DECAY", "0.95"))
+SELECTOR_PRIOR_WEIGHT = float(os.getenv("SELECTOR_PRIOR_WEIGHT", "5"))
+SELECTOR_PRIOR_LATENCY = float(os.getenv("SELECTOR_PRIOR_LATENCY", "10"))  # seconds per registry latency unit
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "60"))
+
+# Stage scheduling: minimum successful model answers before a stage moves on
+# (None = wait for all), how long to keep waiting for stragglers once the
+# quorum is met, and per-stage deadlines in seconds.
+STAGE_QUORUM = {"stage1": 3, "clcc": None, "stage2": 2}
+STAGE_QUORUM_GRACE = float(os.getenv("STAGE_QUORUM_GRACE", "5"))
+STAGE_DEADLINES = {"stage1": 75.0, "clcc": 75.0, "stage2": 75.0, "stage3": 90.0}
+
+# Prompt budgets in estimated input tokens for the Stage 2 and Stage 3
+# prompts. Over budget, near-duplicate answers (similarity of at least
+# BUDGET_DEDUP_SIMILARITY) are replaced by a note, then the longest inputs are
+# cut down to whole sentences. A model's context window (MODEL_REGISTRY
+# "context" minus BUDGET_OUTPUT_RESERVE) caps the budget as well.
+STAGE_INPUT_BUDGETS = {
+    "stage2": int(os.getenv("STAGE2_INPUT_BUDGET", "6000")),
+    "stage3": int(os.getenv("STAGE3_INPUT_BUDGET", "8000")),
+}
+BUDGET_DEDUP_SIMILARITY = float(os.getenv("BUDGET_DEDUP_SIMILARITY", "0.9"))
+BUDGET_OUTPUT_RESERVE = int(os.getenv("BUDGET_OUTPUT_RESERVE", "2048"))
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# Tail-latency control for model calls. Once a call runs past the model's
+# observed HEDGE_QUANTILE latency, a backup request goes to the closest
+# same-tag model in MODEL_REGISTRY and whichever answers first wins. Each call
+# is also cut off at MODEL_DEADLINE_FACTOR x the model's p99. Until a model
+# has HEDGE_MIN_SAMPLES calls in the last HEDGE_WINDOW seconds, hedging waits
+# HEDGE_DEFAULT_DELAY and only HTTP_TIMEOUT applies.
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_WINDOW = float(os.getenv("HEDGE_WINDOW", "900"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
+MODEL_DEADLINE_FACTOR = float(os.getenv("MODEL_DEADLINE_FACTOR", "3"))
+MODEL_DEADLINE_MIN = float(os.getenv("MODEL_DEADLINE_MIN", "10"))
+
 # Final synthesis model
 CHAIRMAN_MODEL = "mistralai/mistral-nemo"
 
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Shared HTTP client (one pooled client for the lifetime of the app)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Max concurrent requests to a single upstream host (0 = unlimited)
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "32"))
 
 DATA_DIR = "data/conversations"
+
+# Conversation context for follow-up questions: the last HISTORY_TURNS turns
+# are kept (answers cut to HISTORY_ANSWER_TOKENS), older turns as one-line
+# summaries within HISTORY_SUMMARY_TOKENS. The history is stored with the
+# conversation and extended by each new turn.
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", "3"))
+HISTORY_QUESTION_TOKENS = int(os.getenv("HISTORY_QUESTION_TOKENS", "150"))
+HISTORY_ANSWER_TOKENS = int(os.getenv("HISTORY_ANSWER_TOKENS", "400"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "600"))
+HISTORY_SUMMARY_TURN_TOKENS = int(os.getenv("HISTORY_SUMMARY_TURN_TOKENS", "80"))
+
+# Upstream protection: concurrent OpenRouter calls overall and per model, a
+# per-model token bucket (requests per minute, burst), and how long a call may
+# queue for a slot. 429/503 answers are retried up to UPSTREAM_MAX_RETRIES
+# times, honouring Retry-After, else exponential backoff with jitter.
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16"))
+UPSTREAM_MODEL_CONCURRENCY = int(os.getenv("UPSTREAM_MODEL_CONCURRENCY", "4"))
+UPSTREAM_MODEL_RPM = float(os.getenv("UPSTREAM_MODEL_RPM", "20"))  # 0 = no rate limit
+UPSTREAM_MODEL_BURST = float(os.getenv("UPSTREAM_MODEL_BURST", "5"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "30"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "1"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "30"))
+
+# Admission control for council runs: beyond COUNCIL_MAX_CONCURRENT active runs
+# and COUNCIL_MAX_QUEUE waiting ones, requests get 503 with Retry-After.
+COUNCIL_MAX_CONCURRENT = int(os.getenv("COUNCIL_MAX_CONCURRENT", "8"))
+COUNCIL_MAX_QUEUE = int(os.getenv("COUNCIL_MAX_QUEUE", "16"))
+COUNCIL_QUEUE_TIMEOUT = float(os.getenv("COUNCIL_QUEUE_TIMEOUT", "10"))
+ADMISSION_RETRY_AFTER = float(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+
+# Background council jobs (see jobs.py): how many may wait for a council run
+# slot, and how long finished jobs stay available for (re)attaching to their events
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "64"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "900"))
+# Default for the stream endpoint's `background` flag: finish and save a run
+# whose client disconnected instead of cancelling it
+STREAM_BACKGROUND_ON_DISCONNECT = os.getenv("STREAM_BACKGROUND_ON_DISCONNECT", "0") == "1"
+
+# Batch runs (see batch.py): council runs at a time, and the most a request to /api/batch may ask for
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# Conversation storage backend: "json" (one file per conversation) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/council.db")
+# Worker threads for storage I/O from async handlers (0 = run inline on the event loop)
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "4"))
+
+# CPU-bound post-processing (analytics tokenizing, ranking parsing, large SSE
+# payloads): "process" pool, "thread" pool or "inline" on the event loop
+COMPUTE_EXECUTOR = os.getenv("COMPUTE_EXECUTOR", "process")
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", "2"))
+
+# Metrics sink (append-only JSON Lines segments under METRICS_DIR)
+METRICS_DIR = "data/metrics"
+METRICS_SEGMENT_MAX_BYTES = int(os.getenv("METRICS_SEGMENT_MAX_BYTES", str(5 * 1024 * 1024)))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))
+METRICS_MAX_BUFFER = int(os.getenv("METRICS_MAX_BUFFER", "1000"))
+
+# Rolling in-memory aggregates behind /api/metrics/summary
+METRICS_BUCKET_SECONDS = 10
+METRICS_RETENTION_SECONDS = 3600
+METRICS_SKETCH_ACCURACY = 0.01
+
+# Response cache in front of query_model (memory LRU + optional SQLite tier)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_DISK_PATH = os.getenv("RESPONSE_CACHE_DISK_PATH")  # e.g. data/response_cache.db
+RESPONSE_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_ENTRIES", "50000"))
+
+# Semantic near-duplicate cache of whole council results (opt-in)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+
+# Tracing of council turns (see tracing.py). Spans always feed the
+# Server-Timing header; TRACE_EXPORTER also exports them as OTLP/JSON:
+# "file" appends to TRACE_FILE, "otlp" posts to a collector, "none" keeps them in memory only.
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "data/traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "synapse-council")
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "2.0"))
+TRACE_MAX_BUFFER = int(os.getenv("TRACE_MAX_BUFFER", "10000"))
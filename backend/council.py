@@ -1,12 +1,30 @@
 """Three-stage orchestration for Synapse Council."""
 
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Callable
 import uuid
 import asyncio
-import math
+import copy
 from .openrouter import query_models_parallel, query_model
-from .config import COUNCIL_MODELS, CHAIRMAN_MODEL, ROLE_ASSIGNMENTS, RANKER_MODELS, MODEL_REGISTRY
-
+from .config import (
+    COUNCIL_MODELS,
+    CHAIRMAN_MODEL,
+    ROLE_ASSIGNMENTS,
+    RANKER_MODELS,
+    MODEL_REGISTRY,
+    STAGE_QUORUM,
+    STAGE_QUORUM_GRACE,
+    STAGE_DEADLINES,
+)
+from .scheduler import Stage, StageFailed, run_dag, gather_quorum
+from .semantic_cache import semantic_cache
+from .selector import telemetry
+from .singleflight import SingleFlight
+from . import history as conversation_history
+from . import budget, compute, ranking, tracing, vrt_analytics
+
+
+# In-flight council runs by question
+council_flights = SingleFlight("council")
 
 ROLES = {
     "scientist": (
@@ -48,11 +66,14 @@ def select_models_for_query(query: str, k: int = 4) -> Dict[str, str]:
         
     scored_models = []
     for m in MODEL_REGISTRY:
-        # Score = (tag_match_weight * trust) / (cost * sqrt(latency))
+        # Models with an open circuit breaker sit out until their cooldown passes
+        if not telemetry.available(m["id"]):
+            continue
+        # Score = (tag_match_weight * success) / (cost * sqrt(latency)), from live telemetry
         tag_match = sum(1 for t in m["tags"] if t in query_tags)
         weight = 1 + (tag_match * 0.5) # Boost for tag match
         
-        score = (weight * m["trust"]) / (max(0.1, m["cost"]) * math.sqrt(max(0.1, m["latency"])))
+        score = telemetry.score(m["id"], weight)
         scored_models.append((score, m))
         
     # Sort by score desc
@@ -60,6 +81,8 @@ def select_models_for_query(query: str, k: int = 4) -> Dict[str, str]:
     
     # Pick top k
     selected = [m["id"] for _, m in scored_models[:k]]
+    for model in selected:
+        telemetry.begin_trial(model)
     
     # Map to roles (round-robin or best fit)
     # For simplicity, we map top 4 to the 4 roles in order
@@ -69,7 +92,7 @@ def select_models_for_query(query: str, k: int = 4) -> Dict[str, str]:
         if i < len(selected):
             assignments[role] = selected[i]
         else:
-            # Fallback to default if not enough selected (shouldn't happen with k=4)
+            # Fallback to default if not enough selected (e.g. several breakers open)
             assignments[role] = ROLE_ASSIGNMENTS[role]
             
     return assignments
@@ -90,48 +113,67 @@ def create_vrt_node(node_type: str, model: str, role: str, text: str, parent_ids
     }
 
 
-async def stage1_collect_responses(user_query: str):
+async def stage1_collect_responses(user_query: str, on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                   history: Optional[Dict[str, Any]] = None):
+    """Query every role's model in parallel.
+
+    With `on_event`, answers are streamed: each token fragment is reported as a
+    `stage1_delta` event and each finished answer as `stage1_model_complete`,
+    in completion order rather than after the slowest model. Models are
+    chosen for the question itself; a conversation `history` only goes into
+    the prompts.
+    """
     # Dynamic Agent Pool Selection
     assignments = select_models_for_query(user_query)
-    
-    # Query specific models for each role
-    tasks = []
     role_keys = list(assignments.keys())
-    
-    for role in role_keys:
+    nodes_by_role = {}
+    query = conversation_history.contextualize(history, user_query)
+
+    async def ask(role):
         model = assignments[role]
-        prompt = apply_role_prompt(user_query, role)
+        prompt = apply_role_prompt(query, role)
         messages = [{"role": "user", "content": prompt}]
-        tasks.append(query_model(model, messages))
-    
-    responses = await asyncio.gather(*tasks)
-    
-    output = []
-    vrt_nodes = []
-    
-    for role, resp in zip(role_keys, responses):
+        on_delta = None
+        if on_event is not None:
+            on_delta = lambda d: on_event({"type": "stage1_delta", "role": role, "model": model, "delta": d})
+        resp = await query_model(model, messages, on_delta=on_delta, hedge=True, exclude=assignments.values())
         if resp is not None:
             text = resp.get("content", "")
-            node = create_vrt_node("initial_answer", assignments[role], role, text)
+            answered_by = resp.get("model", model)
+            node = create_vrt_node("initial_answer", answered_by, role, text)
+            nodes_by_role[role] = node
+            if on_event is not None:
+                on_event({"type": "stage1_model_complete", "role": role, "model": answered_by,
+                          "data": {"model": answered_by, "role": role, "response": text, "node_id": node["id"]}})
+        elif on_event is not None:
+            on_event({"type": "stage1_model_failed", "role": role, "model": model})
+        return True if resp is not None else None
+
+    # Move on once the quorum has answered (plus a grace period for stragglers)
+    await gather_quorum([ask(role) for role in role_keys], STAGE_QUORUM.get("stage1"), STAGE_QUORUM_GRACE,
+                        STAGE_DEADLINES.get("stage1"))
+
+    # Keep role order so Stage 2 labels (Response A, B, ...) are stable
+    output = []
+    vrt_nodes = []
+    for role in role_keys:
+        node = nodes_by_role.get(role)
+        if node is not None:
             vrt_nodes.append(node)
-            
             output.append({
-                "model": assignments[role],
+                "model": node["model"],
                 "role": role,
-                "response": text,
+                "response": node["text"],
                 "node_id": node["id"]
             })
     return output, vrt_nodes
 
 
-async def stage2_collect_rankings(user_query: str, stage1_results: List[Dict[str, Any]]):
+def _ranking_prompt(user_query: str, stage1_results: List[Dict[str, Any]], texts: List[str]) -> str:
     labels = [chr(65 + i) for i in range(len(stage1_results))]
-    label_to_model = {f"Response {L}": f"{r['role'].title()} ({r['model']})" for L, r in zip(labels, stage1_results)}
-    label_to_node_id = {f"Response {L}": r["node_id"] for L, r in zip(labels, stage1_results)}
+    block = "\n\n".join([f"Response {L} ({r['role'].title()}):\n{t}" for L, r, t in zip(labels, stage1_results, texts)])
 
-    block = "\n\n".join([f"Response {L} ({r['role'].title()}):\n{r['response']}" for L, r in zip(labels, stage1_results)])
-
-    prompt = f"""
+    return f"""
 Evaluate the following responses to the user question.
 
 User Question:
@@ -152,41 +194,83 @@ FINAL RANKING:
 3. Response Z
 """
 
+
+async def fit_inputs(stage: str, models: List[str], texts: List[str], labels: List[str],
+                     build: Callable[[List[str]], str], similarity: Optional[List[List[float]]] = None):
+    """Fit `texts` into the stage's token budget and build the prompt from them.
+
+    Returns (prompt, report); `build` turns a list of input texts into the prompt.
+    """
+    overhead = budget.estimate_tokens(build([""] * len(texts)))
+    fitted, report = await compute.run_cpu(budget.fit, texts, labels, budget.stage_budget(stage, models),
+                                           overhead, similarity)
+    budget.record(stage, report)
+    return build(fitted), report
+
+
+async def stage2_collect_rankings(user_query: str, stage1_results: List[Dict[str, Any]],
+                                  similarity: Optional[List[List[float]]] = None):
+    labels = [chr(65 + i) for i in range(len(stage1_results))]
+    label_to_model = {f"Response {L}": f"{r['role'].title()} ({r['model']})" for L, r in zip(labels, stage1_results)}
+    label_to_node_id = {f"Response {L}": r["node_id"] for L, r in zip(labels, stage1_results)}
+
+    prompt, input_report = await fit_inputs(
+        "stage2", RANKER_MODELS, [r["response"] for r in stage1_results], list(label_to_model),
+        lambda texts: _ranking_prompt(user_query, stage1_results, texts), similarity,
+    )
+
     # Ensemble Ranking: Query multiple ranker models
     messages = [{"role": "user", "content": prompt}]
-    results = await query_models_parallel(RANKER_MODELS, messages)
+    results = await query_models_parallel(RANKER_MODELS, messages, STAGE_QUORUM.get("stage2"), STAGE_QUORUM_GRACE,
+                                          STAGE_DEADLINES.get("stage2"), hedge=True)
     
     final_rankings = []
     vrt_nodes = []
+    answered = [(model, resp) for model, resp in results.items() if resp]
+    parsed_all = await compute.run_cpu(parse_rankings, [resp.get("content", "") for _, resp in answered])
     
     # Collect all rankings
-    for model, resp in results.items():
-        if resp:
-            text = resp.get("content", "")
-            parsed = parse_ranking_from_text(text)
-            
-            # Create a critique/ranking node
-            node = create_vrt_node("ranking", model, "ranker", text, parent_ids=[r["node_id"] for r in stage1_results])
-            vrt_nodes.append(node)
-            
-            final_rankings.append({
-                "model": model,
-                "ranking": text,
-                "parsed_ranking": parsed,
-                "node_id": node["id"]
-            })
-
-    # Aggregate rankings (Simple Borda Count or Average Position)
-    # For now, we just pass the raw rankings to Stage 3, but we could compute a consensus score here.
-    
-    return final_rankings, label_to_model, vrt_nodes
-
-
-async def stage3_synthesize_final(user_query: str, stage1: List, stage2: List):
-    s1 = "\n\n".join([f"{r['role'].title()} ({r['model']}):\n{r['response']}" for r in stage1])
-    s2 = "\n\n".join([f"Ranker ({r['model']}):\n{r['ranking']}" for r in stage2])
-
-    prompt = f"""
+    for (model, resp), parsed in zip(answered, parsed_all):
+        model = resp.get("model", model)
+        text = resp.get("content", "")
+        
+        # Create a critique/ranking node
+        node = create_vrt_node("ranking", model, "ranker", text, parent_ids=[r["node_id"] for r in stage1_results])
+        vrt_nodes.append(node)
+        
+        final_rankings.append({
+            "model": model,
+            "ranking": text,
+            "parsed_ranking": parsed,
+            "node_id": node["id"]
+        })
+
+    # Aggregate rankings into one consensus order (Borda, then Kemeny-Young)
+    aggregate = ranking.aggregate_rankings({r["model"]: r["parsed_ranking"] for r in final_rankings},
+                                           list(label_to_model), label_to_model)
+
+    return final_rankings, label_to_model, aggregate, vrt_nodes, input_report
+
+
+def format_aggregate(aggregate: Dict[str, Any]) -> str:
+    """Compact Stage 2 summary for the chairman: consensus order and agreement."""
+    lines = [
+        f"{e['position']}. {e['label']} ({e['model']}): Borda {e['borda']}, "
+        f"average rank {e['average_rank']:.1f}, first place from {e['first_place_votes']} of {aggregate['rankers']}"
+        for e in aggregate["rankings"]
+    ]
+    if aggregate["mean_tau_to_consensus"] is not None:
+        lines.append("Ranker agreement with this order (mean Kendall tau, -1 to 1): "
+                     f"{aggregate['mean_tau_to_consensus']:.2f}")
+    return "\n".join(lines)
+
+
+def _synthesis_prompt(user_query: str, stage1: List, texts: List[str], s2: str) -> str:
+    labels = [chr(65 + i) for i in range(len(stage1))]
+    s1 = "\n\n".join([f"Response {L} - {r['role'].title()} ({r['model']}):\n{t}"
+                       for L, r, t in zip(labels, stage1, texts)])
+
+    return f"""
 Produce a synthesized final answer based on the council's analysis and ensemble rankings.
 
 User Query:
@@ -201,19 +285,47 @@ STAGE 2 RANKINGS:
 Provide a clear, well-reasoned final synthesis.
 """
 
+
+async def stage3_synthesize_final(user_query: str, stage1: List, stage2: List,
+                                  on_delta: Optional[Callable[[str], None]] = None,
+                                  aggregate: Optional[Dict[str, Any]] = None,
+                                  similarity: Optional[List[List[float]]] = None):
+    n = len(stage1)
+    texts = [r["response"] for r in stage1]
+    labels = [f"Response {chr(65 + i)}" for i in range(n)]
+    if aggregate:
+        # The consensus replaces the full critiques, which grow the prompt with every ranker
+        s2 = format_aggregate(aggregate)
+        build = lambda t: _synthesis_prompt(user_query, stage1, t, s2)
+    else:
+        texts += [r["ranking"] for r in stage2]
+        labels += [f"Ranker ({r['model']})" for r in stage2]
+        build = lambda t: _synthesis_prompt(
+            user_query, stage1, t[:n], "\n\n".join([f"Ranker ({r['model']}):\n{c}" for r, c in zip(stage2, t[n:])])
+        )
+    prompt, input_report = await fit_inputs("stage3", [CHAIRMAN_MODEL], texts, labels, build, similarity)
+
     messages = [{"role": "user", "content": prompt}]
-    resp = await query_model(CHAIRMAN_MODEL, messages)
+    resp = await query_model(CHAIRMAN_MODEL, messages, on_delta=on_delta, hedge=True)
 
     if resp is None:
-        return {"model": CHAIRMAN_MODEL, "response": "Unable to synthesize."}, []
+        return {"model": CHAIRMAN_MODEL, "response": "Unable to synthesize."}, [], input_report
 
     text = resp.get("content", "")
+    model = resp.get("model", CHAIRMAN_MODEL)
     
     # Parent IDs are all Stage 2 ranking nodes
     parent_ids = [r["node_id"] for r in stage2]
-    node = create_vrt_node("synthesis", CHAIRMAN_MODEL, "chairman", text, parent_ids=parent_ids)
+    node = create_vrt_node("synthesis", model, "chairman", text, parent_ids=parent_ids)
     
-    return {"model": CHAIRMAN_MODEL, "response": text}, [node]
+    return {"model": model, "response": text, "node_id": node["id"]}, [node], input_report
+
+
+def stage2_metadata(label_to_model: Dict[str, str], aggregate: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    meta = {"label_to_model": label_to_model}
+    if aggregate:
+        meta["aggregate_rankings"] = aggregate["rankings"]
+    return meta
 
 
 def parse_ranking_from_text(text: str):
@@ -225,6 +337,10 @@ def parse_ranking_from_text(text: str):
     return re.findall(r"Response [A-Z]", text)
 
 
+def parse_rankings(texts: List[str]) -> List[List[str]]:
+    return [parse_ranking_from_text(t) for t in texts]
+
+
 async def run_clcc_flow(user_query: str, stage1_results: List[Dict[str, Any]]):
     """Circular Critique Chain: Each model critiques the previous one."""
     if len(stage1_results) < 2:
@@ -233,6 +349,8 @@ async def run_clcc_flow(user_query: str, stage1_results: List[Dict[str, Any]]):
     tasks = []
     nodes = []
     
+    critic_models = [r["model"] for r in stage1_results]
+
     # Create a cycle: 0->1, 1->2, ..., N->0
     for i in range(len(stage1_results)):
         target = stage1_results[i]
@@ -253,9 +371,9 @@ Response to Critique:
 Provide a constructive critique focusing on logical gaps, accuracy, and alignment with the user's goal.
 """
         messages = [{"role": "user", "content": prompt}]
-        tasks.append(query_model(critic_model, messages))
+        tasks.append(query_model(critic_model, messages, hedge=True, exclude=critic_models))
 
-    responses = await asyncio.gather(*tasks)
+    responses = await gather_quorum(tasks, STAGE_QUORUM.get("clcc"), STAGE_QUORUM_GRACE, STAGE_DEADLINES.get("clcc"))
     
     for i, resp in enumerate(responses):
         if resp:
@@ -263,13 +381,66 @@ Provide a constructive critique focusing on logical gaps, accuracy, and alignmen
             target_node_id = stage1_results[i]["node_id"]
             critic_res = stage1_results[(i + 1) % len(stage1_results)]
             
-            node = create_vrt_node("critique", critic_res["model"], critic_res["role"], text, parent_ids=[target_node_id])
+            node = create_vrt_node("critique", resp.get("model", critic_res["model"]), critic_res["role"], text, parent_ids=[target_node_id])
             nodes.append(node)
             
     return nodes
 
 
-async def run_full_council(user_query: str):
+async def lookup_semantic_cache(user_query: str):
+    """Cached (s1, s2, s3, metadata, vrt) for a near-duplicate question, or None."""
+    if semantic_cache is None:
+        return None
+    # Vectorizing and scoring against the cache is CPU work; keep it off the event loop
+    hit = await asyncio.to_thread(semantic_cache.lookup, user_query)
+    if hit is None:
+        return None
+    result, info = hit
+    s1, s2, final, meta, vrt = copy.deepcopy(result)
+    meta["semantic_cache"] = info
+    return s1, s2, final, meta, vrt
+
+
+async def store_semantic_cache(user_query: str, s1, s2, final, meta, vrt):
+    if semantic_cache is not None and s1:
+        await asyncio.to_thread(semantic_cache.store, user_query, copy.deepcopy((s1, s2, final, meta, vrt)))
+
+
+async def run_full_council(user_query: str, on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+                           history: Optional[Dict[str, Any]] = None):
+    """Run the whole council; `on_event` receives the SSE events of the run as they happen.
+
+    With a conversation `history` (see history.py), every stage prompt shows
+    the question in the context of the earlier turns; models are still
+    selected on the question alone. Concurrent calls for the same question in
+    the same context share one run: later callers attach to it, get the
+    events emitted so far replayed, and receive the same result.
+    """
+    query = conversation_history.contextualize(history, user_query)
+
+    async def run(emit):
+        with tracing.span("council.run", follow_up=query != user_query):
+            return await _run_full_council(user_query, emit, history)
+
+    result = await council_flights.do(query, run, on_event)
+    return copy.deepcopy(result)
+
+
+async def _run_full_council(user_query: str, emit: Callable[[Dict[str, Any]], None],
+                            history: Optional[Dict[str, Any]] = None):
+    # The question as the stage prompts show it, after the conversation so far
+    query = conversation_history.contextualize(history, user_query)
+    # A follow-up's answer only fits its own history, so those skip the semantic cache
+    cacheable = query == user_query
+    cached = await lookup_semantic_cache(user_query) if cacheable else None
+    if cached is not None:
+        tracing.current().set(semantic_cache_hit=True)
+        s1, s2, final, meta, vrt = cached
+        emit({"type": "stage1_complete", "data": s1, "cached": True})
+        emit({"type": "stage2_complete", "data": s2, "metadata": meta})
+        emit({"type": "stage3_complete", "data": final})
+        return cached
+
     # Initialize VRT
     vrt = {
         "question": user_query,
@@ -278,43 +449,68 @@ async def run_full_council(user_query: str):
         "edges": []
     }
     
-    # Stage 1
-    s1, s1_nodes = await stage1_collect_responses(user_query)
-    if not s1:
+    async def stage1(results):
+        emit({"type": "stage1_start"})
+        s1, s1_nodes = await stage1_collect_responses(user_query, on_event=emit, history=history)
+        if not s1:
+            emit({"type": "error", "message": "No responses from Stage 1"})
+            raise StageFailed("no responses from Stage 1")
+        emit({"type": "stage1_complete", "data": s1})
+        return s1, s1_nodes
+
+    async def stage2(results):
+        emit({"type": "stage2_start"})
+        s2, map_, aggregate, s2_nodes, report = await stage2_collect_rankings(query, results["stage1"][0],
+                                                                             similarity(results))
+        emit({"type": "stage2_complete", "data": s2, "metadata": stage2_metadata(map_, aggregate)})
+        return s2, map_, aggregate, s2_nodes, report
+
+    async def stage3(results):
+        emit({"type": "stage3_start"})
+        on_delta = lambda d: emit({"type": "stage3_delta", "model": CHAIRMAN_MODEL, "delta": d})
+        final, s3_nodes, report = await stage3_synthesize_final(
+            query, results["stage1"][0], results["stage2"][0], on_delta=on_delta,
+            aggregate=results["stage2"][2], similarity=similarity(results),
+        )
+        emit({"type": "stage3_complete", "data": final})
+        return final, s3_nodes, report
+
+    def stage3_fallback():
+        final = {"model": CHAIRMAN_MODEL, "response": "Unable to synthesize."}
+        emit({"type": "stage3_complete", "data": final})
+        return final, [], None
+
+    def similarity(results):
+        return (results.get("matrices") or {}).get("similarity_matrix")
+
+    async def matrices(results):
+        try:
+            return await vrt_analytics.analyze_async(results["stage1"][0])
+        except Exception as e:
+            print(f"Matrix computation error: {e}")
+            return {}
+
+    # CLCC and Stage 2 only need Stage 1, so they run side by side; Stage 3
+    # waits on Stage 2 alone. Stage 2 also waits for the matrices, whose
+    # similarities its prompt budget uses; they take milliseconds.
+    results = await run_dag([
+        Stage("stage1", stage1),
+        Stage("matrices", matrices, deps=["stage1"]),
+        Stage("clcc", lambda r: run_clcc_flow(query, r["stage1"][0]), deps=["stage1"]),
+        Stage("stage2", stage2, deps=["stage1", "matrices"]),
+        Stage("stage3", stage3, deps=["stage1", "stage2"], deadline=STAGE_DEADLINES.get("stage3"),
+              fallback=stage3_fallback),
+    ])
+    if "stage1" not in results:
         return [], [], {"response": "No responses."}, {}, vrt
 
+    s1, s1_nodes = results["stage1"]
     vrt["nodes"].extend(s1_nodes)
     vrt["models_used"].extend([n["model"] for n in s1_nodes])
+    vrt.update(results.get("matrices") or {})
 
-    # Compute Matrices (Task C)
-    try:
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        from sklearn.metrics.pairwise import cosine_similarity
-        
-        texts = [r["response"] for r in s1]
-        if len(texts) > 1:
-            vec = TfidfVectorizer()
-            tfidf = vec.fit_transform(texts)
-            sim_matrix = cosine_similarity(tfidf)
-            
-            # Contradiction = 1 - Similarity
-            contra_matrix = 1 - sim_matrix
-            
-            vrt["similarity_matrix"] = sim_matrix.tolist()
-            vrt["contradiction_matrix"] = contra_matrix.tolist()
-            
-            # Simple consensus score: average similarity to others
-            consensus_scores = sim_matrix.mean(axis=1).tolist()
-            vrt["consensus_scores"] = {r["model"]: s for r, s in zip(s1, consensus_scores)}
-    except ImportError:
-        print("scikit-learn not installed, skipping matrices")
-    except Exception as e:
-        print(f"Matrix computation error: {e}")
-
-    # Optional: Circular Critique Chain (CLCC) (Task D)
-    # For now, we'll run it if explicitly requested or just as a demonstration step
-    # Let's add a simple CLCC flow here
-    clcc_nodes = await run_clcc_flow(user_query, s1)
+    # Circular Critique Chain (CLCC) (Task D)
+    clcc_nodes = results.get("clcc") or []
     if clcc_nodes:
         vrt["nodes"].extend(clcc_nodes)
         # Add edges for CLCC
@@ -327,12 +523,16 @@ async def run_full_council(user_query: str):
                 })
 
     # Stage 2
-    s2, map_, s2_nodes = await stage2_collect_rankings(user_query, s1)
+    s2, map_, aggregate, s2_nodes, s2_report = results.get("stage2", ([], {}, None, [], None))
     vrt["nodes"].extend(s2_nodes)
+    if aggregate:
+        vrt["aggregate_ranking"] = aggregate
+    agreement = vrt_analytics.ranking_agreement(s2)
+    if agreement:
+        vrt["ranking_agreement"] = agreement
     vrt["models_used"].extend([n["model"] for n in s2_nodes if n["model"] not in vrt["models_used"]])
     
-    # Create edges from Stage 1 (or CLCC) to Stage 2
-    # If CLCC ran, Stage 2 should ideally look at critiques too, but for now it looks at Stage 1
+    # Create edges from Stage 1 to Stage 2
     for r_node in s2_nodes:
         for p_id in r_node["parent_ids"]:
             vrt["edges"].append({
@@ -342,7 +542,11 @@ async def run_full_council(user_query: str):
             })
 
     # Stage 3
-    final, s3_nodes = await stage3_synthesize_final(user_query, s1, s2)
+    final, s3_nodes, s3_report = results.get("stage3", ({"model": CHAIRMAN_MODEL, "response": "Unable to synthesize."},
+                                                        [], None))
+    input_tokens = {stage: r for stage, r in (("stage2", s2_report), ("stage3", s3_report)) if r}
+    if input_tokens:
+        vrt["input_tokens"] = input_tokens
     vrt["nodes"].extend(s3_nodes)
     
     # Create edges from Stage 2 to Stage 3
@@ -356,4 +560,7 @@ async def run_full_council(user_query: str):
             
     vrt["final_choice"] = final
 
-    return s1, s2, final, {"label_to_model": map_}, vrt
+    meta = stage2_metadata(map_, aggregate)
+    if cacheable:
+        await store_semantic_cache(user_query, s1, s2, final, meta, vrt)
+    return s1, s2, final, meta, vrt
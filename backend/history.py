@@ -0,0 +1,123 @@
+"""Compact conversation history for follow-up questions.
+
+A conversation's history is a small dict stored next to its messages:
+
+    {"turns": [{"question": ..., "answer": ...}, ...],   # last HISTORY_TURNS
+     "summary": ["Q: ... A: ...", ...],                  # older turns, oldest first
+     "turn_count": 7}
+
+`extend` adds one finished turn. Answers are clipped once, when the turn is
+recorded, and a turn leaving the window is summarized into one line that is
+kept from then on; nothing is recomputed from the stored messages per
+request. `from_messages` builds the same structure for conversations stored
+before histories existed; storage does that once and keeps the result. Turns
+the council failed to answer are left out.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from .budget import estimate_tokens, trim_text
+from .config import (
+    HISTORY_TURNS,
+    HISTORY_QUESTION_TOKENS,
+    HISTORY_ANSWER_TOKENS,
+    HISTORY_SUMMARY_TOKENS,
+    HISTORY_SUMMARY_TURN_TOKENS,
+)
+
+
+# Stage 3 "answers" of turns where the council failed (see council.py)
+FAILED_ANSWERS = ("Unable to synthesize.", "No responses.")
+
+
+def answered(stage3: Optional[Dict[str, Any]]) -> bool:
+    """Whether a turn's Stage 3 result is a real answer rather than a failure placeholder."""
+    response = ((stage3 or {}).get("response") or "").strip()
+    return bool(response) and response not in FAILED_ANSWERS
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    text = (text or "").strip()
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return trim_text(text, max_tokens, " ...")
+
+
+def summarize_turn(turn: Dict[str, str]) -> str:
+    """One line for a turn that left the window: its question and the start of the answer."""
+    third = HISTORY_SUMMARY_TURN_TOKENS // 3
+    question = _clip(turn["question"], third).replace("\n", " ")
+    answer = _clip(turn["answer"], HISTORY_SUMMARY_TURN_TOKENS - third).replace("\n", " ")
+    return f"Q: {question} A: {answer}"
+
+
+def extend(history: Optional[Dict[str, Any]], question: str, answer: str) -> Dict[str, Any]:
+    """`history` with one more turn; the input is left unchanged."""
+    history = history or {}
+    turns = list(history.get("turns", []))
+    summary = list(history.get("summary", []))
+    turns.append({"question": _clip(question, HISTORY_QUESTION_TOKENS),
+                  "answer": _clip(answer, HISTORY_ANSWER_TOKENS)})
+    while len(turns) > HISTORY_TURNS:
+        summary.append(summarize_turn(turns.pop(0)))
+    while summary and sum(estimate_tokens(line) for line in summary) > HISTORY_SUMMARY_TOKENS:
+        summary.pop(0)
+    return {"turns": turns, "summary": summary, "turn_count": history.get("turn_count", 0) + 1}
+
+
+def from_messages(messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """History of stored messages: each user message with the synthesis that followed it.
+
+    Walks back from the newest turn and clips only what the window and the
+    summary budget keep; older turns are just counted.
+    """
+    turns, summary = [], []
+    summary_tokens = 0
+    count = 0
+    answer = None
+    for msg in reversed(messages):
+        if msg.get("role") == "assistant":
+            answer = msg
+        elif msg.get("role") == "user" and answer is not None:
+            if answered(answer.get("stage3")):
+                count += 1
+                if len(turns) < HISTORY_TURNS:
+                    turns.append({"question": _clip(msg.get("content", ""), HISTORY_QUESTION_TOKENS),
+                                  "answer": _clip(answer["stage3"]["response"], HISTORY_ANSWER_TOKENS)})
+                elif summary_tokens <= HISTORY_SUMMARY_TOKENS:
+                    line = summarize_turn({"question": _clip(msg.get("content", ""), HISTORY_QUESTION_TOKENS),
+                                           "answer": _clip(answer["stage3"]["response"], HISTORY_ANSWER_TOKENS)})
+                    summary_tokens += estimate_tokens(line)
+                    if summary_tokens <= HISTORY_SUMMARY_TOKENS:
+                        summary.append(line)
+            answer = None
+    if not count:
+        return None
+    return {"turns": turns[::-1], "summary": summary[::-1], "turn_count": count}
+
+
+def of(convo: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The stored history of a loaded conversation, built from its messages if it was stored without one."""
+    if "history" in convo:
+        return convo["history"]
+    return from_messages(convo.get("messages", []))
+
+
+def render(history: Optional[Dict[str, Any]]) -> str:
+    if not history or not history.get("turns"):
+        return ""
+    parts = []
+    if history.get("summary"):
+        parts.append("Earlier in this conversation:\n" + "\n".join(f"- {line}" for line in history["summary"]))
+    parts.append("Recent turns:\n" + "\n\n".join(
+        f"User: {t['question']}\nCouncil: {t['answer']}" for t in history["turns"]
+    ))
+    return "\n\n".join(parts)
+
+
+def contextualize(history: Optional[Dict[str, Any]], question: str) -> str:
+    """`question` with the conversation so far in front of it (unchanged without history)."""
+    context = render(history)
+    if not context:
+        return question
+    return f"Conversation so far:\n{context}\n\nCurrent question:\n{question}"
@@ -0,0 +1,216 @@
+"""Background council runs with resumable event streams.
+
+A job is one council turn run in-process, independent of the request that
+submitted it. Jobs wait in a bounded queue for a slot from the same
+AdmissionController that interactive turns use, so COUNCIL_MAX_CONCURRENT
+bounds every council run, whichever way it was started. Everything the run emits is
+kept on the job as numbered SSE frames, so any number of clients can
+attach to it, detach, and resume from the last frame they saw (the SSE
+`Last-Event-ID`). Finished jobs stay available for JOB_RETENTION_SECONDS.
+
+Token deltas are only kept until the frame carrying the whole text they
+add up to is published (or the job ends); a client resuming past them gets
+that frame instead, so a job holds its results, not one frame per token.
+
+Jobs live in memory only: a restart loses queued and running jobs (their
+user messages are already stored).
+"""
+
+import asyncio
+import bisect
+import time
+import uuid
+from operator import itemgetter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from . import metrics
+from .config import JOB_MAX_QUEUE, JOB_RETENTION_SECONDS, ADMISSION_RETRY_AFTER
+from .ratelimit import AdmissionController, Overloaded
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class Job:
+    def __init__(self, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # (event id, SSE frame, delta stream) in emission order; ids count every frame ever published
+        self._events: List[Tuple[int, str, Optional[str]]] = []
+        self.last_event_id = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def frames(self) -> List[str]:
+        """Frames a client attaching now would replay."""
+        return [frame for _, frame, _ in self._events]
+
+    def publish(self, frame: str, stream: Optional[str] = None, completes: Optional[str] = None):
+        """Add the next frame.
+
+        `stream` marks a token delta of that stream; `completes` marks the
+        frame holding a stream's whole text, which replaces its deltas.
+        """
+        if completes is not None:
+            self._drop(lambda s: s == completes)
+        self.last_event_id += 1
+        self._events.append((self.last_event_id, frame, stream))
+        self._wake()
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        # Deltas of streams that never completed (failed models) are of no use to a late client
+        self._drop(lambda s: s is not None)
+        self._wake()
+
+    def _drop(self, match: Callable[[Optional[str]], bool]):
+        self._events = [e for e in self._events if e[2] is None or not match(e[2])]
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Tuple[int, str]]:
+        """(event id, frame) for every frame after event id `after`, live until the job finishes."""
+        position = max(0, after)
+        while True:
+            # Look the position up each time: dropped deltas shift the buffer
+            i = bisect.bisect_right(self._events, position, key=itemgetter(0))
+            if i < len(self._events):
+                position, frame, _ = self._events[i]
+                yield position, frame
+                continue
+            if self.finished:
+                return
+            await self._changed.wait()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "conversation_id": self.params.get("cid"),
+            "status": self.status,
+            "error": self.error,
+            "events": self.last_event_id,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Runs `run(job)` for submitted jobs as `admission` frees run slots; at most `max_queue` wait."""
+
+    def __init__(self, run: Callable[[Job], Awaitable[Any]], admission: AdmissionController,
+                 max_queue: int = JOB_MAX_QUEUE, retention: float = JOB_RETENTION_SECONDS,
+                 retry_after: float = ADMISSION_RETRY_AFTER):
+        self.run = run
+        self.admission = admission
+        self.max_queue = max_queue
+        self.retention = retention
+        self.retry_after = retry_after
+        self.jobs: Dict[str, Job] = {}
+        self._loop = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _bind(self):
+        # The dispatcher belongs to one event loop; a new loop (tests, scripts) gets a fresh one
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._tasks = set()
+            self._spawn(self._dispatch())
+            self.jobs = {}
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def start(self):
+        self._bind()
+
+    async def stop(self):
+        tasks, self._tasks = list(self._tasks), set()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self.jobs.values():
+            if not job.finished:
+                job.finish(CANCELLED, "server shutting down")
+        self._loop = None
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def attach(self, job: Job, run: Callable[[Job], Awaitable[Any]]) -> asyncio.Task:
+        """Start `run(job)` right away; the job is tracked like any other.
+
+        For runs that already hold a slot from `admission` (the streaming
+        endpoint), so clients can re-attach to them; `run` releases it.
+        Cancel the returned task to stop the run.
+        """
+        self._bind()
+        self._prune()
+        self.jobs[job.id] = job
+        return asyncio.get_running_loop().create_task(self._execute(job, run))
+
+    def submit(self, **params) -> Job:
+        """Queue a job, or raise Overloaded when `max_queue` jobs are already waiting."""
+        self._bind()
+        self._prune()
+        if self._queue.qsize() >= self.max_queue:
+            metrics.increment("jobs_rejected")
+            raise Overloaded(self.retry_after)
+        job = Job(params)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        metrics.increment("jobs_submitted")
+        return job
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    async def _dispatch(self):
+        # One job at a time takes the next free run slot, in submission order
+        while True:
+            job = await self._queue.get()
+            await self.admission.acquire(block=True)
+            self._spawn(self._run_admitted(job))
+
+    async def _run_admitted(self, job: Job):
+        try:
+            await self._execute(job, self.run)
+        finally:
+            self.admission.release()
+
+    async def _execute(self, job: Job, run: Callable[[Job], Awaitable[Any]]):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            await run(job)
+        except asyncio.CancelledError:
+            job.finish(CANCELLED, "cancelled")
+            if asyncio.current_task().cancelling():
+                raise
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            metrics.increment("jobs_failed")
+            job.finish(FAILED, str(e))
+        else:
+            metrics.increment("jobs_completed")
+            job.finish(DONE)
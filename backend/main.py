@@ -1,14 +1,20 @@
 """FastAPI backend for Synapse Council."""
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uuid
 import asyncio
 import json
-from fastapi.responses import StreamingResponse
+import math
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from . import storage
+from typing import Optional, Tuple
+
+from . import async_storage, batch, compute, openrouter, metrics, tracing, vrt_analytics
+from .jobs import Job, JobQueue
+from . import history as conversation_history
 from .council import (
     run_full_council,
     stage1_collect_responses,
@@ -16,9 +22,33 @@ from .council import (
     stage3_synthesize_final,
     parse_ranking_from_text
 )
-
-
-app = FastAPI(title="Synapse Council API")
+from .vrt import compact_vrt, sse_frame, vrt_complete_frame
+from .selector import telemetry
+from .ratelimit import AdmissionController, Overloaded
+from .config import STREAM_BACKGROUND_ON_DISCONNECT, BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    openrouter.init_client()
+    await metrics.start()
+    await tracing.start_exporter()
+    # Pay the scikit-learn import/setup cost before the first request does
+    await asyncio.to_thread(vrt_analytics.warm_up)
+    # Corpus IDF from the answers already stored, before any new turn adds to it
+    seeded = await async_storage.run(vrt_analytics.seed_corpus)
+    print(f"Analytics corpus seeded with {seeded} stored answers")
+    compute.start()
+    jobs.start()
+    yield
+    await jobs.stop()
+    compute.shutdown()
+    await openrouter.close_client()
+    await tracing.stop_exporter()
+    await metrics.stop()
+
+
+app = FastAPI(title="Synapse Council API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,79 +61,218 @@ app.add_middleware(
 class SendMessage(BaseModel):
     content: str
 
+
+# Caps concurrent council runs; see COUNCIL_MAX_CONCURRENT
+admission = AdmissionController()
+
+
+async def _admit():
+    """Take a council run slot, or answer 503 with Retry-After when saturated."""
+    try:
+        with tracing.span("admission.wait"):
+            await admission.acquire()
+    except Overloaded as e:
+        metrics.increment("admission_rejected")
+        raise HTTPException(503, str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+
+def _run_reporting(coro, events: asyncio.Queue) -> asyncio.Task:
+    """Run `coro` as a task that pushes a None sentinel onto `events` when it ends."""
+    async def run():
+        try:
+            return await coro
+        finally:
+            events.put_nowait(None)
+    return asyncio.create_task(run())
+
+
+# Events carrying whole stage results; serialized on the compute pool
+_LARGE_EVENTS = {"stage1_complete", "stage2_complete", "stage3_complete"}
+
+
+async def _drain(events: asyncio.Queue):
+    """(event, SSE frame) for queued events, up to the sentinel from `_run_reporting`."""
+    first_token = True
+    while (event := await events.get()) is not None:
+        kind = event.get("type")
+        if kind in _LARGE_EVENTS:
+            with tracing.span("serialize.sse_frame", event=kind):
+                frame = await compute.run_cpu(sse_frame, event)
+            yield event, frame
+        else:
+            if kind == "stage3_delta" and first_token:
+                tracing.current().event("first_token")
+                first_token = False
+            yield event, sse_frame(event)
+
+_COMPLETE = {"type": "complete"}
+_COMPLETE_FRAME = sse_frame(_COMPLETE)
+
+
+def _delta_stream(event) -> Tuple[Optional[str], Optional[str]]:
+    """(stream the event is a token delta of, stream whose whole text it carries) for `Job.publish`."""
+    kind = event.get("type")
+    if kind == "stage1_delta":
+        return f"stage1:{event['role']}", None
+    if kind in ("stage1_model_complete", "stage1_model_failed"):
+        return None, f"stage1:{event['role']}"
+    if kind == "stage3_delta":
+        return "stage3", None
+    if kind == "stage3_complete":
+        return None, "stage3"
+    return None, None
+
+
+async def _turn_frames(cid: str, content: str, convo):
+    """(event, SSE frame) of one council turn; the answer is saved before the final frames."""
+    # Stage events are forwarded while the council runs; identical
+    # questions in flight share one run and the same event stream
+    events = asyncio.Queue()
+    council = _run_reporting(
+        run_full_council(content, on_event=events.put_nowait, history=conversation_history.of(convo)),
+        events,
+    )
+    try:
+        async for pair in _drain(events):
+            yield pair
+        s1, s2, s3, meta, vrt = await council
+    finally:
+        # Left early (cancelled): stop the run and the model calls it still has in flight
+        council.cancel()
+    if not s1:
+        return
+
+    # Save to storage with VRT
+    await async_storage.add_assistant_message(cid, s1, s2, s3, vrt, question=content)
+
+    # The client already holds the stage texts; send nodes by reference
+    with tracing.span("serialize.vrt_complete_frame"):
+        frame = await compute.run_cpu(vrt_complete_frame, vrt, {"stage1": s1, "stage2": s2, "stage3": s3})
+    yield {"type": "vrt_complete"}, frame
+    yield _COMPLETE, _COMPLETE_FRAME
+
+
+async def _publish_turn(job: Job, cid: str, content: str, convo):
+    """Run one council turn, publishing its SSE frames to `job`."""
+    last = None
+    try:
+        async for event, frame in _turn_frames(cid, content, convo):
+            job.publish(frame, *_delta_stream(event))
+            last = event
+    except Exception as e:
+        print(f"Council run error: {e}")
+        job.publish(sse_frame({"type": "error", "message": str(e)}))
+        raise
+    if last is not _COMPLETE:
+        raise RuntimeError("No answer from the council")
+
+
 @app.post("/api/conversations/stream")
-async def send_message_stream(cid: str, req: SendMessage):
-    convo = storage.get_conversation(cid)
+async def send_message_stream(cid: str, req: SendMessage, request: Request,
+                              background: bool = STREAM_BACKGROUND_ON_DISCONNECT):
+    """Run a council turn and stream its events.
+
+    If the client disconnects, the run and its in-flight model calls are
+    cancelled. With `background`, the run finishes and is saved anyway, and
+    stays attachable at /api/jobs/{X-Job-Id}/events.
+    """
+    # The turn's span ends with the run, not with this handler
+    turn = tracing.start("council.turn", request.headers.get("traceparent"), conversation_id=cid, endpoint="stream")
+    with tracing.activate(turn, end_on_error=True):
+        convo = await async_storage.get_conversation(cid)
+        if not convo:
+            raise HTTPException(404)
+
+        await _admit()
+        try:
+            await async_storage.add_user_message(cid, req.content)
+        except BaseException:
+            admission.release()
+            raise
+
+    async def run(job):
+        try:
+            with tracing.activate(turn, end_on_error=True):
+                await _publish_turn(job, cid, req.content, convo)
+        finally:
+            admission.release()
+            turn.end()
+
+    job = Job({"cid": cid, "content": req.content})
+    task = jobs.attach(job, run)
+
+    async def event_generator():
+        try:
+            async for event_id, frame in job.follow():
+                yield f"id: {event_id}\n{frame}"
+        finally:
+            if not job.finished:
+                # The client went away (Starlette cancels the stream on disconnect)
+                metrics.increment("stream_disconnects")
+                if background:
+                    turn.set(detached=True)
+                else:
+                    task.cancel()
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream",
+                             headers={"X-Trace-Id": turn.trace_id, "X-Job-Id": job.id})
+
+
+async def _run_job(job: Job):
+    """A council turn submitted as a job; its frames go to the job's event buffer."""
+    cid, content = job.params["cid"], job.params["content"]
+    with tracing.turn("council.turn", job.params.get("traceparent"), conversation_id=cid, endpoint="job",
+                      job_id=job.id):
+        convo = await async_storage.get_conversation(cid)
+        await _publish_turn(job, cid, content, convo or {})
+
+
+# Background council runs; they take run slots from the same admission control
+jobs = JobQueue(_run_job, admission)
+
+
+@app.post("/api/conversations/{cid}/jobs", status_code=202)
+async def submit_job(cid: str, req: SendMessage, request: Request):
+    """Run a council turn in the background; follow it at /api/jobs/{id}/events."""
+    convo = await async_storage.get_conversation(cid)
     if not convo:
         raise HTTPException(404)
+    try:
+        job = jobs.submit(cid=cid, content=req.content, traceparent=request.headers.get("traceparent"))
+    except Overloaded as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    # Takes the conversation lock before the worker can start, so the question is stored first
+    await async_storage.add_user_message(cid, req.content)
+    return {**job.summary(), "events_url": f"/api/jobs/{job.id}/events"}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404)
+    return job.summary()
+
 
-    storage.add_user_message(cid, req.content)
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(
+    job_id: str,
+    last_event_id: Optional[str] = Header(None),
+    after: Optional[int] = Query(None, ge=0),
+):
+    """The job's SSE frames after `Last-Event-ID` (or `after`), then live ones until it finishes.
+
+    Disconnecting only stops this stream; the job keeps running.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404)
+    if after is None:
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
 
     async def event_generator():
-        try:
-            # Stage 1
-            yield f"data: {json.dumps({'type': 'stage1_start'})}\n\n"
-            s1, s1_nodes = await stage1_collect_responses(req.content)
-            if not s1:
-                 yield f"data: {json.dumps({'type': 'error', 'message': 'No responses from Stage 1'})}\n\n"
-                 return
-            yield f"data: {json.dumps({'type': 'stage1_complete', 'data': s1})}\n\n"
-
-            # Stage 2
-            yield f"data: {json.dumps({'type': 'stage2_start'})}\n\n"
-            s2, map_, s2_nodes = await stage2_collect_rankings(req.content, s1)
-            yield f"data: {json.dumps({'type': 'stage2_complete', 'data': s2, 'metadata': {'label_to_model': map_}})}\n\n"
-
-            # Stage 3
-            yield f"data: {json.dumps({'type': 'stage3_start'})}\n\n"
-            s3, s3_nodes = await stage3_synthesize_final(req.content, s1, s2)
-            yield f"data: {json.dumps({'type': 'stage3_complete', 'data': s3})}\n\n"
-
-            # Build VRT
-            vrt = {
-                "question": req.content,
-                "models_used": list(set([n["model"] for n in s1_nodes + s2_nodes + s3_nodes])),
-                "nodes": s1_nodes + s2_nodes + s3_nodes,
-                "edges": []
-            }
-            
-            # Create edges
-            for r_node in s2_nodes:
-                for p_id in r_node.get("parent_ids", []):
-                    vrt["edges"].append({"from": p_id, "to": r_node["id"], "relation": "critiques"})
-            
-            for s_node in s3_nodes:
-                for p_id in s_node.get("parent_ids", []):
-                    vrt["edges"].append({"from": p_id, "to": s_node["id"], "relation": "informs"})
-            
-            # Add matrices
-            try:
-                from sklearn.feature_extraction.text import TfidfVectorizer
-                from sklearn.metrics.pairwise import cosine_similarity
-                
-                texts = [r["response"] for r in s1]
-                if len(texts) > 1:
-                    vec = TfidfVectorizer()
-                    tfidf = vec.fit_transform(texts)
-                    sim_matrix = cosine_similarity(tfidf)
-                    contra_matrix = 1 - sim_matrix
-                    
-                    vrt["similarity_matrix"] = sim_matrix.tolist()
-                    vrt["contradiction_matrix"] = contra_matrix.tolist()
-                    consensus_scores = sim_matrix.mean(axis=1).tolist()
-                    vrt["consensus_scores"] = {r["model"]: s for r, s in zip(s1, consensus_scores)}
-            except Exception as e:
-                print(f"Matrix computation error: {e}")
-
-            # Save to storage with VRT
-            storage.add_assistant_message(cid, s1, s2, s3, vrt)
-            
-            yield f"data: {json.dumps({'type': 'vrt_complete', 'vrt': vrt})}\n\n"
-            yield f"data: {json.dumps({'type': 'complete'})}\n\n"
-
-        except Exception as e:
-            print(f"Streaming error: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        async for event_id, frame in job.follow(after):
+            yield f"id: {event_id}\n{frame}"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -111,28 +280,49 @@ async def send_message_stream(cid: str, req: SendMessage):
 @app.post("/api/conversations")
 async def create_conversation():
     cid = str(uuid.uuid4())
-    return storage.create_conversation(cid)
+    return await async_storage.create_conversation(cid)
 
 
 @app.get("/api/conversations")
-async def list_conversations():
-    return storage.list_conversations()
+async def list_conversations(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    sort: str = Query("created_at", pattern="^(created_at|title|message_count)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+):
+    response.headers["X-Total-Count"] = str(await async_storage.count_conversations())
+    return await async_storage.list_conversations(offset, limit, sort, order == "desc")
 
 
 @app.get("/api/conversations/{cid}")
-async def get_conversation(cid: str):
-    data = storage.get_conversation(cid)
+async def get_conversation(
+    cid: str,
+    before: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    include_vrt: bool = False,
+):
+    """Conversation with a page of messages; VRTs are left out unless include_vrt is set."""
+    data = await async_storage.get_messages(cid, before, limit, include_vrt)
     if not data:
         raise HTTPException(404)
     return data
 
 
+@app.get("/api/conversations/{cid}/messages/{idx}/vrt")
+async def get_message_vrt(cid: str, idx: int):
+    vrt = await async_storage.get_message_vrt(cid, idx)
+    if not vrt:
+        raise HTTPException(404)
+    return vrt
+
+
 class UpdateConversation(BaseModel):
     title: str
 
 @app.patch("/api/conversations/{cid}")
 async def update_conversation(cid: str, req: UpdateConversation):
-    data = storage.update_conversation_title(cid, req.title)
+    data = await async_storage.update_conversation_title(cid, req.title)
     if not data:
         raise HTTPException(404)
     return data
@@ -140,31 +330,83 @@ async def update_conversation(cid: str, req: UpdateConversation):
 
 @app.delete("/api/conversations/{cid}")
 async def delete_conversation(cid: str):
-    success = storage.delete_conversation(cid)
+    success = await async_storage.delete_conversation(cid)
     if not success:
         raise HTTPException(404)
     return {"success": True}
 
 
 @app.post("/api/conversations/{cid}/message")
-async def send_message(cid: str, req: SendMessage):
-    convo = storage.get_conversation(cid)
-    if not convo:
-        raise HTTPException(404)
+async def send_message(cid: str, req: SendMessage, request: Request):
+    with tracing.turn("council.turn", request.headers.get("traceparent"), conversation_id=cid,
+                      endpoint="message") as turn:
+        convo = await async_storage.get_conversation(cid)
+        if not convo:
+            raise HTTPException(404)
+
+        await _admit()
+        try:
+            await async_storage.add_user_message(cid, req.content)
+            s1, s2, s3, meta, vrt = await run_full_council(req.content, history=conversation_history.of(convo))
+        finally:
+            admission.release()
+
+        await async_storage.add_assistant_message(cid, s1, s2, s3, vrt, question=req.content)
+
+        with tracing.span("serialize.response"):
+            vrt = compact_vrt(vrt, {"stage1": s1, "stage2": s2, "stage3": s3})
+            response = JSONResponse({"stage1": s1, "stage2": s2, "stage3": s3, "metadata": meta, "vrt": vrt})
+    response.headers["Server-Timing"] = tracing.server_timing(turn)
+    response.headers["X-Trace-Id"] = turn.trace_id
+    return response
+
+
+@app.post("/api/batch")
+async def run_batch(request: Request,
+                    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY)):
+    """Run the council over a JSONL body of questions; streams one JSON result line per item as it finishes.
+
+    Each item takes a council run slot like any other turn, so a batch waits
+    for capacity rather than adding to it. No conversations are created.
+    Disconnecting cancels the items still running.
+    """
+    body = (await request.body()).decode("utf-8", errors="replace")
+    try:
+        items = batch.parse_items(body.splitlines())
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    async def lines():
+        async for record in batch.run_batch(items, concurrency, admission):
+            yield json.dumps(record) + "\n"
 
-    storage.add_user_message(cid, req.content)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-    s1, s2, s3, meta, vrt = await run_full_council(req.content)
 
-    storage.add_assistant_message(cid, s1, s2, s3, vrt)
+@app.get("/api/metrics")
+async def get_metrics(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    since: Optional[float] = None,
+):
+    """Stream metric entries as a JSON array, paged over the on-disk segments."""
+    await metrics.flush_async()
+    return StreamingResponse(metrics.stream_json_array(offset, limit, since), media_type="application/json")
 
-    return {"stage1": s1, "stage2": s2, "stage3": s3, "metadata": meta, "vrt": vrt}
 
 
-@app.get("/api/metrics")
-async def get_metrics():
+@app.get("/api/metrics/summary")
+async def get_metrics_summary(window: str = "5m"):
     try:
-        with open("data/metrics.json", "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+        seconds = metrics.parse_window(window)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    seconds = min(seconds, metrics.aggregator.retention)
+    summary = metrics.aggregator.summary(seconds)
+    summary["counters"] = metrics.counters()
+    return summary
+
+
+@app.get("/api/models")
+async def get_model_telemetry():
+    return telemetry.snapshot()
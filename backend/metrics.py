@@ -0,0 +1,383 @@
+"""Buffered, append-only metrics sink.
+
+Entries are queued in memory by `record` and written in batches, off the
+event loop, to JSON Lines segments in METRICS_DIR. Segments roll over once
+they reach METRICS_SEGMENT_MAX_BYTES, so a write never touches old history.
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import (
+    METRICS_DIR,
+    METRICS_SEGMENT_MAX_BYTES,
+    METRICS_FLUSH_INTERVAL,
+    METRICS_MAX_BUFFER,
+    METRICS_BUCKET_SECONDS,
+    METRICS_RETENTION_SECONDS,
+    METRICS_SKETCH_ACCURACY,
+)
+
+LEGACY_METRICS_FILE = "data/metrics.json"
+SEGMENT_PREFIX = "metrics-"
+SEGMENT_SUFFIX = ".jsonl"
+
+_buffer: List[Dict[str, Any]] = []
+_buffer_lock = threading.Lock()
+_write_lock = threading.Lock()
+_flusher: Optional[asyncio.Task] = None
+_counters: Dict[str, int] = {}
+_counters_lock = threading.Lock()
+
+
+def record(entry: Dict[str, Any]):
+    """Queue one entry. Cheap enough to call on the event loop."""
+    aggregator.add(entry)
+    with _buffer_lock:
+        _buffer.append(entry)
+        overflow = len(_buffer) >= METRICS_MAX_BUFFER
+    if overflow and _flusher is None:
+        # No background flusher (scripts, tests): flush inline so memory stays bounded
+        flush()
+
+
+def increment(name: str, n: int = 1):
+    """Bump a process-lifetime counter (cache hits, hedges, ...)."""
+    with _counters_lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def counters() -> Dict[str, int]:
+    with _counters_lock:
+        return dict(_counters)
+
+
+def segments() -> List[str]:
+    if not os.path.isdir(METRICS_DIR):
+        return []
+    names = [n for n in os.listdir(METRICS_DIR) if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+    return [os.path.join(METRICS_DIR, n) for n in sorted(names)]
+
+
+def _segment_path(index: int) -> str:
+    return os.path.join(METRICS_DIR, f"{SEGMENT_PREFIX}{index:06d}{SEGMENT_SUFFIX}")
+
+
+def _current_segment() -> str:
+    existing = segments()
+    if not existing:
+        return _segment_path(1)
+    last = existing[-1]
+    if os.path.getsize(last) < METRICS_SEGMENT_MAX_BYTES:
+        return last
+    index = int(os.path.basename(last)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+    return _segment_path(index + 1)
+
+
+def flush() -> int:
+    """Append all buffered entries to the current segment. Blocking; returns entries written.
+
+    A batch that fails to write goes back in front of the buffer for the next
+    flush; what no longer fits in METRICS_MAX_BUFFER (oldest first) is
+    dropped and counted as `metrics_entries_dropped`.
+    """
+    global _buffer
+    with _buffer_lock:
+        batch, _buffer = _buffer, []
+    if not batch:
+        return 0
+    lines = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in batch)
+    with _write_lock:
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(_current_segment(), "a") as f:
+                f.write(lines)
+        except Exception as e:
+            print(f"Failed to flush metrics: {e}")
+            _requeue(batch)
+            return 0
+    return len(batch)
+
+
+def _requeue(batch: List[Dict[str, Any]]):
+    global _buffer
+    with _buffer_lock:
+        _buffer = batch + _buffer
+        dropped = max(0, len(_buffer) - METRICS_MAX_BUFFER)
+        del _buffer[:dropped]
+    if dropped:
+        increment("metrics_entries_dropped", dropped)
+
+
+async def flush_async() -> int:
+    return await asyncio.to_thread(flush)
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        await flush_async()
+
+
+def migrate_legacy():
+    """Copy a pre-existing data/metrics.json array into the first segment.
+
+    The legacy file is only read, never moved; once segments exist it is ignored.
+    """
+    if not os.path.exists(LEGACY_METRICS_FILE) or segments():
+        return
+    try:
+        with open(LEGACY_METRICS_FILE) as f:
+            entries = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Skipping legacy metrics migration: {e}")
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    # Written under another name first: a half-written segment would stop the copy from ever being redone
+    tmp = _segment_path(1) + ".tmp"
+    with open(tmp, "w") as f:
+        for e in entries:
+            f.write(json.dumps(e, separators=(",", ":")) + "\n")
+    os.replace(tmp, _segment_path(1))
+
+
+async def start():
+    global _flusher
+    await asyncio.to_thread(migrate_legacy)
+    if _flusher is None:
+        _flusher = asyncio.create_task(_flush_loop())
+
+
+async def stop():
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except asyncio.CancelledError:
+            pass
+        _flusher = None
+    await flush_async()
+
+
+def iter_entries(offset: int = 0, limit: Optional[int] = None, since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Lazily walk the segments in order, one line at a time."""
+    skipped = 0
+    yielded = 0
+    for path in segments():
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                if limit is not None and yielded >= limit:
+                    return
+                line = line.strip()
+                if not line:
+                    continue
+                if since is None and skipped < offset:
+                    # Without a time filter, skipped lines never need parsing
+                    skipped += 1
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if since is not None:
+                    if entry.get("timestamp", 0) < since:
+                        continue
+                    if skipped < offset:
+                        skipped += 1
+                        continue
+                yielded += 1
+                yield entry
+
+
+def stream_json_array(offset: int = 0, limit: Optional[int] = None, since: Optional[float] = None) -> Iterator[str]:
+    """Serialize `iter_entries` as a JSON array without materializing it."""
+    yield "["
+    first = True
+    for entry in iter_entries(offset, limit, since):
+        yield ("" if first else ",") + json.dumps(entry)
+        first = False
+    yield "]"
+
+
+class LatencySketch:
+    """Mergeable quantile sketch over log-spaced buckets (DDSketch style).
+
+    Quantiles are within METRICS_SKETCH_ACCURACY relative error, and memory is
+    bounded by `max_bins`: past it the lowest buckets are collapsed together.
+    """
+
+    def __init__(self, accuracy: float = METRICS_SKETCH_ACCURACY, max_bins: int = 1024):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 1e-9:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: "LatencySketch"):
+        self.count += other.count
+        self.zeros += other.zeros
+        for key, n in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + n
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.bins)
+        excess = keys[: len(keys) - self.max_bins + 1]
+        total = sum(self.bins.pop(k) for k in excess)
+        self.bins[excess[-1]] = self.bins.get(excess[-1], 0) + total
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+
+class _Bucket:
+    __slots__ = ("start", "count", "successes", "tokens", "latency")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.count = 0
+        self.successes = 0
+        self.tokens = 0
+        self.latency = LatencySketch()
+
+
+class RollingAggregator:
+    """Per-model time-bucketed counters, kept for METRICS_RETENTION_SECONDS."""
+
+    def __init__(self, bucket_seconds: float = METRICS_BUCKET_SECONDS, retention: float = METRICS_RETENTION_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self._models: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, entry: Dict[str, Any]):
+        model = entry.get("model")
+        if model is None:
+            return
+        ts = entry.get("timestamp", time.time())
+        start = ts - ts % self.bucket_seconds
+        with self._lock:
+            buckets = self._models.setdefault(model, deque())
+            if not buckets or buckets[-1].start < start:
+                buckets.append(_Bucket(start))
+            bucket = buckets[-1]
+            if bucket.start > start:
+                bucket = self._late_bucket(buckets, start)
+            bucket.count += 1
+            bucket.successes += 1 if entry.get("success") else 0
+            bucket.tokens += entry.get("tokens", 0) or 0
+            bucket.latency.add(entry.get("latency", 0.0))
+            self._expire(buckets, ts)
+
+    def _late_bucket(self, buckets: deque, start: float) -> _Bucket:
+        """Find or insert the bucket for an out-of-order entry."""
+        for i in range(len(buckets) - 1, -1, -1):
+            if buckets[i].start == start:
+                return buckets[i]
+            if buckets[i].start < start:
+                buckets.insert(i + 1, _Bucket(start))
+                return buckets[i + 1]
+        buckets.appendleft(_Bucket(start))
+        return buckets[0]
+
+    def _expire(self, buckets: deque, now: float):
+        while buckets and buckets[0].start < now - self.retention:
+            buckets.popleft()
+
+    def latency_quantile(self, model: str, q: float, window: float, min_count: int = 1,
+                         now: Optional[float] = None) -> Optional[float]:
+        """Latency quantile for one model over the last `window` seconds (None below `min_count` calls)."""
+        now = time.time() if now is None else now
+        cutoff = now - window
+        merged = _Bucket(cutoff)
+        with self._lock:
+            for b in self._models.get(model, ()):
+                if b.start + self.bucket_seconds <= cutoff:
+                    continue
+                merged.count += b.count
+                merged.latency.merge(b.latency)
+        if merged.count < max(1, min_count):
+            return None
+        return merged.latency.quantile(q)
+
+    def summary(self, window: float, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        cutoff = now - window
+        models = {}
+        overall = _Bucket(cutoff)
+        with self._lock:
+            for model, buckets in list(self._models.items()):
+                self._expire(buckets, now)
+                merged = _Bucket(cutoff)
+                for b in buckets:
+                    if b.start + self.bucket_seconds <= cutoff:
+                        continue
+                    merged.count += b.count
+                    merged.successes += b.successes
+                    merged.tokens += b.tokens
+                    merged.latency.merge(b.latency)
+                if merged.count:
+                    models[model] = _describe(merged)
+                    overall.count += merged.count
+                    overall.successes += merged.successes
+                    overall.tokens += merged.tokens
+                    overall.latency.merge(merged.latency)
+        return {"window_seconds": window, "models": models, "overall": _describe(overall)}
+
+
+def _describe(b: _Bucket) -> Dict[str, Any]:
+    return {
+        "count": b.count,
+        "success_rate": b.successes / b.count if b.count else None,
+        "tokens": b.tokens,
+        "latency_p50": b.latency.quantile(0.50),
+        "latency_p95": b.latency.quantile(0.95),
+        "latency_p99": b.latency.quantile(0.99),
+    }
+
+
+aggregator = RollingAggregator()
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def parse_window(text: str) -> float:
+    """Parse '90s', '5m', '1h' (or plain seconds) into seconds."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", text or "")
+    if not match:
+        raise ValueError(f"Invalid window: {text!r}")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or "s"]
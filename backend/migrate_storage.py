@@ -0,0 +1,40 @@
+"""Import JSON conversation files into the SQLite backend.
+
+    python -m backend.migrate_storage [--source data/conversations] [--db data/council.db] [--overwrite]
+"""
+
+import argparse
+import glob
+import json
+import os
+
+from . import storage_sqlite
+from .config import DATA_DIR, SQLITE_PATH
+
+
+def migrate(source=DATA_DIR, overwrite=False):
+    imported = skipped = failed = 0
+    for path in sorted(glob.glob(os.path.join(source, "*.json"))):
+        try:
+            with open(path) as f:
+                convo = json.load(f)
+            if storage_sqlite.import_conversation(convo, overwrite):
+                imported += 1
+            else:
+                skipped += 1
+        except Exception as e:
+            failed += 1
+            print(f"Failed to import {path}: {e}")
+    return imported, skipped, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import JSON conversations into SQLite")
+    parser.add_argument("--source", default=DATA_DIR)
+    parser.add_argument("--db", default=SQLITE_PATH)
+    parser.add_argument("--overwrite", action="store_true", help="Replace conversations that already exist")
+    args = parser.parse_args()
+
+    storage_sqlite.SQLITE_PATH = args.db
+    imported, skipped, failed = migrate(args.source, args.overwrite)
+    print(f"Imported {imported}, skipped {skipped} existing, {failed} failed -> {args.db}")
@@ -1,16 +1,44 @@
 """OpenRouter API client."""
 
-import os
 import httpx
 import asyncio
 import json
 import time
-from typing import List, Dict, Any
-from .config import OPENROUTER_API_KEY
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Callable, Sequence
+from urllib.parse import urlsplit
+from . import metrics, tracing
+from .selector import telemetry
+from .cache import response_cache, cache_key
+from .scheduler import gather_quorum
+from .singleflight import SingleFlight
+from .ratelimit import UpstreamLimiter, UpstreamBusy, backoff_delay, parse_retry_after
+from .config import (
+    OPENROUTER_API_KEY,
+    OPENROUTER_API_URL,
+    HTTP_TIMEOUT,
+    HTTP2_ENABLED,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    MODEL_REGISTRY,
+    HEDGE_ENABLED,
+    HEDGE_QUANTILE,
+    HEDGE_WINDOW,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_MIN_DELAY,
+    MODEL_DEADLINE_FACTOR,
+    MODEL_DEADLINE_MIN,
+    UPSTREAM_MAX_RETRIES,
+)
 
-METRICS_FILE = "data/metrics.json"
+# Upstream answers worth retrying after a pause
+RETRY_STATUSES = (429, 502, 503)
 
-def log_metric(model: str, latency: float, success: bool, tokens: int = 0):
+def log_metric(model: str, latency: float, success: bool, tokens: int = 0, ttft: Optional[float] = None,
+               prompt_tokens: Optional[int] = None):
     entry = {
         "timestamp": time.time(),
         "model": model,
@@ -18,29 +46,285 @@ def log_metric(model: str, latency: float, success: bool, tokens: int = 0):
         "success": success,
         "tokens": tokens
     }
+    if ttft is not None:
+        entry["ttft"] = ttft
+    if prompt_tokens is not None:
+        entry["prompt_tokens"] = prompt_tokens
+    trace_id = tracing.trace_id()
+    if trace_id is not None:
+        entry["trace_id"] = trace_id
+    metrics.record(entry)
+    telemetry.observe(model, latency, success, tokens)
+
+
+_client: Optional[httpx.AsyncClient] = None
+# Concurrency and rate limits in front of OpenRouter; set to None to disable
+limiter: Optional[UpstreamLimiter] = UpstreamLimiter()
+# In-flight upstream calls by (cache key, streaming)
+inflight = SingleFlight("query")
+_client_loop = None
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def init_client() -> httpx.AsyncClient:
+    """Create the shared pooled client. Called from the FastAPI lifespan."""
+    global _client, _client_loop
+    if _client is None:
+        http2 = HTTP2_ENABLED and _http2_available()
+        if HTTP2_ENABLED and not http2:
+            print("h2 not installed, falling back to HTTP/1.1")
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        _client = httpx.AsyncClient(http2=http2, limits=limits, timeout=HTTP_TIMEOUT)
+        _client_loop = _running_loop()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_slots.clear()
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside the app (scripts, tests)."""
+    global _client
+    loop = _running_loop()
+    if _client is not None and _client_loop is not None and loop is not None and _client_loop is not loop:
+        # Pooled connections are bound to the loop that opened them
+        _client = None
+        _host_slots.clear()
+    return _client if _client is not None else init_client()
+
+
+def _host_slot(url: str) -> Optional[asyncio.Semaphore]:
+    """Per-host cap on concurrent requests, on top of the pool-wide limit."""
+    if HTTP_MAX_CONNECTIONS_PER_HOST <= 0:
+        return None
+    host = urlsplit(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+    return slot
+
+
+async def _post(client: httpx.AsyncClient, url: str, headers: Dict[str, str], data: Dict[str, Any]):
+    resp = await client.post(url, headers=headers, json=data)
+    resp.raise_for_status()
+    result = resp.json()
+    return result["choices"][0]["message"], result.get("usage") or {}, None
+
+
+async def _post_stream(client: httpx.AsyncClient, url: str, headers: Dict[str, str], data: Dict[str, Any],
+                       on_delta: Callable[[str], None]):
+    """Streaming completion: forward each content delta and assemble the full message."""
+    data = dict(data, stream=True, stream_options={"include_usage": True})
+    parts = []
+    usage = {}
+    ttft = None
+    start = time.time()
+    async with client.stream("POST", url, headers=headers, json=data) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            # Blank keep-alives and ": OPENROUTER PROCESSING" comments carry no data
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    if ttft is None:
+                        ttft = time.time() - start
+                    parts.append(delta)
+                    on_delta(delta)
+    return {"role": "assistant", "content": "".join(parts)}, usage, ttft
+
+
+async def query_model(model: str, messages: List[Dict[str, str]], use_cache: bool = True,
+                      on_delta: Optional[Callable[[str], None]] = None, hedge: bool = False,
+                      exclude: Sequence[str] = ()) -> Dict[str, Any]:
+    """Query a single model via OpenRouter, answering from the response cache when possible.
+
+    With `on_delta`, the completion is requested in streaming mode and each
+    content fragment is passed to `on_delta` as it arrives; the return value
+    is the same assembled message either way.
+
+    The call is cut off at the model's adaptive deadline. With `hedge`, a
+    backup request goes to `hedge_model(model, exclude)` once the primary is
+    slower than usual or has failed; if the backup wins, its id is in the result's "model".
+    """
+    with tracing.span("llm.query", model=model, stream=on_delta is not None) as span:
+        if hedge and HEDGE_ENABLED:
+            result = await _query_hedged(model, messages, use_cache, on_delta, exclude)
+        else:
+            result = await _query_once(model, messages, use_cache, on_delta)
+        if result is None:
+            span.fail("no response")
+        return result
+
+
+def model_deadline(model: str) -> Optional[float]:
+    """Overall time limit for one call, from the model's recent p99 latency."""
+    p99 = metrics.aggregator.latency_quantile(model, 0.99, HEDGE_WINDOW, HEDGE_MIN_SAMPLES)
+    if p99 is None:
+        return None
+    return min(HTTP_TIMEOUT, max(MODEL_DEADLINE_MIN, p99 * MODEL_DEADLINE_FACTOR))
+
+
+def hedge_delay(model: str) -> float:
+    """How long to wait on the primary before sending the backup request."""
+    latency = metrics.aggregator.latency_quantile(model, HEDGE_QUANTILE, HEDGE_WINDOW, HEDGE_MIN_SAMPLES)
+    if latency is None:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, latency)
+
+
+def hedge_model(model: str, exclude: Sequence[str] = ()) -> Optional[str]:
+    """Best available registry model sharing tags with `model`, ranked by tag overlap then live score."""
+    registry = {m["id"]: m for m in MODEL_REGISTRY}
+    primary = registry.get(model)
+    if primary is None:
+        return None
+    tags = set(primary["tags"])
+    best, best_score = None, None
+    for m in MODEL_REGISTRY:
+        if m["id"] == model or m["id"] in exclude or not telemetry.available(m["id"]):
+            continue
+        overlap = len(tags.intersection(m["tags"]))
+        if not overlap:
+            continue
+        score = (overlap, telemetry.score(m["id"], explore=False))
+        if best_score is None or score > best_score:
+            best, best_score = m["id"], score
+    return best
+
+
+async def _query_hedged(model: str, messages: List[Dict[str, str]], use_cache: bool,
+                        on_delta: Optional[Callable[[str], None]], exclude: Sequence[str]) -> Dict[str, Any]:
+    tasks: Dict[str, asyncio.Task] = {}
+    owner = None
+
+    def forward_from(name):
+        # When streaming, the first model to produce a token owns the stream; the
+        # other keeps running silently in case the owner fails before it finishes
+        if on_delta is None:
+            return None
+
+        def forward(delta):
+            nonlocal owner
+            if owner is None:
+                owner = name
+            if owner == name:
+                on_delta(delta)
+        return forward
+
+    tasks[model] = asyncio.ensure_future(_query_once(model, messages, use_cache, forward_from(model)))
     try:
-        if not os.path.exists("data"):
-            os.makedirs("data")
-        
-        data = []
-        if os.path.exists(METRICS_FILE):
-            with open(METRICS_FILE, "r") as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    pass
-        
-        data.append(entry)
-        
-        with open(METRICS_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        print(f"Failed to log metric: {e}")
-
-
-async def query_model(model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-    """Query a single model via OpenRouter."""
-    url = "https://openrouter.ai/api/v1/chat/completions"
+        delay = hedge_delay(model)
+        primary = tasks[model]
+        await asyncio.wait([primary], timeout=delay)
+        if owner is not None:
+            # Already streaming: a backup is only needed if the primary fails after all
+            await asyncio.wait([primary])
+        if primary.done() and primary.result() is not None:
+            return primary.result()
+
+        # Chosen only now, so a half-open model is only held for a trial that actually happens
+        backup = hedge_model(model, exclude)
+        if backup is None:
+            return await primary
+        telemetry.begin_trial(backup)
+        tracing.current().set(hedge_backup=backup)
+        if primary.done():
+            metrics.increment("hedge_fallbacks")
+            print(f"[HEDGE] {model} failed, asking {backup}")
+        else:
+            metrics.increment("hedges")
+            print(f"[HEDGE] {model} slower than {delay:.1f}s, also asking {backup}")
+        tasks[backup] = asyncio.ensure_future(_query_once(backup, messages, use_cache, forward_from(backup)))
+
+        def succeeded(name):
+            task = tasks[name]
+            return task.done() and not task.cancelled() and task.result() is not None
+
+        while True:
+            if owner is not None and (succeeded(owner) or not tasks[owner].done()):
+                # The client has the owner's tokens, so only its answer matches them
+                candidates = (owner,)
+            else:
+                candidates = (model, backup)
+            for name in candidates:
+                if succeeded(name):
+                    result = tasks[name].result()
+                    if name == backup:
+                        metrics.increment("hedge_wins")
+                        result["model"] = backup
+                    else:
+                        metrics.increment("hedge_primary_wins")
+                    return result
+            pending = {t for t in tasks.values() if not t.done()}
+            if not pending:
+                return None
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # The winner is in (or every request failed): only now is the other request dropped
+        stragglers = [t for t in tasks.values() if not t.done()]
+        for t in stragglers:
+            t.cancel()
+        if stragglers:
+            await asyncio.gather(*stragglers, return_exceptions=True)
+
+
+async def _query_once(model: str, messages: List[Dict[str, str]], use_cache: bool,
+                      on_delta: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+    if not use_cache:
+        return await _call_upstream(model, messages, None, on_delta)
+
+    key = cache_key(model, messages)
+    if response_cache is not None:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            tracing.current().set(cache_hit=True)
+            if on_delta is not None and cached.get("content"):
+                on_delta(cached["content"])
+            return dict(cached)
+
+    # Identical calls already in flight share one upstream request (and its deltas)
+    streaming = on_delta is not None
+    result = await inflight.do(
+        (key, streaming), lambda emit: _call_upstream(model, messages, key, emit if streaming else None), on_delta
+    )
+    return None if result is None else dict(result)
+
+
+async def _call_upstream(model: str, messages: List[Dict[str, str]], key: Optional[str],
+                         on_delta: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+    url = OPENROUTER_API_URL
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
@@ -51,28 +335,88 @@ async def query_model(model: str, messages: List[Dict[str, str]]) -> Dict[str, A
         "messages": messages,
     }
 
-    start_time = time.time()
-    try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, headers=headers, json=data, timeout=60.0)
-            resp.raise_for_status()
-            result = resp.json()
-            
-            latency = time.time() - start_time
-            usage = result.get("usage", {})
-            tokens = usage.get("total_tokens", 0)
-            log_metric(model, latency, True, tokens)
-            
-            return result["choices"][0]["message"]
-    except Exception as e:
+    deadline = model_deadline(model)
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        start_time = time.time()
+        try:
+            message, usage, ttft, start_time = await _send(model, url, headers, data, on_delta, deadline)
+        except asyncio.CancelledError:
+            # The caller gave up (client disconnect, a hedge won): the request is abandoned
+            metrics.increment("upstream_calls_cancelled")
+            raise
+        except UpstreamBusy as e:
+            metrics.increment("upstream_queue_timeouts")
+            print(f"[ERROR] Model {model} not sent: {e}")
+            return None
+        except asyncio.TimeoutError:
+            log_metric(model, deadline, False)
+            metrics.increment("model_deadline_exceeded")
+            print(f"[ERROR] Model {model} missed its {deadline:.1f}s deadline")
+            return None
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status not in RETRY_STATUSES or attempt == UPSTREAM_MAX_RETRIES:
+                log_metric(model, time.time() - start_time, False)
+                print(f"[ERROR] Model {model} failed: {e}")
+                return None
+            # Rate limited or overloaded upstream: not the model's fault, so no failure metric
+            metrics.increment(f"upstream_{status}")
+            metrics.increment("upstream_retries")
+            delay = backoff_delay(attempt, parse_retry_after(e.response.headers.get("Retry-After")))
+            if limiter is not None:
+                limiter.penalize(model, delay)
+            print(f"[RETRY] Model {model} returned {status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        except Exception as e:
+            log_metric(model, time.time() - start_time, False)
+            print(f"[ERROR] Model {model} failed: {e}")
+            return None
+
         latency = time.time() - start_time
-        log_metric(model, latency, False)
-        print(f"[ERROR] Model {model} failed: {e}")
-        return None
+        tokens = usage.get("total_tokens", 0)
+        log_metric(model, latency, True, tokens, ttft, usage.get("prompt_tokens"))
+
+        if key is not None and response_cache is not None:
+            await response_cache.set(key, message)
+        return dict(message)
+
+
+async def _send(model: str, url: str, headers: Dict[str, str], data: Dict[str, Any],
+                on_delta: Optional[Callable[[str], None]], deadline: Optional[float]):
+    """One upstream request, after queueing for a limiter slot. Returns (message, usage, ttft, start_time).
+
+    The model's deadline starts once the request is actually sent, so time
+    spent queueing is not held against the model.
+    """
+    with tracing.span("llm.request", tracing.KIND_CLIENT, model=model) as span:
+        queued = time.time_ns()
+        async with (limiter.slot(model) if limiter is not None else nullcontext()):
+            span.child("llm.queue", queued)
+            start_time = time.time()
+            client = get_client()
+            slot = _host_slot(url)
+            send = _post(client, url, headers, data) if on_delta is None else _post_stream(client, url, headers, data, on_delta)
+            if deadline is not None:
+                send = asyncio.wait_for(send, deadline)
+            if slot is not None:
+                async with slot:
+                    message, usage, ttft = await send
+            else:
+                message, usage, ttft = await send
+        if ttft is not None:
+            span.event("first_token", int((start_time + ttft) * 1e9))
+            span.set(ttft_ms=round(ttft * 1000, 1))
+        span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+    return message, usage, ttft, start_time
+
 
+async def query_models_parallel(models: List[str], messages: List[Dict[str, str]], quorum: Optional[int] = None,
+                                grace: float = 0.0, deadline: Optional[float] = None, hedge: bool = False):
+    """Query several models at once; see scheduler.gather_quorum for quorum/deadline.
 
-async def query_models_parallel(models: List[str], messages: List[Dict[str, str]]):
-    import asyncio
-    tasks = [query_model(m, messages) for m in models]
-    responses = await asyncio.gather(*tasks)
+    Hedged calls never fall back to another model of the same batch.
+    """
+    tasks = [query_model(m, messages, hedge=hedge, exclude=models) for m in models]
+    responses = await gather_quorum(tasks, quorum, grace, deadline)
     return {model: resp for model, resp in zip(models, responses)}
@@ -0,0 +1,144 @@
+"""Rank aggregation for the Stage 2 ensemble.
+
+Each ranker returns an ordering of the anonymized Stage 1 labels ("Response
+A", ...), possibly partial. `aggregate_rankings` combines them into one
+consensus order: Borda points give a first order, then the Kemeny-Young
+order is found, i.e. the order agreeing with the most pairwise ranker
+preferences. It is exact by enumeration for small councils and a local
+search from the Borda order beyond KEMENY_EXACT_MAX responses. Agreement is
+reported as each ranker's Kendall tau against the consensus.
+
+Ranked labels count as preferred over unranked ones; two unranked labels
+are not compared.
+"""
+
+import itertools
+from typing import Any, Dict, List, Optional, Sequence
+
+# Largest number of responses for which every order is tried (6! = 720)
+KEMENY_EXACT_MAX = 6
+
+
+def clean_ranking(parsed: Sequence[str], labels: Sequence[str]) -> List[str]:
+    """Known labels of `parsed` in order, repeats dropped."""
+    known = set(labels)
+    return [label for label in dict.fromkeys(parsed) if label in known]
+
+
+def pairwise_preferences(rankings: Sequence[Sequence[str]], labels: Sequence[str]) -> List[List[int]]:
+    """P[i][j] = number of rankers that put labels[i] above labels[j]."""
+    index = {label: i for i, label in enumerate(labels)}
+    n = len(labels)
+    prefs = [[0] * n for _ in range(n)]
+    for ranking in rankings:
+        ranked = [index[label] for label in ranking]
+        rest = set(range(n)) - set(ranked)
+        for pos, i in enumerate(ranked):
+            for j in ranked[pos + 1:]:
+                prefs[i][j] += 1
+            for j in rest:
+                prefs[i][j] += 1
+    return prefs
+
+
+def borda_scores(rankings: Sequence[Sequence[str]], labels: Sequence[str]) -> Dict[str, int]:
+    """n - 1 points for first place, n - 2 for second, ...; none when unranked."""
+    n = len(labels)
+    scores = {label: 0 for label in labels}
+    for ranking in rankings:
+        for pos, label in enumerate(ranking):
+            scores[label] += n - 1 - pos
+    return scores
+
+
+def _agreement(order: Sequence[int], prefs: List[List[int]]) -> int:
+    return sum(prefs[i][j] for a, i in enumerate(order) for j in order[a + 1:])
+
+
+def kemeny_order(prefs: List[List[int]], start: Sequence[int]) -> tuple:
+    """Order of indices maximizing pairwise agreement; `start` breaks ties.
+
+    Returns (order, agreement, exact).
+    """
+    start = list(start)
+    if len(start) <= KEMENY_EXACT_MAX:
+        # Only a strictly better order replaces `start`, so ties keep the Borda order
+        best, best_score = start, _agreement(start, prefs)
+        for order in itertools.permutations(start):
+            score = _agreement(order, prefs)
+            if score > best_score:
+                best, best_score = list(order), score
+        return best, best_score, True
+    # Local Kemenization: swap adjacent pairs the majority orders the other way
+    order = start
+    improved = True
+    while improved:
+        improved = False
+        for k in range(len(order) - 1):
+            i, j = order[k], order[k + 1]
+            if prefs[j][i] > prefs[i][j]:
+                order[k], order[k + 1] = j, i
+                improved = True
+    return order, _agreement(order, prefs), False
+
+
+def kendall_tau(a: Sequence[str], b: Sequence[str]) -> Optional[float]:
+    """Kendall tau between two orders over the items both contain (None below two)."""
+    pos_b = {label: i for i, label in enumerate(b)}
+    common = [label for label in a if label in pos_b]
+    if len(common) < 2:
+        return None
+    concordant = discordant = 0
+    for x, y in itertools.combinations(common, 2):
+        # x precedes y in `a`
+        if pos_b[x] < pos_b[y]:
+            concordant += 1
+        else:
+            discordant += 1
+    return (concordant - discordant) / (concordant + discordant)
+
+
+def aggregate_rankings(rankings: Dict[str, Sequence[str]], labels: Sequence[str],
+                       label_to_model: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+    """Consensus of `rankings` (ranker model -> ordered labels) over `labels`.
+
+    None when no ranker produced a usable ranking.
+    """
+    labels = list(labels)
+    cleaned = {model: clean_ranking(parsed, labels) for model, parsed in rankings.items()}
+    cleaned = {model: r for model, r in cleaned.items() if r}
+    if not cleaned or len(labels) < 2:
+        return None
+    orders = list(cleaned.values())
+    prefs = pairwise_preferences(orders, labels)
+    borda = borda_scores(orders, labels)
+    borda_order = sorted(range(len(labels)), key=lambda i: (-borda[labels[i]], labels[i]))
+    order, agreement, exact = kemeny_order(prefs, borda_order)
+    consensus = [labels[i] for i in order]
+    comparisons = sum(prefs[i][j] for i in range(len(labels)) for j in range(len(labels)))
+
+    taus = {model: kendall_tau(r, consensus) for model, r in cleaned.items()}
+    known = [t for t in taus.values() if t is not None]
+    entries = []
+    for pos, label in enumerate(consensus):
+        places = [r.index(label) + 1 for r in orders if label in r]
+        entries.append({
+            "label": label,
+            "model": (label_to_model or {}).get(label, label),
+            "position": pos + 1,
+            "borda": borda[label],
+            "average_rank": sum(places) / len(places) if places else float(len(labels)),
+            "rankings_count": len(places),
+            "first_place_votes": sum(1 for r in orders if r[0] == label),
+        })
+    return {
+        "method": "kemeny" if exact else "kemeny_local",
+        "rankers": len(orders),
+        "order": consensus,
+        "borda_order": [labels[i] for i in borda_order],
+        # Share of the rankers' pairwise preferences the consensus order keeps
+        "pairwise_support": agreement / comparisons if comparisons else None,
+        "tau_to_consensus": taus,
+        "mean_tau_to_consensus": sum(known) / len(known) if known else None,
+        "rankings": entries,
+    }
@@ -0,0 +1,224 @@
+"""Upstream rate limiting and request admission.
+
+`UpstreamLimiter` sits in front of every OpenRouter call: a global and a
+per-model concurrency cap plus a per-model token bucket, all with a bounded
+wait. A 429 with Retry-After pauses the model's bucket so queued calls back
+off together instead of each hitting the limit again.
+
+`AdmissionController` caps concurrent council runs at the API layer and
+turns requests away with 503 + Retry-After once its queue is full.
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from .config import (
+    UPSTREAM_MAX_CONCURRENCY,
+    UPSTREAM_MODEL_CONCURRENCY,
+    UPSTREAM_MODEL_RPM,
+    UPSTREAM_MODEL_BURST,
+    UPSTREAM_QUEUE_TIMEOUT,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_MAX,
+    COUNCIL_MAX_CONCURRENT,
+    COUNCIL_MAX_QUEUE,
+    COUNCIL_QUEUE_TIMEOUT,
+    ADMISSION_RETRY_AFTER,
+)
+
+
+class UpstreamBusy(Exception):
+    """No upstream slot or rate-limit token became free within the queue timeout."""
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Server busy, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds, from either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Honour Retry-After when given, else exponential backoff with full jitter."""
+    if retry_after is not None:
+        return min(retry_after, UPSTREAM_BACKOFF_MAX)
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """Reservation-style bucket: tokens may go negative, and the deficit is the caller's wait."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Take one token and return how long to wait before using it."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+async def _acquire(sem: asyncio.Semaphore, deadline: float):
+    try:
+        await asyncio.wait_for(sem.acquire(), max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        raise UpstreamBusy("timed out waiting for an upstream slot")
+
+
+class UpstreamLimiter:
+    def __init__(self, max_concurrency: int = UPSTREAM_MAX_CONCURRENCY,
+                 model_concurrency: int = UPSTREAM_MODEL_CONCURRENCY, model_rpm: float = UPSTREAM_MODEL_RPM,
+                 model_burst: float = UPSTREAM_MODEL_BURST, queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency
+        self.model_rate = model_rpm / 60
+        self.model_burst = model_burst
+        self.queue_timeout = queue_timeout
+        self._loop = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._models: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bind(self):
+        # Semaphores belong to the loop that first waits on them (tests and scripts run several loops)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._global = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+            self._models = {}
+
+    def _bucket(self, model: str) -> Optional[TokenBucket]:
+        if self.model_rate <= 0:
+            return None
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = TokenBucket(self.model_rate, self.model_burst)
+        return bucket
+
+    def penalize(self, model: str, seconds: float):
+        """Hold back every call to `model` for `seconds` (after a 429)."""
+        bucket = self._bucket(model)
+        if bucket is not None:
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        self._bind()
+        deadline = time.monotonic() + self.queue_timeout
+        # Wait out the model's rate limit before taking any slot, so a throttled
+        # model never holds global slots that calls to other models could use
+        bucket = self._bucket(model)
+        reserved = False
+        acquired = []
+        try:
+            if bucket is not None:
+                now = time.monotonic()
+                wait = bucket.reserve(now)
+                reserved = True
+                if now + wait > deadline:
+                    raise UpstreamBusy(f"rate limit for {model} would need a {wait:.1f}s wait")
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            if self._global is not None:
+                await _acquire(self._global, deadline)
+                acquired.append(self._global)
+            if self.model_concurrency > 0:
+                sem = self._models.get(model)
+                if sem is None:
+                    sem = self._models[model] = asyncio.Semaphore(self.model_concurrency)
+                await _acquire(sem, deadline)
+                acquired.append(sem)
+            # The call goes out now: its token is spent
+            reserved = False
+            yield
+        finally:
+            if reserved:
+                # Timed out or cancelled before calling: hand the token back
+                bucket.refund()
+            for sem in acquired:
+                sem.release()
+
+
+class AdmissionController:
+    """At most `max_active` council runs; up to `max_queue` more wait `queue_timeout` for a turn."""
+
+    def __init__(self, max_active: int = COUNCIL_MAX_CONCURRENT, max_queue: int = COUNCIL_MAX_QUEUE,
+                 queue_timeout: float = COUNCIL_QUEUE_TIMEOUT, retry_after: float = ADMISSION_RETRY_AFTER):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.waiting = 0
+        self._loop = None
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._sem = asyncio.Semaphore(self.max_active)
+            self.waiting = 0
+
+    async def acquire(self, block: bool = False):
+        """Take a run slot or raise Overloaded. Pair with `release`.
+
+        With `block`, wait for a slot however long it takes, outside the wait
+        queue: for callers that bound their own backlog (the job queue).
+        """
+        if self.max_active <= 0:
+            return
+        self._bind()
+        if block:
+            await self._sem.acquire()
+            return
+        if not self._sem.locked():
+            # Free slot: acquire() returns without suspending, so the count stays exact
+            await self._sem.acquire()
+            return
+        if self.waiting >= self.max_queue:
+            raise Overloaded(self.retry_after)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded(self.retry_after)
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        if self.max_active > 0:
+            self._sem.release()
+
+    @asynccontextmanager
+    async def admit(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
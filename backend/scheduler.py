@@ -0,0 +1,130 @@
+"""Dependency-driven scheduling for council stages.
+
+Each stage starts as soon as the stages it depends on have finished, so
+independent stages (CLCC and Stage 2 both only need Stage 1) run side by
+side and end-to-end latency follows the critical path. Stages can carry a
+deadline with a fallback result, and `gather_quorum` lets a stage move on
+once enough of its parallel model calls have answered.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from . import tracing
+
+
+class StageFailed(Exception):
+    """Raised by a stage to stop every stage that depends on it."""
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    deps: Sequence[str] = field(default_factory=tuple)
+    deadline: Optional[float] = None
+    # Result used when the deadline passes; None means the stage fails instead
+    fallback: Optional[Callable[[], Any]] = None
+
+
+async def run_dag(stages: List[Stage]) -> Dict[str, Any]:
+    """Run `stages` respecting deps. Returns results of the stages that completed.
+
+    `stage.run` receives the results of all finished stages so far (at least
+    its deps). A stage that misses its deadline without a fallback, raises
+    StageFailed or raises any other exception is left out of the results,
+    and its dependents are skipped; the other stages carry on.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Stage {s.name!r} depends on unknown stages {missing}")
+
+    results: Dict[str, Any] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_stage(stage: Stage):
+        for dep in stage.deps:
+            if not await tasks[dep]:
+                return False
+        with tracing.span(f"stage.{stage.name}") as span:
+            try:
+                if stage.deadline is None:
+                    results[stage.name] = await stage.run(results)
+                else:
+                    results[stage.name] = await asyncio.wait_for(stage.run(results), stage.deadline)
+            except asyncio.TimeoutError:
+                if stage.fallback is None:
+                    print(f"Stage {stage.name} missed its {stage.deadline}s deadline")
+                    span.fail(f"missed its {stage.deadline}s deadline")
+                    return False
+                print(f"Stage {stage.name} missed its {stage.deadline}s deadline, using fallback")
+                span.set(fallback=True)
+                results[stage.name] = stage.fallback()
+            except StageFailed as e:
+                print(f"Stage {stage.name} failed: {e}")
+                span.fail(e)
+                return False
+            except Exception as e:
+                # A bug in one stage only costs that stage's branch, not the whole turn
+                print(f"Stage {stage.name} raised {type(e).__name__}: {e}")
+                span.fail(e)
+                return False
+        return True
+
+    for s in stages:
+        tasks[s.name] = asyncio.create_task(run_stage(s))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for t in tasks.values():
+            t.cancel()
+    return results
+
+
+async def gather_quorum(aws: Sequence[Awaitable[Any]], quorum: Optional[int] = None, grace: float = 0.0,
+                        deadline: Optional[float] = None) -> List[Any]:
+    """Like gather, but may return before every awaitable has finished.
+
+    Returns as soon as all are done, or `grace` seconds after `quorum`
+    successful (non-None) results are in, or at `deadline`. Unfinished calls
+    are cancelled and reported as None, in input order.
+    """
+    tasks = [asyncio.ensure_future(a) for a in aws]
+    if not tasks:
+        return []
+    need = len(tasks) if quorum is None else min(quorum, len(tasks))
+    loop = asyncio.get_running_loop()
+    stop_at = None if deadline is None else loop.time() + deadline
+    pending = set(tasks)
+    try:
+        while pending:
+            successes = sum(1 for t in tasks if t.done() and not t.cancelled() and t.exception() is None
+                            and t.result() is not None)
+            if successes >= need:
+                # Quorum reached: give stragglers a short grace period, then move on
+                if grace > 0:
+                    timeout = grace if stop_at is None else min(grace, max(0.0, stop_at - loop.time()))
+                    await asyncio.wait(pending, timeout=timeout)
+                break
+            timeout = None if stop_at is None else max(0.0, stop_at - loop.time())
+            if timeout == 0.0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+    finally:
+        stragglers = [t for t in tasks if not t.done()]
+        for t in stragglers:
+            t.cancel()
+        if stragglers:
+            await asyncio.gather(*stragglers, return_exceptions=True)
+    results = []
+    for t in tasks:
+        if t.done() and not t.cancelled() and t.exception() is None:
+            results.append(t.result())
+        else:
+            results.append(None)
+    return results
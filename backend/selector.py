@@ -0,0 +1,169 @@
+"""Live per-model telemetry for the dynamic agent pool (Task E).
+
+Every model call reported through `openrouter.log_metric` updates in-memory
+estimates for that model: EWMA latency, tokens per second and a discounted
+success/failure count. `score` turns them into the selector's ranking score.
+With the Thompson policy, each model's success rate is sampled from its Beta
+posterior, so rarely used models still get picked now and then. A circuit
+breaker takes a model out of rotation after repeated failures and lets a
+single trial through once its cooldown has passed.
+
+The static `trust`, `cost` and `latency` values in MODEL_REGISTRY act as
+priors until enough live calls have been observed.
+"""
+
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import (
+    MODEL_REGISTRY,
+    SELECTOR_POLICY,
+    SELECTOR_EWMA_ALPHA,
+    SELECTOR_DECAY,
+    SELECTOR_PRIOR_WEIGHT,
+    SELECTOR_PRIOR_LATENCY,
+    BREAKER_FAILURES,
+    BREAKER_COOLDOWN,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelStats:
+    __slots__ = ("latency", "tps", "successes", "failures", "calls", "consecutive_failures", "opened_at",
+                 "trial_at")
+
+    def __init__(self, prior: Dict[str, Any]):
+        # Registry latency is relative; SELECTOR_PRIOR_LATENCY converts one unit to seconds
+        self.latency = prior.get("latency", 1.0) * SELECTOR_PRIOR_LATENCY
+        self.tps: Optional[float] = None
+        self.successes = 0.0
+        self.failures = 0.0
+        self.calls = 0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_at: Optional[float] = None
+
+
+class ModelTelemetry:
+    def __init__(self, registry=MODEL_REGISTRY, policy: str = SELECTOR_POLICY, alpha: float = SELECTOR_EWMA_ALPHA,
+                 decay: float = SELECTOR_DECAY, prior_weight: float = SELECTOR_PRIOR_WEIGHT,
+                 breaker_failures: int = BREAKER_FAILURES, breaker_cooldown: float = BREAKER_COOLDOWN,
+                 rng: Optional[random.Random] = None):
+        self.registry = {m["id"]: m for m in registry}
+        self.policy = policy
+        self.alpha = alpha
+        self.decay = decay
+        self.prior_weight = prior_weight
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._rng = rng or random.Random()
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats(self.registry.get(model, {}))
+        return stats
+
+    def observe(self, model: str, latency: float, success: bool, tokens: int = 0, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            s = self._get(model)
+            s.calls += 1
+            # Discount old outcomes so a model that recovers (or degrades) is noticed quickly
+            s.successes = s.successes * self.decay + (1 if success else 0)
+            s.failures = s.failures * self.decay + (0 if success else 1)
+            if success or latency > s.latency:
+                # Failures only pull the estimate up: a timeout says the model is slow, a fast error says nothing
+                s.latency += self.alpha * (latency - s.latency)
+            if success:
+                if tokens and latency > 0:
+                    tps = tokens / latency
+                    s.tps = tps if s.tps is None else s.tps + self.alpha * (tps - s.tps)
+                s.consecutive_failures = 0
+                s.opened_at = None
+                s.trial_at = None
+            else:
+                s.consecutive_failures += 1
+                if s.opened_at is not None or s.consecutive_failures >= self.breaker_failures:
+                    # Trip the breaker, or re-open it after a failed half-open trial
+                    s.opened_at = now
+                    s.trial_at = None
+
+    def state(self, model: str, now: Optional[float] = None) -> str:
+        now = time.time() if now is None else now
+        with self._lock:
+            s = self._stats.get(model)
+            if s is None or s.opened_at is None:
+                return CLOSED
+            return HALF_OPEN if now - s.opened_at >= self.breaker_cooldown else OPEN
+
+    def available(self, model: str, now: Optional[float] = None) -> bool:
+        """False while the breaker is open, or while a half-open trial is already in flight."""
+        now = time.time() if now is None else now
+        state = self.state(model, now)
+        if state == OPEN:
+            return False
+        if state == HALF_OPEN:
+            with self._lock:
+                trial_at = self._stats[model].trial_at
+            return trial_at is None or now - trial_at >= self.breaker_cooldown
+        return True
+
+    def begin_trial(self, model: str, now: Optional[float] = None):
+        """Record that a half-open model was picked, so concurrent queries don't pile onto it."""
+        now = time.time() if now is None else now
+        if self.state(model, now) == HALF_OPEN:
+            with self._lock:
+                self._stats[model].trial_at = now
+
+    def success_rate(self, model: str, sample: bool = False) -> float:
+        prior = self.registry.get(model, {}).get("trust", 0.8)
+        with self._lock:
+            s = self._get(model)
+            a = prior * self.prior_weight + s.successes
+            b = (1 - prior) * self.prior_weight + s.failures
+        if sample:
+            return self._rng.betavariate(a, b)
+        return a / (a + b)
+
+    def score(self, model: str, weight: float = 1.0, explore: Optional[bool] = None) -> float:
+        """weight x success / (cost x sqrt(latency)), scaled by relative throughput."""
+        if explore is None:
+            explore = self.policy == "thompson"
+        success = self.success_rate(model, sample=explore)
+        cost = self.registry.get(model, {}).get("cost", 1.0)
+        with self._lock:
+            s = self._get(model)
+            latency = s.latency
+            tps = s.tps
+            known = [x.tps for x in self._stats.values() if x.tps]
+        score = (weight * success) / (max(0.1, cost) * math.sqrt(max(0.1, latency)))
+        if tps and len(known) > 1:
+            median = sorted(known)[len(known) // 2]
+            score *= min(2.0, max(0.5, math.sqrt(tps / median)))
+        return score
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        now = time.time() if now is None else now
+        out = {}
+        for model in sorted(set(self.registry) | set(self._stats)):
+            with self._lock:
+                s = self._get(model)
+                row = {"calls": s.calls, "latency_ewma": s.latency, "tokens_per_second": s.tps,
+                       "consecutive_failures": s.consecutive_failures}
+            row["success_rate"] = self.success_rate(model)
+            row["breaker"] = self.state(model, now)
+            row["score"] = self.score(model, explore=False)
+            out[model] = row
+        return out
+
+
+telemetry = ModelTelemetry()
@@ -0,0 +1,134 @@
+"""Semantic cache of whole council results for near-duplicate questions.
+
+Questions are tokenized the same way as the TF-IDF matrices in the VRT, but
+with a HashingVectorizer so the vocabulary never has to be refitted. Term
+counts per cached question are kept as sparse rows, and document
+frequencies are maintained incrementally as entries come and go. Rows are
+IDF-weighted when they are added, with the IDF of the last rebuild; the
+index is rebuilt with fresh IDF (and removed rows compacted away) only once
+more than IDF_REFRESH_FRACTION of the entries changed since, so a store
+costs one row, not the whole cache. A lookup is one sparse matrix-vector product over
+at most SEMANTIC_CACHE_MAX_ENTRIES rows.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from . import metrics
+from .config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL,
+)
+
+N_FEATURES = 2 ** 18
+# Rebuild the weighted index once more than this share of the entries was added or removed
+IDF_REFRESH_FRACTION = 0.1
+
+
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectorizer = HashingVectorizer(n_features=N_FEATURES, alternate_sign=False, norm=None)
+        self._df = np.zeros(N_FEATURES, dtype=np.int32)
+        # Parallel lists, one slot per row of the weighted index; removed slots hold None until the next rebuild
+        self._rows: List[Optional[sparse.csr_matrix]] = []
+        self._entries: List[Optional[Dict[str, Any]]] = []
+        self._live = 0
+        self._idf = self._compute_idf()
+        self._matrix: Optional[sparse.csr_matrix] = None  # weighted, normalized rows of the slots it covers
+        self._pending: List[sparse.csr_matrix] = []  # weighted rows of slots added since
+        self._changes = 0
+        self._lock = threading.Lock()
+
+    def _counts(self, text: str) -> sparse.csr_matrix:
+        return self._vectorizer.transform([text]).tocsr()
+
+    def _compute_idf(self) -> np.ndarray:
+        return np.log((1 + self._live) / (1 + self._df)) + 1
+
+    def _weighted(self, counts, idf):
+        weighted = counts.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ weighted
+
+    def _remove(self, i: int):
+        self._df[self._rows[i].indices] -= 1
+        self._rows[i] = None
+        self._entries[i] = None
+        self._live -= 1
+        self._changes += 1
+
+    def _maybe_rebuild(self):
+        if self._changes <= IDF_REFRESH_FRACTION * self._live:
+            return
+        keep = [i for i, row in enumerate(self._rows) if row is not None]
+        self._rows = [self._rows[i] for i in keep]
+        self._entries = [self._entries[i] for i in keep]
+        self._idf = self._compute_idf()
+        self._matrix = self._weighted(sparse.vstack(self._rows).tocsr(), self._idf) if self._rows else None
+        self._pending = []
+        self._changes = 0
+
+    def _similarities(self, query) -> np.ndarray:
+        parts = []
+        if self._matrix is not None:
+            parts.append(self._matrix @ query.T)
+        if self._pending:
+            parts.append(sparse.vstack(self._pending) @ query.T)
+        sims = sparse.vstack(parts).toarray().ravel()
+        sims[[i for i, e in enumerate(self._entries) if e is None]] = -1
+        return sims
+
+    def lookup(self, question: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """Return (result, info) for the most similar cached question above threshold."""
+        with self._lock:
+            now = time.time()
+            for i, e in enumerate(self._entries):
+                if e is not None and e["expires"] < now:
+                    self._remove(i)
+            self._maybe_rebuild()
+            if not self._live:
+                metrics.increment("semantic_cache_misses")
+                return None
+            sims = self._similarities(self._weighted(self._counts(question), self._idf))
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                metrics.increment("semantic_cache_misses")
+                return None
+            entry = self._entries[best]
+            entry["last_hit"] = now
+            metrics.increment("semantic_cache_hits")
+            return entry["result"], {"similarity": float(sims[best]), "question": entry["question"]}
+
+    def store(self, question: str, result: Any):
+        with self._lock:
+            if self._live >= self.max_entries:
+                # Evict the least recently used entry
+                live = [i for i, e in enumerate(self._entries) if e is not None]
+                self._remove(min(live, key=lambda i: self._entries[i]["last_hit"]))
+            counts = self._counts(question)
+            self._df[counts.indices] += 1
+            now = time.time()
+            self._rows.append(counts)
+            self._entries.append({"question": question, "result": result, "expires": now + self.ttl, "last_hit": now})
+            self._pending.append(self._weighted(counts, self._idf))
+            self._live += 1
+            self._changes += 1
+            self._maybe_rebuild()
+
+    def __len__(self):
+        return self._live
+
+
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
@@ -0,0 +1,80 @@
+"""Single-flight deduplication of concurrent identical work.
+
+The first caller for a key starts the work; callers arriving while it is
+still running attach to the same task and receive the same result. Work
+can emit events while it runs (token deltas, SSE stage events): each
+subscriber first gets a replay of what was already emitted, then live
+events. If every waiter goes away, the shared task is cancelled.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from . import metrics, tracing
+
+Emit = Callable[[Any], None]
+
+
+class Flight:
+    def __init__(self):
+        self.events: List[Any] = []
+        self.listeners: List[Emit] = []
+        self.waiters = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def emit(self, event: Any):
+        self.events.append(event)
+        for listener in list(self.listeners):
+            listener(event)
+
+    def subscribe(self, listener: Emit):
+        for event in self.events:
+            listener(event)
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Emit):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        # Used for the "<name>_coalesced" counter
+        self.name = name
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[Emit], Awaitable[Any]], on_event: Optional[Emit] = None) -> Any:
+        """Run `fn(emit)` once per key among concurrent callers; `on_event` receives its events.
+
+        The result object is shared between callers, so copy it before mutating.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = Flight()
+            flight.task = asyncio.ensure_future(fn(flight.emit))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            metrics.increment(f"{self.name}_coalesced")
+            tracing.current().event("coalesced", flight=self.name)
+        if on_event is not None:
+            flight.subscribe(on_event)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Last one interested: stop the shared work too
+                flight.task.cancel()
+                metrics.increment(f"{self.name}_cancelled")
+            raise
+        finally:
+            flight.waiters -= 1
+            if on_event is not None:
+                flight.unsubscribe(on_event)
+
+    def _forget(self, key: Hashable, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
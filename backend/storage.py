@@ -1,86 +1,113 @@
-"""JSON storage for conversations."""
+"""Conversation storage, backed by the implementation chosen in config.STORAGE_BACKEND.
 
-import json, os
-from datetime import datetime
-from pathlib import Path
-from .config import DATA_DIR
+Backends keep each conversation's follow-up history (see history.py) with it;
+`get_conversation` includes it for the council, while the payloads meant
+for clients leave it out.
+"""
 
+from importlib import import_module
+from . import history
+from .config import STORAGE_BACKEND
+from .vrt import compact_vrt, hydrate_vrt
 
-def ensure_dir():
-    Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+BACKENDS = {
+    "json": "backend.storage_json",
+    "sqlite": "backend.storage_sqlite",
+}
 
+_backend = None
 
-def path_for(cid: str):
-    return os.path.join(DATA_DIR, f"{cid}.json")
+
+def use_backend(name):
+    """Switch the active backend ("json" or "sqlite")."""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {name!r}; expected one of {sorted(BACKENDS)}")
+    _backend = import_module(BACKENDS[name])
+    return _backend
+
+
+use_backend(STORAGE_BACKEND)
 
 
 def create_conversation(cid):
-    ensure_dir()
-    convo = {"id": cid, "created_at": datetime.utcnow().isoformat(), "title": "Conversation", "messages": []}
-    with open(path_for(cid), "w") as f:
-        json.dump(convo, f, indent=2)
+    convo = _backend.create_conversation(cid)
+    convo.pop("history", None)
     return convo
 
 
 def get_conversation(cid):
-    p = path_for(cid)
-    if not os.path.exists(p): return None
-    with open(p) as f: return json.load(f)
+    return _backend.get_conversation(cid)
+
+
+def attach_history(cid):
+    """The conversation with a history, building and storing one if it was saved without.
+
+    Conversations from before histories were kept get theirs from the stored
+    messages here, once, so later loads just read it back.
+    """
+    convo = _backend.get_conversation(cid)
+    if convo is None or "history" in convo:
+        return convo
+    convo["history"] = history.from_messages(convo["messages"])
+    _backend.set_history(cid, convo["history"])
+    return convo
+
+
+def get_messages(cid, before=None, limit=None, include_vrt=False):
+    """Conversation metadata plus one page of messages (see vrt.page_messages)."""
+    convo = _backend.get_messages(cid, before, limit, include_vrt)
+    if convo is not None:
+        convo.pop("history", None)
+    if convo is not None and include_vrt:
+        for msg in convo["messages"]:
+            if msg.get("vrt"):
+                msg["vrt"] = hydrate_vrt(msg["vrt"], msg)
+    return convo
+
+
+def get_message_vrt(cid, idx):
+    """Full VRT of one message with node texts resolved, or None."""
+    msg = _backend.get_message(cid, idx)
+    if not msg or not msg.get("vrt"):
+        return None
+    return hydrate_vrt(msg["vrt"], msg)
 
 
-def save(convo):
-    with open(path_for(convo["id"]), "w") as f:
-        json.dump(convo, f, indent=2)
+def list_conversations(offset=0, limit=None, sort_by="created_at", descending=True):
+    return _backend.list_conversations(offset, limit, sort_by, descending)
 
 
-def list_conversations():
-    ensure_dir()
-    out = []
-    for fn in os.listdir(DATA_DIR):
-        if fn.endswith(".json"):
-            with open(os.path.join(DATA_DIR, fn)) as f:
-                d = json.load(f)
-                out.append({
-                    "id": d["id"],
-                    "created_at": d["created_at"],
-                    "title": d["title"],
-                    "message_count": len(d["messages"])
-                })
-    return sorted(out, key=lambda x: x["created_at"], reverse=True)
+def count_conversations():
+    return _backend.count_conversations()
 
 
 def add_user_message(cid, content):
-    convo = get_conversation(cid)
-    convo["messages"].append({"role": "user", "content": content})
-    save(convo)
-
-
-def add_assistant_message(cid, s1, s2, s3, vrt=None):
-    convo = get_conversation(cid)
-    msg = {
-        "role": "assistant",
-        "stage1": s1,
-        "stage2": s2,
-        "stage3": s3
-    }
+    return _backend.add_user_message(cid, content)
+
+
+def add_assistant_message(cid, s1, s2, s3, vrt=None, question=None):
+    """Append the council's answer; with `question`, also extend the conversation history by this turn.
+
+    Turns the council failed to answer are stored but left out of the history.
+    """
+    if not history.answered(s3):
+        question = None
     if vrt:
-        msg["vrt"] = vrt
-    convo["messages"].append(msg)
-    save(convo)
+        vrt = compact_vrt(vrt, {"stage1": s1, "stage2": s2, "stage3": s3})
+    return _backend.add_assistant_message(cid, s1, s2, s3, vrt, question)
 
 
 def update_conversation_title(cid, title):
-    convo = get_conversation(cid)
-    if convo:
-        convo["title"] = title
-        save(convo)
-        return convo
-    return None
+    convo = _backend.update_conversation_title(cid, title)
+    if convo is not None:
+        convo.pop("history", None)
+    return convo
 
 
 def delete_conversation(cid):
-    p = path_for(cid)
-    if os.path.exists(p):
-        os.remove(p)
-        return True
-    return False
+    return _backend.delete_conversation(cid)
+
+
+def import_conversation(convo, overwrite=False):
+    return _backend.import_conversation(convo, overwrite)
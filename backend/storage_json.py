@@ -0,0 +1,292 @@
+"""JSON file storage backend for conversations."""
+
+import heapq
+import json, os
+import threading
+from datetime import datetime
+from pathlib import Path
+from . import history
+from .config import DATA_DIR
+from .vrt import page_messages
+
+# Compact sidecar with id/title/created_at/message_count for every conversation,
+# so listing never has to open the (large) conversation files. Changes are
+# appended to INDEX_LOG and folded into INDEX_FILE once the log outgrows the
+# index, so a write costs one log line rather than rewriting every entry.
+INDEX_FILE = "_index.idx"
+INDEX_LOG = "_index.log"
+INDEX_COMPACT_MIN = 1000
+SORT_FIELDS = ("created_at", "title", "message_count")
+
+_index = None
+_log_entries = 0
+_index_lock = threading.RLock()
+
+
+def ensure_dir():
+    Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+
+
+def path_for(cid: str):
+    return os.path.join(DATA_DIR, f"{cid}.json")
+
+
+def index_path():
+    return os.path.join(DATA_DIR, INDEX_FILE)
+
+
+def log_path():
+    return os.path.join(DATA_DIR, INDEX_LOG)
+
+
+def _meta(convo):
+    return {
+        "id": convo["id"],
+        "created_at": convo["created_at"],
+        "title": convo["title"],
+        "message_count": len(convo["messages"])
+    }
+
+
+def _read_meta(path):
+    try:
+        with open(path) as f:
+            return _meta(json.load(f))
+    except (OSError, json.JSONDecodeError, KeyError) as e:
+        print(f"Skipping unreadable conversation {os.path.basename(path)}: {e}")
+        return None
+
+
+def rebuild_index():
+    """Scan every conversation file once and rewrite the sidecar index."""
+    global _index
+    ensure_dir()
+    index = {}
+    for fn in os.listdir(DATA_DIR):
+        if fn.endswith(".json"):
+            meta = _read_meta(os.path.join(DATA_DIR, fn))
+            if meta is not None:
+                index[meta["id"]] = meta
+    with _index_lock:
+        _index = index
+        _compact()
+    return index
+
+
+def _replay(index):
+    """Apply the change log to `index`; returns the number of entries applied."""
+    applied = 0
+    try:
+        with open(log_path()) as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by a crash
+                if "put" in change:
+                    index[change["put"]["id"]] = change["put"]
+                else:
+                    index.pop(change["drop"], None)
+                applied += 1
+    except FileNotFoundError:
+        pass
+    return applied
+
+
+def _reconcile(index, since):
+    """Bring `index` up to date with conversation files added, removed or modified after `since`."""
+    changed = False
+    on_disk = set()
+    for entry in os.scandir(DATA_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        cid = entry.name[:-5]
+        on_disk.add(cid)
+        if cid not in index or entry.stat().st_mtime > since:
+            meta = _read_meta(entry.path)
+            if meta is not None and meta != index.get(cid):
+                index[cid] = meta
+                changed = True
+    for cid in set(index) - on_disk:
+        del index[cid]
+        changed = True
+    return changed
+
+
+def _load_index():
+    global _index, _log_entries
+    with _index_lock:
+        if _index is not None:
+            return _index
+        ensure_dir()
+        try:
+            with open(index_path()) as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return rebuild_index()
+        _log_entries = _replay(index)
+        # Our own writes land in the log after the conversation file, so a
+        # newer file was edited behind our back
+        since = max(os.path.getmtime(p) for p in (index_path(), log_path()) if os.path.exists(p))
+        _index = index
+        if _reconcile(index, since):
+            _compact()
+        return _index
+
+
+def _write_index():
+    tmp = index_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(_index, f, separators=(",", ":"))
+    os.replace(tmp, index_path())
+
+
+def _compact():
+    """Write the whole index and start an empty log."""
+    global _log_entries
+    _write_index()
+    open(log_path(), "w").close()
+    _log_entries = 0
+
+
+def _log(change):
+    global _log_entries
+    with open(log_path(), "a") as f:
+        f.write(json.dumps(change, separators=(",", ":")) + "\n")
+    _log_entries += 1
+    if _log_entries > max(INDEX_COMPACT_MIN, len(_index)):
+        _compact()
+
+
+def _index_put(convo):
+    _load_index()
+    with _index_lock:
+        meta = _meta(convo)
+        _index[convo["id"]] = meta
+        _log({"put": meta})
+
+
+def _index_drop(cid):
+    _load_index()
+    with _index_lock:
+        if _index.pop(cid, None) is not None:
+            _log({"drop": cid})
+
+
+def _write_file(convo):
+    # Write-then-rename so readers on other threads never see a half-written file
+    p = path_for(convo["id"])
+    tmp = f"{p}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(convo, f, indent=2)
+    os.replace(tmp, p)
+
+
+def create_conversation(cid):
+    ensure_dir()
+    convo = {"id": cid, "created_at": datetime.utcnow().isoformat(), "title": "Conversation", "messages": [],
+             "history": None}
+    _write_file(convo)
+    _index_put(convo)
+    return convo
+
+
+def get_conversation(cid):
+    p = path_for(cid)
+    if not os.path.exists(p): return None
+    with open(p) as f: return json.load(f)
+
+
+def get_messages(cid, before=None, limit=None, include_vrt=False):
+    convo = get_conversation(cid)
+    if convo is None:
+        return None
+    messages = convo.pop("messages")
+    convo["message_count"] = len(messages)
+    convo["messages"] = page_messages(messages, before, limit, include_vrt)
+    return convo
+
+
+def get_message(cid, idx):
+    convo = get_conversation(cid)
+    if convo is None or not 0 <= idx < len(convo["messages"]):
+        return None
+    return convo["messages"][idx]
+
+
+def save(convo):
+    _write_file(convo)
+    _index_put(convo)
+
+
+def count_conversations():
+    return len(_load_index())
+
+
+def list_conversations(offset=0, limit=None, sort_by="created_at", descending=True):
+    """Page over the metadata index; only the requested page is sorted out."""
+    if sort_by not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort conversations by {sort_by!r}")
+    with _index_lock:
+        entries = list(_load_index().values())
+    key = lambda x: x[sort_by]
+    if limit is None:
+        return sorted(entries, key=key, reverse=descending)[offset:]
+    pick = heapq.nlargest if descending else heapq.nsmallest
+    return pick(offset + limit, entries, key=key)[offset:]
+
+
+def add_user_message(cid, content):
+    convo = get_conversation(cid)
+    convo["messages"].append({"role": "user", "content": content})
+    save(convo)
+
+
+def add_assistant_message(cid, s1, s2, s3, vrt=None, question=None):
+    convo = get_conversation(cid)
+    if question is not None:
+        convo["history"] = history.extend(history.of(convo), question, (s3 or {}).get("response", ""))
+    msg = {
+        "role": "assistant",
+        "stage1": s1,
+        "stage2": s2,
+        "stage3": s3
+    }
+    if vrt:
+        msg["vrt"] = vrt
+    convo["messages"].append(msg)
+    save(convo)
+
+
+def set_history(cid, value):
+    convo = get_conversation(cid)
+    if convo is not None:
+        convo["history"] = value
+        _write_file(convo)
+
+
+def update_conversation_title(cid, title):
+    convo = get_conversation(cid)
+    if convo:
+        convo["title"] = title
+        save(convo)
+        return convo
+    return None
+
+
+def import_conversation(convo, overwrite=False):
+    """Store a complete conversation dict as-is (used by migrations)."""
+    if not overwrite and os.path.exists(path_for(convo["id"])):
+        return False
+    ensure_dir()
+    save(convo)
+    return True
+
+
+def delete_conversation(cid):
+    p = path_for(cid)
+    if os.path.exists(p):
+        os.remove(p)
+        _index_drop(cid)
+        return True
+    return False
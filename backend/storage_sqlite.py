@@ -0,0 +1,398 @@
+"""SQLite storage backend for conversations.
+
+Conversations, messages, and VRT nodes/edges live in separate rows, so
+appending a turn is a handful of INSERTs instead of rewriting the whole
+conversation. The database runs in WAL mode: every write goes through a
+single writer thread, while reads use per-thread connections.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from . import history
+from .config import SQLITE_PATH
+from .vrt import slim_message
+
+SORT_FIELDS = ("created_at", "title", "message_count")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    title TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS conversations_created_at ON conversations (created_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT,
+    stage1 TEXT,
+    stage2 TEXT,
+    stage3 TEXT,
+    extra TEXT,
+    PRIMARY KEY (conversation_id, idx)
+);
+
+CREATE TABLE IF NOT EXISTS vrts (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    message_idx INTEGER NOT NULL,
+    meta TEXT NOT NULL,
+    PRIMARY KEY (conversation_id, message_idx)
+);
+
+CREATE TABLE IF NOT EXISTS vrt_nodes (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    message_idx INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    node_id TEXT NOT NULL,
+    type TEXT,
+    model TEXT,
+    role TEXT,
+    text TEXT,
+    parent_ids TEXT,
+    extra TEXT,
+    PRIMARY KEY (conversation_id, message_idx, seq)
+);
+
+CREATE TABLE IF NOT EXISTS vrt_edges (
+    conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    message_idx INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    from_id TEXT,
+    to_id TEXT,
+    relation TEXT,
+    PRIMARY KEY (conversation_id, message_idx, seq)
+);
+"""
+
+CONVERSATION_KEYS = ("id", "created_at", "title", "messages")
+MESSAGE_KEYS = ("role", "content", "stage1", "stage2", "stage3", "vrt")
+NODE_KEYS = ("id", "type", "model", "role", "text", "parent_ids")
+
+_local = threading.local()
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect():
+    """Per-thread connection to SQLITE_PATH (the writer thread gets its own too)."""
+    path = SQLITE_PATH
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == path:
+        return conn
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    with _schema_lock:
+        if path not in _schema_ready:
+            conn.executescript(SCHEMA)
+            _schema_ready.add(path)
+    _local.conn = conn
+    _local.path = path
+    return conn
+
+
+def _write(fn, *args):
+    """Run `fn(conn, *args)` in one transaction on the writer thread and wait for it."""
+    def run():
+        conn = _connect()
+        with conn:
+            return fn(conn, *args)
+    return _writer.submit(run).result()
+
+
+def _dumps(value):
+    return None if value is None else json.dumps(value)
+
+
+def _loads(value):
+    return None if value is None else json.loads(value)
+
+
+def _extra(d, known):
+    rest = {k: v for k, v in d.items() if k not in known}
+    return _dumps(rest) if rest else None
+
+
+# --- writes -----------------------------------------------------------------
+
+def _insert_conversation(conn, convo):
+    conn.execute(
+        "INSERT INTO conversations (id, created_at, title, message_count, extra) VALUES (?, ?, ?, 0, ?)",
+        (convo["id"], convo["created_at"], convo["title"], _extra(convo, CONVERSATION_KEYS)),
+    )
+
+
+def _append_message(conn, cid, msg):
+    row = conn.execute("SELECT message_count FROM conversations WHERE id = ?", (cid,)).fetchone()
+    if row is None:
+        raise KeyError(cid)
+    idx = row["message_count"]
+    conn.execute(
+        "INSERT INTO messages (conversation_id, idx, role, content, stage1, stage2, stage3, extra) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            cid, idx, msg["role"], msg.get("content"),
+            _dumps(msg.get("stage1")), _dumps(msg.get("stage2")), _dumps(msg.get("stage3")),
+            _extra(msg, MESSAGE_KEYS),
+        ),
+    )
+    vrt = msg.get("vrt")
+    if vrt:
+        _insert_vrt(conn, cid, idx, vrt)
+    conn.execute("UPDATE conversations SET message_count = message_count + 1 WHERE id = ?", (cid,))
+    return idx
+
+
+def _insert_vrt(conn, cid, idx, vrt):
+    meta = {k: v for k, v in vrt.items() if k not in ("nodes", "edges")}
+    conn.execute(
+        "INSERT INTO vrts (conversation_id, message_idx, meta) VALUES (?, ?, ?)",
+        (cid, idx, json.dumps(meta)),
+    )
+    conn.executemany(
+        "INSERT INTO vrt_nodes (conversation_id, message_idx, seq, node_id, type, model, role, text, parent_ids, extra) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                cid, idx, seq, n["id"], n.get("type"), n.get("model"), n.get("role"), n.get("text"),
+                _dumps(n.get("parent_ids", [])), _extra(n, NODE_KEYS),
+            )
+            for seq, n in enumerate(vrt.get("nodes", []))
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO vrt_edges (conversation_id, message_idx, seq, from_id, to_id, relation) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (cid, idx, seq, e.get("from"), e.get("to"), e.get("relation"))
+            for seq, e in enumerate(vrt.get("edges", []))
+        ],
+    )
+
+
+def _extend_history(conn, cid, question, answer):
+    """Add a turn to the history kept in the conversation's `extra` column."""
+    row = conn.execute("SELECT extra FROM conversations WHERE id = ?", (cid,)).fetchone()
+    if row is None:
+        raise KeyError(cid)
+    extra = _loads(row["extra"]) or {}
+    previous = extra.get("history")
+    if "history" not in extra:
+        # Conversation from before histories were kept: build it once from the messages
+        rows = conn.execute("SELECT * FROM messages WHERE conversation_id = ? ORDER BY idx", (cid,))
+        previous = history.from_messages([_message(m, None) for m in rows])
+    extra["history"] = history.extend(previous, question, answer)
+    conn.execute("UPDATE conversations SET extra = ? WHERE id = ?", (json.dumps(extra), cid))
+
+
+def _import(conn, convo, overwrite):
+    exists = conn.execute("SELECT 1 FROM conversations WHERE id = ?", (convo["id"],)).fetchone()
+    if exists:
+        if not overwrite:
+            return False
+        conn.execute("DELETE FROM conversations WHERE id = ?", (convo["id"],))
+    _insert_conversation(conn, convo)
+    for msg in convo.get("messages", []):
+        _append_message(conn, convo["id"], msg)
+    return True
+
+
+def create_conversation(cid):
+    convo = {"id": cid, "created_at": datetime.utcnow().isoformat(), "title": "Conversation", "messages": [],
+             "history": None}
+    _write(_insert_conversation, convo)
+    return convo
+
+
+def add_user_message(cid, content):
+    _write(_append_message, cid, {"role": "user", "content": content})
+
+
+def add_assistant_message(cid, s1, s2, s3, vrt=None, question=None):
+    msg = {
+        "role": "assistant",
+        "stage1": s1,
+        "stage2": s2,
+        "stage3": s3
+    }
+    if vrt:
+        msg["vrt"] = vrt
+
+    def append(conn):
+        if question is not None:
+            _extend_history(conn, cid, question, (s3 or {}).get("response", ""))
+        return _append_message(conn, cid, msg)
+    _write(append)
+
+
+def set_history(cid, value):
+    def update(conn):
+        row = conn.execute("SELECT extra FROM conversations WHERE id = ?", (cid,)).fetchone()
+        if row is not None:
+            extra = _loads(row["extra"]) or {}
+            extra["history"] = value
+            conn.execute("UPDATE conversations SET extra = ? WHERE id = ?", (json.dumps(extra), cid))
+    _write(update)
+
+
+def update_conversation_title(cid, title):
+    def update(conn):
+        return conn.execute("UPDATE conversations SET title = ? WHERE id = ?", (title, cid)).rowcount
+    if not _write(update):
+        return None
+    return get_conversation(cid)
+
+
+def delete_conversation(cid):
+    def delete(conn):
+        return conn.execute("DELETE FROM conversations WHERE id = ?", (cid,)).rowcount
+    return bool(_write(delete))
+
+
+def import_conversation(convo, overwrite=False):
+    """Store a complete conversation dict (used by the JSON -> SQLite migration)."""
+    return _write(_import, convo, overwrite)
+
+
+# --- reads ------------------------------------------------------------------
+
+def _node(row):
+    node = {
+        "id": row["node_id"],
+        "type": row["type"],
+        "model": row["model"],
+        "role": row["role"],
+        "text": row["text"],
+        "parent_ids": _loads(row["parent_ids"]) or [],
+    }
+    node.update(_loads(row["extra"]) or {})
+    return node
+
+
+def _vrts(conn, cid, start=0, end=None):
+    end = 2 ** 62 if end is None else end
+    bounds = (cid, start, end)
+    vrts = {}
+    for row in conn.execute(
+        "SELECT message_idx, meta FROM vrts WHERE conversation_id = ? AND message_idx >= ? AND message_idx < ?", bounds
+    ):
+        vrt = json.loads(row["meta"])
+        vrt["nodes"] = []
+        vrt["edges"] = []
+        vrts[row["message_idx"]] = vrt
+    if not vrts:
+        return vrts
+    for row in conn.execute(
+        "SELECT * FROM vrt_nodes WHERE conversation_id = ? AND message_idx >= ? AND message_idx < ? "
+        "ORDER BY message_idx, seq",
+        bounds,
+    ):
+        vrts[row["message_idx"]]["nodes"].append(_node(row))
+    for row in conn.execute(
+        "SELECT message_idx, from_id, to_id, relation FROM vrt_edges "
+        "WHERE conversation_id = ? AND message_idx >= ? AND message_idx < ? ORDER BY message_idx, seq",
+        bounds,
+    ):
+        vrts[row["message_idx"]]["edges"].append({"from": row["from_id"], "to": row["to_id"], "relation": row["relation"]})
+    return vrts
+
+
+def _message(row, vrt):
+    msg = {"role": row["role"]}
+    if row["role"] == "user":
+        msg["content"] = row["content"]
+    else:
+        msg["stage1"] = _loads(row["stage1"])
+        msg["stage2"] = _loads(row["stage2"])
+        msg["stage3"] = _loads(row["stage3"])
+        if row["content"] is not None:
+            msg["content"] = row["content"]
+    if vrt is not None:
+        msg["vrt"] = vrt
+    msg.update(_loads(row["extra"]) or {})
+    return msg
+
+
+def get_conversation(cid):
+    conn = _connect()
+    row = conn.execute("SELECT * FROM conversations WHERE id = ?", (cid,)).fetchone()
+    if row is None:
+        return None
+    convo = {"id": row["id"], "created_at": row["created_at"], "title": row["title"]}
+    convo.update(_loads(row["extra"]) or {})
+    vrts = _vrts(conn, cid)
+    convo["messages"] = [
+        _message(m, vrts.get(m["idx"]))
+        for m in conn.execute("SELECT * FROM messages WHERE conversation_id = ? ORDER BY idx", (cid,))
+    ]
+    return convo
+
+
+def get_messages(cid, before=None, limit=None, include_vrt=False):
+    """One page of messages; VRT rows are only read when asked for."""
+    conn = _connect()
+    row = conn.execute("SELECT * FROM conversations WHERE id = ?", (cid,)).fetchone()
+    if row is None:
+        return None
+    count = row["message_count"]
+    end = count if before is None else max(0, min(before, count))
+    start = 0 if limit is None else max(0, end - limit)
+    convo = {"id": row["id"], "created_at": row["created_at"], "title": row["title"]}
+    convo.update(_loads(row["extra"]) or {})
+    convo["message_count"] = count
+    rows = conn.execute(
+        "SELECT * FROM messages WHERE conversation_id = ? AND idx >= ? AND idx < ? ORDER BY idx", (cid, start, end)
+    ).fetchall()
+    if include_vrt:
+        vrts = _vrts(conn, cid, start, end)
+        convo["messages"] = [dict(_message(m, vrts.get(m["idx"])), index=m["idx"]) for m in rows]
+    else:
+        with_vrt = {
+            r[0] for r in conn.execute(
+                "SELECT message_idx FROM vrts WHERE conversation_id = ? AND message_idx >= ? AND message_idx < ?",
+                (cid, start, end),
+            )
+        }
+        convo["messages"] = []
+        for m in rows:
+            msg = slim_message(_message(m, None), m["idx"])
+            if m["role"] == "assistant":
+                msg["has_vrt"] = m["idx"] in with_vrt
+            convo["messages"].append(msg)
+    return convo
+
+
+def get_message(cid, idx):
+    conn = _connect()
+    row = conn.execute("SELECT * FROM messages WHERE conversation_id = ? AND idx = ?", (cid, idx)).fetchone()
+    if row is None:
+        return None
+    return _message(row, _vrts(conn, cid, idx, idx + 1).get(idx))
+
+
+def count_conversations():
+    return _connect().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+
+def list_conversations(offset=0, limit=None, sort_by="created_at", descending=True):
+    if sort_by not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort conversations by {sort_by!r}")
+    sql = (
+        "SELECT id, created_at, title, message_count FROM conversations "
+        f"ORDER BY {sort_by} {'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?"
+    )
+    rows = _connect().execute(sql, (-1 if limit is None else limit, offset))
+    return [dict(r) for r in rows]
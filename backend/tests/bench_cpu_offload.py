@@ -0,0 +1,94 @@
+"""Event-loop lag from CPU-bound post-processing under concurrent streams.
+
+Every client streams its own question through /api/conversations/stream
+while the local mock upstream answers with long texts (tens of KB per
+Stage 1 answer), so analytics tokenizing, ranking parsing and serializing
+the stage payloads are real work. A probe task measures how late the loop
+wakes it up. Runs with the post-processing inline on the loop ("before"),
+then on a thread pool and on a process pool (see backend/compute.py).
+
+    python -m backend.tests.bench_cpu_offload --clients 16 --answer-kb 40
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from backend import main as main_module
+from backend import compute, metrics, openrouter, storage, storage_json
+from backend.main import app
+from backend.tests.mock_upstream import MockUpstream
+
+
+async def probe_lag(samples, stop, interval=0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_mode(kind, clients, workers):
+    compute.configure(kind, workers)
+    # Spawn and warm process workers before measuring
+    await asyncio.gather(*[compute.run_cpu(int) for _ in range(workers)])
+    samples, stop = [], asyncio.Event()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        cids = [(await client.post("/api/conversations")).json()["id"] for _ in range(clients)]
+        probe = asyncio.create_task(probe_lag(samples, stop))
+        start = time.perf_counter()
+        try:
+            responses = await asyncio.gather(*[
+                client.post(f"/api/conversations/stream?cid={cid}", json={"content": f"{kind} question {i}"})
+                for i, cid in enumerate(cids)
+            ])
+        finally:
+            wall = time.perf_counter() - start
+            stop.set()
+            await probe
+    compute.shutdown()
+    samples.sort()
+    return {
+        "mode": kind,
+        "clients": clients,
+        "ok": sum(1 for r in responses if r.status_code == 200 and '"complete"' in r.text),
+        "wall_s": round(wall, 3),
+        "lag_p50_ms": round(statistics.median(samples) * 1000, 2),
+        "lag_p99_ms": round(samples[int(0.99 * (len(samples) - 1))] * 1000, 2),
+        "lag_max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    storage.use_backend("json")
+    storage_json.DATA_DIR = tmp
+    storage_json._index = None
+    metrics.METRICS_DIR = tmp
+    openrouter.response_cache = None
+    openrouter.limiter = None  # measure the loop, not upstream throttling
+    main_module.admission.max_active = 0
+
+    results = []
+    async with MockUpstream(latency=args.latency, response_chars=args.answer_kb * 1024,
+                            chunk_chars=4096) as upstream:
+        openrouter.OPENROUTER_API_URL = upstream.url
+        for kind in ("inline", "thread", "process"):
+            results.append(await run_mode(kind, args.clients, args.workers))
+        await openrouter.close_client()
+
+    print(json.dumps({"answer_kb": args.answer_kb, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop lag with CPU post-processing inline vs offloaded")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--answer-kb", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
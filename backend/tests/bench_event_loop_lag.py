@@ -0,0 +1,108 @@
+"""Event-loop lag under concurrent /api/conversations/stream clients.
+
+Each client streams into its own conversation that already holds a large
+history, so every storage call reads and rewrites megabytes of JSON. The app
+runs in-process against the local mock upstream; a probe task measures how
+late the loop wakes it up. Runs once with storage inline on the loop
+("before") and once through the async_storage worker pool ("after").
+
+    python -m backend.tests.bench_event_loop_lag --clients 16 --history-kb 4000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from backend import async_storage, metrics, openrouter, storage, storage_json
+from backend import main as main_module
+from backend.main import app
+from backend.tests.mock_upstream import MockUpstream
+
+
+def seed_conversations(count, history_kb):
+    filler = "x" * 1024
+    history = []
+    for i in range(history_kb // 2):
+        history.append({"role": "user", "content": filler})
+        history.append({"role": "assistant", "stage1": [], "stage2": [], "stage3": {"model": "m", "response": filler}})
+    cids = []
+    for _ in range(count):
+        cid = str(uuid.uuid4())
+        convo = storage.create_conversation(cid)
+        convo["messages"] = list(history)
+        storage.import_conversation(convo, overwrite=True)
+        cids.append(cid)
+    return cids
+
+
+async def probe_lag(samples, stop, interval=0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_mode(cids, offload):
+    saved = async_storage._executor
+    if not offload:
+        async_storage._executor = None
+    samples, stop = [], asyncio.Event()
+    probe = asyncio.create_task(probe_lag(samples, stop))
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[
+                # Distinct questions, so concurrent runs are not coalesced into one
+                client.post(f"/api/conversations/stream?cid={cid}", json={"content": f"benchmark question {i}"})
+                for i, cid in enumerate(cids)
+            ])
+            wall = time.perf_counter() - start
+    finally:
+        stop.set()
+        await probe
+        async_storage._executor = saved
+    samples.sort()
+    return {
+        "mode": "worker_pool" if offload else "inline",
+        "clients": len(cids),
+        "ok": sum(1 for r in responses if r.status_code == 200 and '"complete"' in r.text),
+        "wall_s": round(wall, 3),
+        "lag_p50_ms": round(statistics.median(samples) * 1000, 2),
+        "lag_p99_ms": round(samples[int(0.99 * (len(samples) - 1))] * 1000, 2),
+        "lag_max_ms": round(samples[-1] * 1000, 2),
+    }
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    storage.use_backend("json")
+    storage_json.DATA_DIR = tmp
+    storage_json._index = None
+    metrics.METRICS_DIR = tmp
+    openrouter.response_cache = None  # the mock gives every question the same answers
+    openrouter.limiter = None  # measure storage, not upstream throttling
+    main_module.admission.max_active = 0
+    cids = seed_conversations(args.clients * 2, args.history_kb)
+
+    async with MockUpstream(latency=args.latency) as upstream:
+        openrouter.OPENROUTER_API_URL = upstream.url
+        before = await run_mode(cids[: args.clients], offload=False)
+        after = await run_mode(cids[args.clients:], offload=True)
+        await openrouter.close_client()
+
+    print(json.dumps({"history_kb": args.history_kb, "before": before, "after": after}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop lag under concurrent stream clients")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--history-kb", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
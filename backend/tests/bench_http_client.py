@@ -0,0 +1,92 @@
+"""Per-turn latency and connection count: fresh AsyncClient per call vs the shared pool.
+
+Runs entirely against the local mock upstream, so it measures client overhead
+rather than OpenRouter queueing. `--connect-delay` emulates the TLS handshake
+cost that a plain-TCP mock does not have.
+
+    python -m backend.tests.bench_http_client --turns 20 --concurrency 8 --connect-delay 0.03
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from backend import openrouter, metrics
+from backend.tests.mock_upstream import MockUpstream
+
+# One council turn: Stage 1 (4), CLCC (4), Stage 2 rankers (3), chairman (1)
+TURN_SHAPE = [4, 4, 3, 1]
+
+
+async def legacy_query(url, model, messages):
+    """The pre-pooling code path: a new client (and connection) per call."""
+    async with httpx.AsyncClient() as client:
+        resp = await client.post(url, json={"model": model, "messages": messages}, timeout=60.0)
+        resp.raise_for_status()
+        return resp.json()["choices"][0]["message"]
+
+
+async def run_turn(query_fn):
+    messages = [{"role": "user", "content": "benchmark question"}]
+    start = time.perf_counter()
+    for width in TURN_SHAPE:
+        await asyncio.gather(*[query_fn(f"mock/model-{i}", messages) for i in range(width)])
+    return time.perf_counter() - start
+
+
+async def run_mode(upstream, query_fn, turns, concurrency):
+    upstream.reset_counters()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            return await run_turn(query_fn)
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[one() for _ in range(turns)])
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "turns": turns,
+        "wall_s": round(wall, 4),
+        "turn_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "turn_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+        "requests": upstream.requests,
+        "connections": upstream.connections,
+        "connections_per_turn": round(upstream.connections / turns, 2),
+    }
+
+
+async def main(args):
+    metrics.METRICS_DIR = tempfile.mkdtemp()
+    openrouter.limiter = None  # compare connection handling only
+    async with MockUpstream(latency=args.latency, connect_delay=args.connect_delay) as upstream:
+        openrouter.OPENROUTER_API_URL = upstream.url
+
+        before = await run_mode(
+            upstream, lambda m, msgs: legacy_query(upstream.url, m, msgs), args.turns, args.concurrency
+        )
+
+        openrouter.init_client()
+        try:
+            after = await run_mode(
+                upstream, lambda m, msgs: openrouter.query_model(m, msgs, use_cache=False), args.turns, args.concurrency
+            )
+        finally:
+            await openrouter.close_client()
+
+    print(json.dumps({"before": before, "after": after}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared HTTP client benchmark")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--connect-delay", type=float, default=0.03)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+"""Load test against a rate-limited mock upstream.
+
+The mock enforces a per-model token bucket and answers 429 + Retry-After
+beyond it, like the free OpenRouter tiers. Part one fires a burst of
+concurrent `query_model` calls with no client-side limiting or retries
+("before") and then through the upstream limiter with Retry-After-aware
+retries ("after"). Part two sends concurrent council requests to the app
+with small admission limits and counts 200 vs 503 answers.
+
+    python -m backend.tests.bench_rate_limit --calls 60 --rate 5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from backend import main as main_module
+from backend import metrics, openrouter, ratelimit, storage, storage_json
+from backend.main import app
+from backend.tests.mock_upstream import MockUpstream
+
+MODELS = ["deepseek/deepseek-chat", "qwen/qwen-2.5-7b-instruct", "mistralai/mistral-nemo"]
+
+
+def _latency_stats(latencies):
+    if not latencies:
+        return {}
+    latencies = sorted(latencies)
+    return {
+        "p50": round(statistics.median(latencies), 3),
+        "p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+    }
+
+
+async def burst(upstream, calls):
+    upstream.reset_counters()
+
+    async def one(i):
+        start = time.perf_counter()
+        messages = [{"role": "user", "content": f"question {i}"}]
+        resp = await openrouter.query_model(MODELS[i % len(MODELS)], messages, use_cache=False)
+        return resp is not None, time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[one(i) for i in range(calls)])
+    return {
+        "succeeded": sum(ok for ok, _ in results),
+        "failed": sum(not ok for ok, _ in results),
+        "upstream_429s": upstream.rate_limited,
+        "upstream_requests": upstream.requests,
+        "wall_seconds": round(time.perf_counter() - start, 2),
+        "latency": _latency_stats([t for ok, t in results if ok]),
+    }
+
+
+async def admission_run(clients, max_active, max_queue):
+    main_module.admission = ratelimit.AdmissionController(max_active, max_queue, queue_timeout=30)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        cids = [(await client.post("/api/conversations")).json()["id"] for _ in range(clients)]
+        responses = await asyncio.gather(*[
+            client.post(f"/api/conversations/{cid}/message", json={"content": f"question {i}"})
+            for i, cid in enumerate(cids)
+        ])
+    codes = [r.status_code for r in responses]
+    return {
+        "clients": clients,
+        "max_active": max_active,
+        "max_queue": max_queue,
+        "ok": codes.count(200),
+        "rejected_503": codes.count(503),
+        "retry_after": sorted({r.headers.get("retry-after") for r in responses if r.status_code == 503}),
+    }
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    metrics.METRICS_DIR = tmp
+    storage.use_backend("json")
+    storage_json.DATA_DIR = tmp
+    storage_json._index = None
+    openrouter.response_cache = None
+    async with MockUpstream(latency=args.latency, rate_limit=args.rate, rate_burst=args.burst) as upstream:
+        openrouter.OPENROUTER_API_URL = upstream.url
+
+        openrouter.limiter = None
+        retries = openrouter.UPSTREAM_MAX_RETRIES
+        openrouter.UPSTREAM_MAX_RETRIES = 0
+        before = await burst(upstream, args.calls)
+
+        openrouter.UPSTREAM_MAX_RETRIES = retries
+        openrouter.limiter = ratelimit.UpstreamLimiter(model_rpm=args.rate * 60, model_burst=args.burst)
+        after = await burst(upstream, args.calls)
+
+        upstream.rate_limit = 0
+        admission = await admission_run(args.clients, args.max_active, args.max_queue)
+        await openrouter.close_client()
+
+    print(json.dumps({"before": before, "after": after, "admission": admission,
+                      "counters": metrics.counters()}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rate limiting and admission control load test")
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--rate", type=float, default=5.0, help="mock upstream requests/s per model")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--clients", type=int, default=12)
+    parser.add_argument("--max-active", type=int, default=2)
+    parser.add_argument("--max-queue", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
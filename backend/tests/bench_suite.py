@@ -0,0 +1,220 @@
+"""Offline end-to-end benchmark against the deterministic mock upstream.
+
+Starts the mock OpenRouter and the app (in-process uvicorn, real HTTP, so
+SSE events arrive as they are sent), then drives POST /message and
+/conversations/stream at a fixed concurrency. Reports throughput, end-to-end
+p50/p95/p99, per-stage latency from the stream events, event-loop lag and
+upstream/app counters as JSON, for comparing runs over time.
+
+    python -m backend.tests.bench_suite --requests 40 --concurrency 8 --output bench.json
+    python -m backend.tests.bench_suite --latency 0.5 --jitter 0.4 --failure-rate 0.05 \\
+        --model-latency deepseek/deepseek-r1=2.0 --replay data/conversations
+
+Upstream latency is log-normal around --latency (sigma --jitter); --profiles
+takes a JSON file of per-model overrides as accepted by MockUpstream.
+Without --app-limits the upstream limiter and admission control are off, so
+the numbers show the council path rather than the configured throttling.
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+from backend import main as main_module
+from backend import metrics, openrouter, storage, storage_json, storage_sqlite
+from backend.main import app
+from backend.tests.mock_upstream import MockUpstream, load_recorded
+
+# Stream events whose arrival time is recorded, in the order they happen
+MARKS = ("stage1_complete", "stage2_complete", "stage3_delta", "stage3_complete", "complete")
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 4)
+
+    return {"count": len(values), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": round(values[-1], 4)}
+
+
+async def probe_lag(samples, stop, interval=0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def one_message(client, cid, question):
+    start = time.perf_counter()
+    r = await client.post(f"/api/conversations/{cid}/message", json={"content": question})
+    return {"status": r.status_code, "total": time.perf_counter() - start}
+
+
+async def one_stream(client, cid, question):
+    start = time.perf_counter()
+    marks = {}
+    status = None
+    async with client.stream("POST", f"/api/conversations/stream?cid={cid}", json={"content": question}) as r:
+        status = r.status_code
+        async for line in r.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            kind = json.loads(line[6:]).get("type")
+            if kind in MARKS and kind not in marks:
+                marks[kind] = time.perf_counter() - start
+            if kind == "error":
+                status = "error"
+    if status == 200 and "complete" not in marks:
+        status = "incomplete"
+    return {"status": status, "total": time.perf_counter() - start, "marks": marks}
+
+
+def stage_latencies(results):
+    """Per-stage durations from stream event times (Stage 3 split into first token and the rest)."""
+    spans = {
+        "stage1": (None, "stage1_complete"),
+        "stage2": ("stage1_complete", "stage2_complete"),
+        "stage3_first_token": ("stage2_complete", "stage3_delta"),
+        "stage3": ("stage2_complete", "stage3_complete"),
+        "finalize": ("stage3_complete", "complete"),
+    }
+    out = {}
+    for name, (begin, end) in spans.items():
+        values = [r["marks"][end] - (r["marks"][begin] if begin else 0.0)
+                  for r in results if end in r["marks"] and (begin is None or begin in r["marks"])]
+        if values:
+            out[name] = percentiles(values)
+    return out
+
+
+async def run_load(client, upstream, mode, requests, concurrency):
+    cids = [(await client.post("/api/conversations")).json()["id"] for _ in range(requests)]
+    upstream.reset_counters()
+    before = metrics.counters()
+    sem = asyncio.Semaphore(concurrency)
+    send = one_stream if mode == "stream" else one_message
+
+    async def worker(i):
+        async with sem:
+            try:
+                return await send(client, cids[i], f"{mode} benchmark question {i}: how do tides work?")
+            except httpx.HTTPError as e:
+                return {"status": type(e).__name__, "total": None}
+
+    samples, stop = [], asyncio.Event()
+    probe = asyncio.create_task(probe_lag(samples, stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*[worker(i) for i in range(requests)])
+    wall = time.perf_counter() - start
+    stop.set()
+    await probe
+
+    ok = [r for r in results if r["status"] == 200]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    after = metrics.counters()
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "statuses": statuses,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "latency_s": percentiles([r["total"] for r in ok]),
+        "event_loop_lag_ms": percentiles([lag * 1000 for lag in samples]),
+        "upstream": {"requests": upstream.requests, "failures": upstream.failed, "connections": upstream.connections},
+        "counters": {k: v - before.get(k, 0) for k, v in after.items() if v != before.get(k, 0)},
+    }
+    if mode == "stream":
+        report["stages_s"] = stage_latencies(ok)
+    return report
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _profiles(args):
+    profiles = {}
+    if args.profiles:
+        with open(args.profiles) as f:
+            profiles = json.load(f)
+    for spec in args.model_latency:
+        model, _, seconds = spec.partition("=")
+        profiles.setdefault(model, {})["latency"] = float(seconds)
+    return profiles
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    storage_json.DATA_DIR = tmp
+    storage_json._index = None
+    storage_sqlite.SQLITE_PATH = f"{tmp}/council.db"
+    storage.use_backend(args.storage)
+    metrics.METRICS_DIR = tmp
+    if not args.app_limits:
+        openrouter.limiter = None
+        main_module.admission.max_active = 0
+
+    recorded = load_recorded(args.replay) if args.replay else None
+    upstream = MockUpstream(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                            response_chars=args.response_chars, token_delay=args.token_delay,
+                            chunk_chars=args.chunk_chars, profiles=_profiles(args), recorded=recorded, seed=args.seed)
+    async with upstream:
+        openrouter.OPENROUTER_API_URL = upstream.url
+        port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout) as client:
+                modes = ["message", "stream"] if args.mode == "both" else [args.mode]
+                results = {mode: await run_load(client, upstream, mode, args.requests, args.concurrency)
+                           for mode in modes}
+        finally:
+            server.should_exit = True
+            await serving
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    config["replayed_texts"] = sum(len(ts) for by_model in (recorded or {}).values() for ts in by_model.values())
+    report = {"timestamp": time.time(), "config": config, "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline council benchmark against the mock upstream")
+    parser.add_argument("--mode", choices=["message", "stream", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="median upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal sigma of the upstream latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, default=2000)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--chunk-chars", type=int, default=64)
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS")
+    parser.add_argument("--profiles", help="JSON file of per-model mock settings")
+    parser.add_argument("--replay", help="replay recorded answers from this conversations directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--app-limits", action="store_true", help="keep the upstream limiter and admission control")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="also write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
@@ -1,3 +1,8 @@
+"""Smoke test against a running server (port 8008) and the real OpenRouter.
+
+For repeatable numbers use bench_suite.py, which runs against the local mock.
+"""
+
 import asyncio
 import httpx
 import json
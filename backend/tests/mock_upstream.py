@@ -0,0 +1,318 @@
+"""Minimal local stand-in for the OpenRouter chat completions endpoint.
+
+Speaks just enough HTTP/1.1 (keep-alive, Content-Length bodies, chunked SSE
+for `"stream": true`) to serve `query_model`, and counts TCP connections so
+benchmarks can see reuse.
+
+Latency can follow a log-normal distribution around its median (`jitter`
+is the sigma), calls can fail at a given rate, and `profiles` override
+latency, jitter, failure rate and response size per model. Random draws
+depend only on `seed`, the model, the prompt and how often that prompt
+was seen, so a run is reproducible however requests interleave. With
+`recorded` (see `load_recorded`), answers are replayed from stored
+conversations instead of filler text.
+
+    python -m backend.tests.mock_upstream --port 9100 --latency 0.05
+    OPENROUTER_API_URL=http://127.0.0.1:9100/api/v1/chat/completions uvicorn backend.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+import zlib
+
+
+class MockUpstream:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, connect_delay=0.0, response_chars=400,
+                 token_delay=0.0, chunk_chars=16, model_latency=None, rate_limit=0.0, rate_burst=1,
+                 jitter=0.0, failure_rate=0.0, failure_status=500, profiles=None, recorded=None, seed=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        # Per-model overrides of `latency`, e.g. {"deepseek/deepseek-r1": 3.0}
+        self.model_latency = model_latency or {}
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        # Per-model overrides of latency/jitter/failure_rate/response_chars,
+        # e.g. {"deepseek/deepseek-r1": {"latency": 3.0, "failure_rate": 0.1}}
+        self.profiles = profiles or {}
+        # {"answer" | "critique" | "ranking" | "synthesis": {model: [texts]}}
+        self.recorded = recorded or {}
+        self.seed = seed
+        self._seen = {}
+        # Extra delay on every new connection, standing in for a TLS handshake
+        self.connect_delay = connect_delay
+        self.response_chars = response_chars
+        # Streaming: one SSE chunk of `chunk_chars` every `token_delay` seconds
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        # Per-model token bucket like the free tiers: `rate_limit` requests/s
+        # (0 = unlimited) with bursts of `rate_burst`; excess gets 429 + Retry-After
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self._buckets = {}
+        self.connections = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/api/v1/chat/completions"
+
+    def reset_counters(self):
+        self.connections = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self._buckets = {}
+        self._seen = {}
+
+    def _setting(self, model, name):
+        profile = self.profiles.get(model, {})
+        if name in profile:
+            return profile[name]
+        if name == "latency":
+            return self.model_latency.get(model, self.latency)
+        return getattr(self, name)
+
+    def _rng(self, model, prompt):
+        """Random source for one request, independent of the order requests arrive in."""
+        key = (model, zlib.crc32(prompt.encode()))
+        self._seen[key] = self._seen.get(key, 0) + 1
+        return random.Random(f"{self.seed}:{model}:{key[1]}:{self._seen[key]}")
+
+    def _retry_after(self, model):
+        """None if `model` may be served now, else seconds until its next token."""
+        if not self.rate_limit:
+            return None
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(model, (self.rate_burst, now))
+        tokens = min(self.rate_burst, tokens + (now - updated) * self.rate_limit)
+        if tokens < 1:
+            self._buckets[model] = (tokens, now)
+            return (1 - tokens) / self.rate_limit
+        self._buckets[model] = (tokens - 1, now)
+        return None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def completion(self, body):
+        model = body.get("model", "mock/model")
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        text = self._recorded_text(model, prompt)
+        if text is None:
+            chars = self._setting(model, "response_chars")
+            text = (f"[{model}] " + "lorem ipsum dolor sit amet " * (chars // 27 + 1))[:chars]
+        if "FINAL RANKING:" in prompt and "FINAL RANKING:" not in text:
+            # Answer ranking prompts in the requested format, each model with its own order
+            labels = list(dict.fromkeys(re.findall(r"^Response ([A-Z]) \(", prompt, re.M)))
+            shift = zlib.crc32(model.encode()) % max(1, len(labels))
+            order = labels[shift:] + labels[:shift]
+            text += "\n\nFINAL RANKING:\n" + "\n".join(f"{i}. Response {L}" for i, L in enumerate(order, 1))
+        return {
+            "id": f"mock-{self.requests}",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": (len(prompt) + len(text)) // 4,
+            },
+        }
+
+    def _recorded_text(self, model, prompt):
+        if not self.recorded:
+            return None
+        if "FINAL RANKING:" in prompt:
+            kind = "ranking"
+        elif "synthesized final answer" in prompt:
+            kind = "synthesis"
+        elif "Critique the following" in prompt:
+            kind = "critique"
+        else:
+            kind = "answer"
+        by_model = self.recorded.get(kind) or self.recorded.get("answer") or {}
+        texts = by_model.get(model) or [t for ts in by_model.values() for t in ts]
+        if not texts:
+            return None
+        return texts[zlib.crc32(prompt.encode()) % len(texts)]
+
+    async def _write_stream(self, writer, completion):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"\r\n"
+        )
+
+        async def send(event):
+            data = f"data: {event}\n\n".encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+
+        text = completion["choices"][0]["message"]["content"]
+        for i in range(0, len(text), self.chunk_chars):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            delta = {"choices": [{"index": 0, "delta": {"content": text[i:i + self.chunk_chars]}}]}
+            await send(json.dumps(delta))
+        await send(json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": completion["usage"]}))
+        await send("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                raw = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                try:
+                    body = json.loads(raw or b"{}")
+                except json.JSONDecodeError:
+                    body = {}
+                wait = self._retry_after(body.get("model"))
+                if wait is not None:
+                    self.rate_limited += 1
+                    payload = b'{"error": {"code": 429, "message": "Rate limit exceeded"}}'
+                    writer.write(
+                        b"HTTP/1.1 429 Too Many Requests\r\n"
+                        b"Content-Type: application/json\r\n"
+                        b"Retry-After: " + str(math.ceil(wait)).encode() + b"\r\n"
+                        b"Content-Length: " + str(len(payload)).encode() + b"\r\n"
+                        b"\r\n" + payload
+                    )
+                    await writer.drain()
+                    continue
+                model = body.get("model")
+                rng = self._rng(model, "".join(m.get("content", "") for m in body.get("messages", [])))
+                latency = self._setting(model, "latency")
+                jitter = self._setting(model, "jitter")
+                if latency and jitter:
+                    latency *= rng.lognormvariate(0, jitter)
+                if latency:
+                    await asyncio.sleep(latency)
+                if rng.random() < self._setting(model, "failure_rate"):
+                    self.failed += 1
+                    payload = b'{"error": {"code": 500, "message": "Mock upstream failure"}}'
+                    writer.write(
+                        f"HTTP/1.1 {self.failure_status} Error\r\n".encode() +
+                        b"Content-Type: application/json\r\n"
+                        b"Content-Length: " + str(len(payload)).encode() + b"\r\n"
+                        b"\r\n" + payload
+                    )
+                    await writer.drain()
+                    continue
+                completion = self.completion(body)
+                if body.get("stream"):
+                    await self._write_stream(writer, completion)
+                else:
+                    payload = json.dumps(completion).encode()
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\n"
+                        b"Content-Type: application/json\r\n"
+                        b"Content-Length: " + str(len(payload)).encode() + b"\r\n"
+                        b"\r\n" + payload
+                    )
+                    await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Client gave up (e.g. a cancelled hedge) or the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+
+def load_recorded(data_dir):
+    """Texts from stored JSON conversations, by kind and model, for `recorded=`."""
+    recorded = {"answer": {}, "critique": {}, "ranking": {}, "synthesis": {}}
+
+    def add(kind, model, text):
+        if model and text:
+            recorded[kind].setdefault(model, []).append(text)
+
+    for name in sorted(os.listdir(data_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(data_dir, name)) as f:
+            convo = json.load(f)
+        for msg in convo.get("messages", []):
+            if msg.get("role") != "assistant":
+                continue
+            for r in msg.get("stage1") or []:
+                add("answer", r.get("model"), r.get("response"))
+            for r in msg.get("stage2") or []:
+                add("ranking", r.get("model"), r.get("ranking"))
+            add("synthesis", (msg.get("stage3") or {}).get("model"), (msg.get("stage3") or {}).get("response"))
+            for node in (msg.get("vrt") or {}).get("nodes", []):
+                if node.get("type") == "critique":
+                    add("critique", node.get("model"), node.get("text"))
+    return {kind: by_model for kind, by_model in recorded.items() if by_model}
+
+
+async def _serve(args):
+    upstream = MockUpstream(args.host, args.port, args.latency, args.connect_delay, args.response_chars,
+                            args.token_delay, rate_limit=args.rate_limit, rate_burst=args.rate_burst,
+                            jitter=args.jitter, failure_rate=args.failure_rate, seed=args.seed,
+                            recorded=load_recorded(args.replay) if args.replay else None)
+    await upstream.start()
+    print(f"Mock upstream listening on {upstream.url}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await upstream.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--connect-delay", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, default=400)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests/s per model (0 = unlimited)")
+    parser.add_argument("--rate-burst", type=int, default=1)
+    parser.add_argument("--jitter", type=float, default=0.0, help="log-normal sigma of the latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="replay answers from this conversations directory")
+    asyncio.run(_serve(parser.parse_args()))
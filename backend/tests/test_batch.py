@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+
+from backend import batch
+from backend.ratelimit import AdmissionController
+
+
+def test_parse_items_accepts_objects_and_bare_strings():
+    lines = ['{"id": "a", "question": "Q1"}', "", '"Q2"', '{"content": "Q3"}']
+    assert batch.parse_items(lines) == [
+        {"id": "a", "question": "Q1"}, {"id": "3", "question": "Q2"}, {"id": "4", "question": "Q3"},
+    ]
+    with pytest.raises(ValueError, match="line 2"):
+        batch.parse_items(['"Q1"', '{"id": 1}'])
+    with pytest.raises(ValueError, match="duplicate"):
+        batch.parse_items(['{"id": "a", "question": "Q1"}', '{"id": "a", "question": "Q2"}'])
+
+
+def test_batch_runs_items_concurrently_up_to_the_limit_and_writes_as_they_finish(tmp_path, monkeypatch):
+    active, peak = 0, 0
+
+    async def fake_council(question):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.2 if question == "slow" else 0.01)
+        active -= 1
+        if question == "empty":
+            return [], [], {}, {}, {}
+        stage1 = [{"model": "m", "response": question}]
+        stage2 = [] if question == "unranked" else [{"model": "m", "ranking": "FINAL RANKING:\n1. Response A"}]
+        stage3 = {"response": "Unable to synthesize." if question == "unsynthesized" else question.upper()}
+        return stage1, stage2, stage3, {}, {"aggregate_ranking": {"order": ["A"]},
+                                            "consensus_scores": {"m": 1.0}, "nodes": []}
+
+    monkeypatch.setattr(batch, "run_full_council", fake_council)
+    source = tmp_path / "questions.jsonl"
+    source.write_text("\n".join(json.dumps(q) for q in ["slow", "a", "b", "empty", "c", "unranked", "unsynthesized"]))
+    out = tmp_path / "results.jsonl"
+
+    summary = asyncio.run(batch.run_file(str(source), str(out), concurrency=2))
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    assert peak == 2
+    assert summary["statuses"] == {"ok": 4, "error": 3}
+    assert records[-1]["id"] == "1"  # the slow one finishes last
+    by_id = {r["id"]: r for r in records}
+    assert by_id["2"]["stage3"] == {"response": "A"}
+    assert by_id["2"]["aggregate_ranking"] == {"order": ["A"]}
+    assert by_id["2"]["analytics"] == {"consensus_scores": {"m": 1.0}}
+    assert by_id["4"]["status"] == "error"
+    # A run without rankings or without a real synthesis is not a result either
+    assert by_id["6"]["status"] == by_id["7"]["status"] == "error"
+    assert "Stage 2" in by_id["6"]["error"] and "Unable to synthesize." in by_id["7"]["error"]
+
+    # Resuming only reruns the items that failed
+    summary = asyncio.run(batch.run_file(str(source), str(out), concurrency=2, resume=True))
+    assert summary["items"] == 3
+
+
+def test_batch_items_take_council_run_slots(monkeypatch):
+    active, peak = 0, 0
+
+    async def fake_council(question):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return [{"model": "m", "response": question}], [{"model": "m", "ranking": ""}], {"response": question}, {}, {}
+
+    async def main():
+        admission = AdmissionController(max_active=1)
+        return [r["status"] async for r in batch.run_batch(batch.parse_items(['"a"', '"b"', '"c"']), 3, admission)]
+
+    monkeypatch.setattr(batch, "run_full_council", fake_council)
+    assert asyncio.run(main()) == ["ok"] * 3
+    assert peak == 1
@@ -0,0 +1,36 @@
+from backend import budget
+
+LABELS = ["Response A", "Response B", "Response C"]
+
+
+def long_text(word, sentences):
+    return " ".join(f"Sentence {i} about {word} goes here." for i in range(sentences))
+
+
+def test_fitting_inputs_are_left_alone():
+    texts = ["short answer.", "another one."]
+    fitted, report = budget.fit(texts, LABELS[:2], budget=1000, overhead=10)
+    assert fitted == texts
+    assert report["estimated"] == report["original"] == 10 + sum(map(budget.estimate_tokens, texts))
+    assert report["trimmed"] == report["deduplicated"] == []
+
+
+def test_duplicates_are_dropped_then_long_inputs_trimmed_to_the_budget():
+    texts = [long_text("light", 200), long_text("light", 200), "Short and sweet."]
+    similarity = [[1, 0.97, 0.1], [0.97, 1, 0.1], [0.1, 0.1, 1]]
+    fitted, report = budget.fit(texts, LABELS, budget=500, overhead=50, similarity=similarity)
+    assert report["deduplicated"] == ["Response B"]
+    assert "Response A" in fitted[1]
+    assert report["trimmed"] == ["Response A"]
+    assert fitted[0].startswith("Sentence 0") and fitted[0].endswith(budget.TRIM_MARK)
+    assert fitted[2] == texts[2]
+    assert report["original"] > 500 >= report["estimated"]
+    assert report["estimated"] == 50 + sum(map(budget.estimate_tokens, fitted))
+
+
+def test_stage_budget_is_capped_by_the_smallest_context_window(monkeypatch):
+    monkeypatch.setitem(budget.STAGE_INPUT_BUDGETS, "stage2", 100_000)
+    monkeypatch.setattr(budget, "BUDGET_OUTPUT_RESERVE", 2048)
+    assert budget.stage_budget("stage2", ["mistralai/mistral-small", "mistralai/mistral-nemo"]) == 32768 - 2048
+    monkeypatch.setitem(budget.STAGE_INPUT_BUDGETS, "stage2", 6000)
+    assert budget.stage_budget("stage2", ["mistralai/mistral-nemo"]) == 6000
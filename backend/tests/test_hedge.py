@@ -0,0 +1,52 @@
+import asyncio
+
+from backend import openrouter
+
+
+def test_streaming_hedge_falls_back_when_the_stream_owner_fails(monkeypatch):
+    trials = []
+
+    async def query_once(model, messages, use_cache, on_delta):
+        if model == "primary":
+            await asyncio.sleep(0.05)
+            on_delta("partial")
+            await asyncio.sleep(0.05)
+            return None  # fails after taking over the stream
+        await asyncio.sleep(0.07)
+        on_delta("ignored")
+        await asyncio.sleep(0.05)
+        return {"role": "assistant", "content": "backup answer"}
+
+    monkeypatch.setattr(openrouter, "_query_once", query_once)
+    monkeypatch.setattr(openrouter, "hedge_delay", lambda model: 0.01)
+    monkeypatch.setattr(openrouter, "hedge_model", lambda model, exclude: "backup")
+    monkeypatch.setattr(openrouter.telemetry, "begin_trial", trials.append)
+    deltas = []
+    result = asyncio.run(openrouter.query_model("primary", [], on_delta=deltas.append, hedge=True))
+
+    # The backup was not cancelled when the primary took the stream, so it still answers
+    assert result == {"role": "assistant", "content": "backup answer", "model": "backup"}
+    assert deltas == ["partial"]
+    assert trials == ["backup"]
+
+
+def test_streaming_hedge_returns_the_stream_owners_answer(monkeypatch):
+    async def query_once(model, messages, use_cache, on_delta):
+        if model == "primary":
+            await asyncio.sleep(0.1)
+            return {"role": "assistant", "content": "primary answer"}  # done first, but never streamed
+        await asyncio.sleep(0.02)
+        on_delta("backup ")
+        await asyncio.sleep(0.15)
+        on_delta("answer")
+        return {"role": "assistant", "content": "backup answer"}
+
+    monkeypatch.setattr(openrouter, "_query_once", query_once)
+    monkeypatch.setattr(openrouter, "hedge_delay", lambda model: 0.01)
+    monkeypatch.setattr(openrouter, "hedge_model", lambda model, exclude: "backup")
+    monkeypatch.setattr(openrouter.telemetry, "begin_trial", lambda model: None)
+    deltas = []
+    result = asyncio.run(openrouter.query_model("primary", [], on_delta=deltas.append, hedge=True))
+
+    assert result == {"role": "assistant", "content": "backup answer", "model": "backup"}
+    assert "".join(deltas) == result["content"]
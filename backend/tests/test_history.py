@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from backend import council, history, storage, storage_json, storage_sqlite
+
+
+def turn_messages(n):
+    messages = []
+    for i in range(n):
+        messages.append({"role": "user", "content": f"question {i}"})
+        messages.append({"role": "assistant", "stage1": [], "stage2": [], "stage3": {"response": f"answer {i}."}})
+    return messages
+
+
+def test_window_keeps_recent_turns_and_summarizes_older_ones(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_TURNS", 2)
+    h = None
+    for i in range(4):
+        h = history.extend(h, f"question {i}", f"answer {i}.")
+    assert h["turn_count"] == 4
+    assert [t["question"] for t in h["turns"]] == ["question 2", "question 3"]
+    assert h["summary"] == ["Q: question 0 A: answer 0.", "Q: question 1 A: answer 1."]
+    assert h == history.from_messages(turn_messages(4))
+
+    text = history.contextualize(h, "and now?")
+    assert text.index("question 0") < text.index("User: question 3") < text.index("Current question:\nand now?")
+    assert history.contextualize(None, "first") == "first"
+
+
+def test_follow_ups_pick_models_by_the_question_and_prompt_with_the_history(monkeypatch):
+    routed, prompts = [], []
+
+    def select(query):
+        routed.append(query)
+        return {"scientist": "m1", "critic": "m2"}
+
+    async def query_model(model, messages, **kwargs):
+        prompts.append(messages[0]["content"])
+        return {"content": "ok", "model": model}
+
+    monkeypatch.setattr(council, "select_models_for_query", select)
+    monkeypatch.setattr(council, "query_model", query_model)
+    h = history.extend(None, "write python code to sort", "sorted(xs)")
+    asyncio.run(council.stage1_collect_responses("and in reverse?", history=h))
+    assert routed == ["and in reverse?"]
+    assert len(prompts) == 2 and all(history.contextualize(h, "and in reverse?") in p for p in prompts)
+
+
+def test_long_answers_and_summaries_stay_within_their_budgets(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_TURNS", 1)
+    monkeypatch.setattr(history, "HISTORY_SUMMARY_TOKENS", 100)
+    long_answer = " ".join(f"Sentence {i} of a long answer." for i in range(500))
+    h = None
+    for i in range(10):
+        h = history.extend(h, f"question {i}", long_answer)
+    assert history.estimate_tokens(h["turns"][0]["answer"]) <= history.HISTORY_ANSWER_TOKENS
+    assert sum(map(history.estimate_tokens, h["summary"])) <= 100
+    assert h["summary"][-1].startswith("Q: question 8")
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_storage_extends_history_with_each_turn(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_json, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage_json, "_index", None)
+    monkeypatch.setattr(storage_sqlite, "SQLITE_PATH", str(tmp_path / "c.db"))
+    monkeypatch.setattr(storage, "_backend", storage._backend)
+    storage.use_backend(backend)
+    # A conversation stored before histories existed
+    storage.import_conversation({"id": "c", "created_at": "2024-01-01", "title": "t", "messages": turn_messages(2)})
+    storage.add_user_message("c", "question 2")
+    storage.add_assistant_message("c", [], [], {"response": "answer 2."}, question="question 2")
+    # A failed turn is stored but not added to the history
+    storage.add_user_message("c", "question 3")
+    storage.add_assistant_message("c", [], [], {"response": "Unable to synthesize."}, question="question 3")
+    convo = storage.get_conversation("c")
+    assert convo["history"] == history.from_messages(turn_messages(3)) == history.from_messages(convo["messages"])
+    assert history.of(convo) is convo["history"]
+    # Clients never see it
+    assert "history" not in storage.get_messages("c")
+    assert "history" not in storage.update_conversation_title("c", "renamed")
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_legacy_history_is_built_once_and_stored(backend, tmp_path, monkeypatch):
+    from backend import async_storage
+
+    monkeypatch.setattr(storage_json, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage_json, "_index", None)
+    monkeypatch.setattr(storage_sqlite, "SQLITE_PATH", str(tmp_path / "c.db"))
+    monkeypatch.setattr(storage, "_backend", storage._backend)
+    monkeypatch.setattr(history, "HISTORY_TURNS", 2)
+    monkeypatch.setattr(history, "HISTORY_SUMMARY_TOKENS", 50)
+    storage.use_backend(backend)
+    storage.import_conversation({"id": "c", "created_at": "2024-01-01", "title": "t", "messages": turn_messages(50)})
+    storage.import_conversation({"id": "f", "created_at": "2024-01-01", "title": "t", "messages": [
+        {"role": "user", "content": "q"},
+        {"role": "assistant", "stage1": [], "stage2": [], "stage3": {"response": "Unable to synthesize."}},
+    ]})
+    expected = None
+    for i in range(50):
+        expected = history.extend(expected, f"question {i}", f"answer {i}.")
+
+    built = []
+    from_messages = history.from_messages
+    monkeypatch.setattr(history, "from_messages", lambda messages: built.append(1) or from_messages(messages))
+
+    async def load_twice(cid):
+        first = await async_storage.get_conversation(cid)
+        second = await async_storage.get_conversation(cid)
+        return first, second
+
+    first, second = asyncio.run(load_twice("c"))
+    assert first["history"] == second["history"] == expected
+    # A conversation whose turns all failed stores "no history" rather than rebuilding it each time
+    first, second = asyncio.run(load_twice("f"))
+    assert first["history"] is second["history"] is None
+    assert len(built) == 2
+    assert history.of(second) is None and len(built) == 2
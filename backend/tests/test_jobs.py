@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from backend.jobs import Job, JobQueue
+from backend.ratelimit import AdmissionController, Overloaded
+
+
+def test_jobs_run_in_the_background_and_streams_resume_after_an_event_id():
+    running = []
+
+    async def run(job):
+        running.append(job.id)
+        assert len(running) == 1  # one run slot: jobs never overlap
+        for i in range(4):
+            job.publish(f"{job.params['n']}.{i}")
+            await asyncio.sleep(0.01)
+        running.remove(job.id)
+        if job.params["n"] == 2:
+            raise ValueError("boom")
+
+    async def main():
+        queue = JobQueue(run, AdmissionController(max_active=1), max_queue=2)
+        first, second = queue.submit(n=1), queue.submit(n=2)
+        with pytest.raises(Overloaded):
+            queue.submit(n=3)
+
+        # Attach, leave after two events, and come back later for the rest
+        seen = []
+        async for event_id, frame in first.follow():
+            seen.append((event_id, frame))
+            if event_id == 2:
+                break
+        await asyncio.sleep(0.1)
+        assert first.status == "done" and second.status == "failed" and second.error == "boom"
+        rest = [pair async for pair in first.follow(after=2)]
+        await queue.stop()
+        return seen + rest
+
+    assert asyncio.run(main()) == [(1, "1.0"), (2, "1.1"), (3, "1.2"), (4, "1.3")]
+
+
+def test_cancelling_an_attached_run_cancels_its_work():
+    async def main():
+        queue = JobQueue(None, AdmissionController(max_active=1))
+        stopped = asyncio.Event()
+
+        async def run(job):
+            job.publish("started")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                stopped.set()
+                raise
+
+        job = Job({})
+        task = queue.attach(job, run)
+        await asyncio.sleep(0.01)
+        assert queue.get(job.id) is job and job.status == "running"
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await queue.stop()
+        return job, stopped.is_set()
+
+    job, cancelled = asyncio.run(main())
+    assert cancelled and job.status == "cancelled" and job.frames == ["started"]
+
+
+def test_deltas_give_way_to_the_frame_with_the_whole_text():
+    async def main():
+        job = Job({})
+        for token in ("a", "b", "c"):
+            job.publish(token, stream="answer")
+        job.publish("partial", stream="failed")
+        lagging = job.follow(after=1)
+        assert await lagging.__anext__() == (2, "b")
+        job.publish("abc", completes="answer")
+        job.finish("done")
+        return [pair async for pair in lagging], [pair async for pair in job.follow(after=2)], job.summary()
+
+    lagging, resumed, summary = asyncio.run(main())
+    # Ids stay the ones clients saw; the deltas they missed come as the whole text
+    assert lagging == resumed == [(5, "abc")]
+    assert summary["events"] == 5
+
+
+def test_queued_jobs_share_run_slots_with_admitted_runs():
+    async def main():
+        admission = AdmissionController(max_active=1, max_queue=0)
+        queue = JobQueue(lambda job: asyncio.sleep(0), admission)
+
+        # An interactive run holds the only slot: the job waits, and so would another request
+        await admission.acquire()
+        job = queue.submit()
+        await asyncio.sleep(0.05)
+        assert job.status == "queued"
+        with pytest.raises(Overloaded):
+            await admission.acquire()
+
+        admission.release()
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return job.status
+
+    assert asyncio.run(main()) == "done"
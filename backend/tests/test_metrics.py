@@ -0,0 +1,73 @@
+import random
+
+from backend import metrics
+
+
+def test_sketch_quantiles_within_accuracy():
+    sketch = metrics.LatencySketch(accuracy=0.01)
+    values = sorted(random.Random(0).expovariate(1.0) for _ in range(20000))
+    for v in values:
+        sketch.add(v)
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact < 0.03
+
+
+def test_summary_only_counts_window():
+    agg = metrics.RollingAggregator(bucket_seconds=10, retention=3600)
+    now = 10_000.0
+    for i in range(600):
+        agg.add({"timestamp": now - i, "model": "m", "latency": 1.0, "success": i % 2 == 0, "tokens": 2})
+    summary = agg.summary(60, now=now)
+    assert 60 <= summary["models"]["m"]["count"] <= 70
+    assert summary["overall"]["tokens"] == 2 * summary["overall"]["count"]
+    assert agg.summary(3600, now=now)["overall"]["count"] == 600
+
+
+def test_latency_quantile_per_model():
+    agg = metrics.RollingAggregator(bucket_seconds=10, retention=3600)
+    now = 10_000.0
+    for i in range(100):
+        agg.add({"timestamp": now - i, "model": "slow", "latency": 1.0 + i / 10, "success": True})
+        agg.add({"timestamp": now - i, "model": "fast", "latency": 0.1, "success": True})
+    assert abs(agg.latency_quantile("slow", 0.95, 3600, now=now) - 10.5) < 0.3
+    assert abs(agg.latency_quantile("fast", 0.95, 3600, now=now) - 0.1) < 0.01
+    assert agg.latency_quantile("slow", 0.95, 3600, min_count=500, now=now) is None
+    assert agg.latency_quantile("unknown", 0.95, 3600, now=now) is None
+
+
+def test_parse_window():
+    assert metrics.parse_window("5m") == 300
+    assert metrics.parse_window("1h") == 3600
+    assert metrics.parse_window("45") == 45
+
+
+def test_failed_flush_keeps_the_batch_within_the_buffer_limit(tmp_path, monkeypatch):
+    blocked = tmp_path / "not-a-dir"
+    blocked.write_text("")
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(blocked))
+    monkeypatch.setattr(metrics, "METRICS_MAX_BUFFER", 5)
+    monkeypatch.setattr(metrics, "_buffer", [{"n": i} for i in range(3)])
+    before = metrics.counters().get("metrics_entries_dropped", 0)
+
+    assert metrics.flush() == 0
+    metrics._buffer.extend({"n": i} for i in range(3, 7))
+    assert metrics.flush() == 0
+    # The oldest entries gave way to the newest
+    assert [e["n"] for e in metrics._buffer] == [2, 3, 4, 5, 6]
+    assert metrics.counters()["metrics_entries_dropped"] - before == 2
+
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path / "metrics"))
+    assert metrics.flush() == 5 and metrics._buffer == []
+
+
+def test_legacy_metrics_are_copied_once_and_left_in_place(tmp_path, monkeypatch):
+    legacy = tmp_path / "metrics.json"
+    legacy.write_text('[{"model": "m", "latency": 1.0}]')
+    monkeypatch.setattr(metrics, "LEGACY_METRICS_FILE", str(legacy))
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path / "metrics"))
+    metrics.migrate_legacy()
+    legacy.write_text("[]")
+    metrics.migrate_legacy()
+    assert legacy.exists()
+    assert len(metrics.segments()) == 1 and list(metrics.iter_entries()) == [{"model": "m", "latency": 1.0}]
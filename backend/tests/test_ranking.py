@@ -0,0 +1,45 @@
+import itertools
+
+import pytest
+
+from backend import ranking
+
+LABELS = ["Response A", "Response B", "Response C", "Response D"]
+
+
+def test_kemeny_follows_the_pairwise_majority_where_borda_does_not():
+    # A beats every other response head to head, but B collects more Borda points
+    rankings = {f"r{i}": ["Response A", "Response B", "Response C", "Response D"] for i in range(3)}
+    rankings.update({f"r{i}": ["Response B", "Response C", "Response D", "Response A"] for i in range(3, 5)})
+    agg = ranking.aggregate_rankings(rankings, LABELS)
+    assert agg["method"] == "kemeny"
+    assert agg["borda_order"][0] == "Response B"
+    assert agg["order"] == LABELS
+    prefs = ranking.pairwise_preferences(list(rankings.values()), LABELS)
+    best = max(ranking._agreement(p, prefs) for p in itertools.permutations(range(len(LABELS))))
+    assert agg["pairwise_support"] == pytest.approx(best / sum(map(sum, prefs)))
+    assert [e["label"] for e in agg["rankings"]] == agg["order"]
+    assert agg["rankings"][0]["first_place_votes"] == 3
+
+
+def test_partial_duplicate_and_unknown_labels():
+    agg = ranking.aggregate_rankings(
+        {"r1": ["Response C", "Response C", "Response Z"], "r2": ["Response C", "Response A"], "r3": []},
+        LABELS[:3], {"Response C": "Critic (m)"})
+    assert agg["rankers"] == 2
+    assert agg["order"] == ["Response C", "Response A", "Response B"]
+    assert agg["rankings"][0]["model"] == "Critic (m)"
+    assert agg["rankings"][2]["rankings_count"] == 0
+    assert ranking.aggregate_rankings({"r1": ["nothing"]}, LABELS) is None
+
+
+def test_kendall_tau_and_local_search_for_large_councils(monkeypatch):
+    assert ranking.kendall_tau(LABELS, LABELS) == 1
+    assert ranking.kendall_tau(LABELS, LABELS[::-1]) == -1
+    assert ranking.kendall_tau(["Response A"], LABELS) is None
+
+    monkeypatch.setattr(ranking, "KEMENY_EXACT_MAX", 2)
+    agg = ranking.aggregate_rankings({"r1": LABELS, "r2": LABELS, "r3": LABELS[::-1]}, LABELS)
+    assert agg["method"] == "kemeny_local"
+    assert agg["order"] == LABELS
+    assert agg["tau_to_consensus"] == {"r1": 1, "r2": 1, "r3": -1}
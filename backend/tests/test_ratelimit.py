@@ -0,0 +1,79 @@
+import asyncio
+import email.utils
+import time
+
+from backend.ratelimit import (
+    AdmissionController, Overloaded, TokenBucket, UpstreamBusy, UpstreamLimiter, parse_retry_after,
+)
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after("7") == 7
+    assert 28 <= parse_retry_after(email.utils.formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_token_bucket_spaces_out_reservations_and_honours_pause():
+    bucket = TokenBucket(rate=2.0, burst=2)
+    now = bucket.updated
+    waits = [bucket.reserve(now) for _ in range(4)]
+    assert waits == [0.0, 0.0, 0.5, 1.0]
+    bucket.blocked_until = now + 10
+    assert bucket.reserve(now + 5) >= 5
+
+
+def test_rate_limited_model_does_not_hold_a_global_slot_while_it_waits():
+    async def main():
+        limiter = UpstreamLimiter(max_concurrency=1, model_concurrency=0, model_rpm=60, model_burst=1,
+                                  queue_timeout=5)
+        async with limiter.slot("a"):
+            pass
+        # The next call to "a" has to wait about a second for a token
+        throttled = asyncio.create_task(limiter.slot("a").__aenter__())
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        async with limiter.slot("b"):
+            waited = time.monotonic() - start
+        throttled.cancel()
+        return waited
+
+    assert asyncio.run(main()) < 0.1
+
+
+def test_token_is_refunded_when_no_slot_is_taken():
+    async def main():
+        limiter = UpstreamLimiter(max_concurrency=0, model_concurrency=1, model_rpm=1, model_burst=3,
+                                  queue_timeout=0.05)
+        async with limiter.slot("a"):
+            # Times out on the model's concurrency cap
+            try:
+                async with limiter.slot("a"):
+                    pass
+            except UpstreamBusy:
+                pass
+            # Cancelled while waiting for the slot
+            waiting = asyncio.create_task(limiter.slot("a").__aenter__())
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+        return limiter._bucket("a").tokens
+
+    assert round(asyncio.run(main()), 2) == 2
+
+
+def test_admission_rejects_once_queue_is_full():
+    async def main():
+        admission = AdmissionController(max_active=2, max_queue=1, queue_timeout=5, retry_after=3)
+
+        async def run():
+            try:
+                async with admission.admit():
+                    await asyncio.sleep(0.05)
+                return "ok"
+            except Overloaded as e:
+                return e.retry_after
+
+        return await asyncio.gather(*[run() for _ in range(5)])
+
+    assert sorted(asyncio.run(main()), key=str) == [3, 3, "ok", "ok", "ok"]
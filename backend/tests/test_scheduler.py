@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from backend.scheduler import Stage, StageFailed, gather_quorum, run_dag
+
+
+async def answer(value, delay):
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_gather_quorum_cancels_stragglers():
+    async def main():
+        start = time.perf_counter()
+        results = await gather_quorum([answer("a", 0.01), answer("b", 0.02), answer("c", 5)], quorum=2, grace=0.05)
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(main())
+    assert results == ["a", "b", None]
+    assert elapsed < 1
+
+
+def test_gather_quorum_ignores_failed_answers():
+    async def main():
+        return await gather_quorum([answer(None, 0.01), answer("b", 0.02), answer("c", 0.03)], quorum=2)
+
+    assert asyncio.run(main()) == [None, "b", "c"]
+
+
+def test_run_dag_runs_independent_stages_concurrently():
+    async def slow(name):
+        await asyncio.sleep(0.2)
+        return name
+
+    async def main():
+        start = time.perf_counter()
+        results = await run_dag([
+            Stage("root", lambda r: answer(1, 0)),
+            Stage("left", lambda r: slow("left"), deps=["root"]),
+            Stage("right", lambda r: slow("right"), deps=["root"]),
+            Stage("join", lambda r: answer(r["left"] + r["right"], 0), deps=["left", "right"]),
+        ])
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(main())
+    assert results["join"] == "leftright"
+    assert elapsed < 0.35
+
+
+def test_run_dag_skips_dependents_of_failed_stage_and_uses_fallback():
+    async def fail(results):
+        raise StageFailed("nothing")
+
+    async def main():
+        return await run_dag([
+            Stage("a", fail),
+            Stage("b", lambda r: answer("b", 0), deps=["a"]),
+            Stage("c", lambda r: answer("c", 1), deadline=0.05, fallback=lambda: "fallback"),
+        ])
+
+    assert asyncio.run(main()) == {"c": "fallback"}
+
+
+def test_run_dag_contains_unexpected_errors_to_the_failing_branch():
+    async def broken(results):
+        raise ValueError("bug in an optional step")
+
+    async def main():
+        return await run_dag([
+            Stage("root", lambda r: answer("root", 0)),
+            Stage("analytics", broken, deps=["root"]),
+            Stage("report", lambda r: answer("report", 0), deps=["analytics"]),
+            Stage("answer", lambda r: answer("answer", 0.05), deps=["root"]),
+        ])
+
+    assert asyncio.run(main()) == {"root": "root", "answer": "answer"}
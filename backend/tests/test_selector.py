@@ -0,0 +1,40 @@
+import random
+
+from backend.selector import CLOSED, HALF_OPEN, OPEN, ModelTelemetry
+
+REGISTRY = [
+    {"id": "fast", "tags": ["general"], "cost": 1, "trust": 0.8, "latency": 1.0},
+    {"id": "slow", "tags": ["general"], "cost": 1, "trust": 0.8, "latency": 1.0},
+]
+
+
+def test_live_latency_outranks_static_prior():
+    t = ModelTelemetry(REGISTRY, policy="greedy")
+    for _ in range(20):
+        t.observe("fast", 0.5, True, tokens=200)
+        t.observe("slow", 8.0, True, tokens=200)
+    assert t.score("fast") > 2 * t.score("slow")
+
+
+def test_breaker_opens_after_consecutive_failures_and_allows_one_trial():
+    t = ModelTelemetry(REGISTRY, breaker_failures=3, breaker_cooldown=60)
+    for _ in range(3):
+        t.observe("slow", 1.0, False, now=1000)
+    assert t.state("slow", now=1010) == OPEN and not t.available("slow", now=1010)
+    assert t.state("slow", now=1061) == HALF_OPEN and t.available("slow", now=1061)
+    t.begin_trial("slow", now=1061)
+    assert not t.available("slow", now=1062)
+    t.observe("slow", 1.0, False, now=1070)
+    assert t.state("slow", now=1100) == OPEN
+    t.observe("slow", 1.0, True, now=1200)
+    assert t.state("slow", now=1200) == CLOSED
+
+
+def test_thompson_policy_still_explores_weaker_model():
+    t = ModelTelemetry(REGISTRY, policy="thompson", rng=random.Random(0))
+    for _ in range(10):
+        t.observe("fast", 1.0, True)
+        t.observe("slow", 1.0, True)
+        t.observe("slow", 1.0, False)
+    wins = sum(t.score("slow") > t.score("fast") for _ in range(500))
+    assert 0 < wins < 250
@@ -0,0 +1,27 @@
+import numpy as np
+
+from backend import semantic_cache
+from backend.semantic_cache import SemanticCache
+
+
+def test_incremental_rows_and_periodic_idf_refresh_match_a_full_rebuild(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "IDF_REFRESH_FRACTION", 0.25)
+    cache = SemanticCache(threshold=0.5, max_entries=8, ttl=60)
+    for i in range(12):
+        cache.store(f"how do I bake recipe number {i} with flour and sugar", i)
+    assert len(cache) == 8
+    # The oldest entries were evicted; lookups still land on the right slot
+    result, info = cache.lookup("how do I bake recipe number 10 with flour and sugar")
+    assert result == 10 and info["similarity"] > 0.99
+    assert cache.lookup("what is the capital of France") is None
+
+    # Once the index is rebuilt it matches one built from scratch
+    cache._changes = len(cache)
+    cache._maybe_rebuild()
+    fresh = SemanticCache(threshold=0.5, max_entries=8, ttl=60)
+    for entry in cache._entries:
+        fresh.store(entry["question"], entry["result"])
+    fresh._changes = len(fresh)
+    fresh._maybe_rebuild()
+    assert np.allclose(cache._idf, fresh._idf)
+    assert abs(cache._matrix - fresh._matrix).max() < 1e-9
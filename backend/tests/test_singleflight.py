@@ -0,0 +1,52 @@
+import asyncio
+
+from backend.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run_and_its_events():
+    calls = []
+
+    async def work(emit):
+        calls.append(1)
+        for i in range(3):
+            emit(i)
+            await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    async def main():
+        flights = SingleFlight("test")
+        seen = [[], []]
+        first = asyncio.ensure_future(flights.do("q", work, seen[0].append))
+        await asyncio.sleep(0.015)  # join mid-run: earlier events are replayed
+        second = await flights.do("q", work, seen[1].append)
+        return await first, second, seen, len(flights)
+
+    first, second, seen, remaining = asyncio.run(main())
+    assert calls == [1]
+    assert first == second == {"answer": 42}
+    assert seen == [[0, 1, 2], [0, 1, 2]]
+    assert remaining == 0
+
+
+def test_shared_run_is_cancelled_only_when_last_waiter_leaves():
+    async def main():
+        flights = SingleFlight("test")
+        started = asyncio.Event()
+
+        async def work(emit):
+            started.set()
+            await asyncio.sleep(10)
+
+        a = asyncio.ensure_future(flights.do("q", work))
+        b = asyncio.ensure_future(flights.do("q", work))
+        await started.wait()
+        shared = flights._flights["q"].task
+        a.cancel()
+        await asyncio.sleep(0)
+        still_running = not shared.done()
+        b.cancel()
+        await asyncio.gather(a, b, return_exceptions=True)
+        await asyncio.sleep(0)
+        return still_running, shared.cancelled()
+
+    assert asyncio.run(main()) == (True, True)
@@ -0,0 +1,40 @@
+import json
+import os
+import time
+
+from backend import storage_json
+
+
+def test_index_appends_changes_and_picks_up_files_edited_outside(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_json, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage_json, "_index", None)
+    monkeypatch.setattr(storage_json, "INDEX_COMPACT_MIN", 5)
+    for cid in ("a", "b", "c"):
+        storage_json.create_conversation(cid)
+    snapshot = (tmp_path / storage_json.INDEX_FILE).read_text()
+    storage_json.add_user_message("a", "hello")
+    storage_json.delete_conversation("c")
+    # Message writes only append to the log; the snapshot is untouched until compaction
+    assert (tmp_path / storage_json.INDEX_FILE).read_text() == snapshot
+    assert len((tmp_path / storage_json.INDEX_LOG).read_text().splitlines()) == 5
+
+    # Edit one conversation and add another behind the app's back
+    time.sleep(0.01)
+    convo = json.loads((tmp_path / "b.json").read_text())
+    convo["title"] = "edited"
+    (tmp_path / "b.json").write_text(json.dumps(convo))
+    (tmp_path / "d.json").write_text(json.dumps({**convo, "id": "d", "title": "new"}))
+
+    monkeypatch.setattr(storage_json, "_index", None)
+    index = storage_json._load_index()
+    assert {cid: (m["title"], m["message_count"]) for cid, m in index.items()} == {
+        "a": ("Conversation", 1), "b": ("edited", 0), "d": ("new", 0),
+    }
+    # Reconciling folded everything into a fresh snapshot
+    assert json.loads((tmp_path / storage_json.INDEX_FILE).read_text()) == index
+    assert os.path.getsize(tmp_path / storage_json.INDEX_LOG) == 0
+
+    for i in range(6):
+        storage_json.add_user_message("a", f"message {i}")
+    assert storage_json.list_conversations(sort_by="message_count")[0] == {**index["a"], "message_count": 7}
+    assert len((tmp_path / storage_json.INDEX_LOG).read_text().splitlines()) < 6  # compacted on the way
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import pytest
+
+from backend import tracing
+from backend.scheduler import Stage, StageFailed, run_dag
+
+
+def test_spans_nest_across_tasks_and_feed_server_timing():
+    async def stage1(results):
+        with tracing.span("storage.save"):
+            await asyncio.sleep(0.01)
+        return 1
+
+    async def stage2(results):
+        raise StageFailed("nothing to rank")
+
+    async def main():
+        with tracing.turn("council.turn") as root:
+            await run_dag([Stage("stage1", stage1), Stage("stage2", stage2, deps=["stage1"])])
+        return root
+
+    root = asyncio.run(main())
+    spans = {s.name: s for s in root.trace.spans}
+    assert set(spans) == {"council.turn", "stage.stage1", "stage.stage2", "storage.save"}
+    assert spans["storage.save"].parent_id == spans["stage.stage1"].span_id
+    assert spans["stage.stage1"].parent_id == root.span_id
+    assert spans["stage.stage2"].error == "nothing to rank"
+
+    timing = dict(part.split(";dur=") for part in tracing.server_timing(root).split(", "))
+    assert set(timing) == {"stage1", "stage2", "storage", "total"}
+    assert float(timing["storage"]) >= 10 and float(timing["total"]) >= float(timing["stage1"])
+
+    # Outside a turn nothing is recorded
+    with tracing.span("storage.save") as span:
+        assert span is tracing.NO_SPAN
+
+
+def test_export_writes_otlp_json_and_continues_a_callers_trace(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_EXPORTER", "file")
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(tmp_path / "traces.jsonl"))
+    parent = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+    with pytest.raises(ValueError):
+        with tracing.turn("council.turn", parent, endpoint="message") as root:
+            with tracing.span("llm.request", tracing.KIND_CLIENT, model="m") as span:
+                span.event("first_token")
+            raise ValueError("boom")
+    assert tracing.flush() == 2
+
+    body = json.loads((tmp_path / "traces.jsonl").read_text())
+    spans = {s["name"]: s for s in body["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert spans["council.turn"]["traceId"] == "ab" * 16 == root.trace_id
+    assert spans["council.turn"]["parentSpanId"] == "cd" * 8
+    assert spans["council.turn"]["status"] == {"code": 2, "message": "boom"}
+    assert spans["llm.request"]["parentSpanId"] == spans["council.turn"]["spanId"]
+    assert spans["llm.request"]["attributes"] == [{"key": "model", "value": {"stringValue": "m"}}]
+    assert spans["llm.request"]["events"][0]["name"] == "first_token"
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from backend import vrt_analytics
+
+
+def answers(*texts):
+    return [{"model": f"m{i}", "response": t} for i, t in enumerate(texts)]
+
+
+def test_matches_tfidf_cosine_when_idf_is_fitted_on_the_same_texts(monkeypatch):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    s1 = answers("the sky is blue because of rayleigh scattering",
+                 "rayleigh scattering makes the sky look blue",
+                 "the ocean reflects the sky")
+    monkeypatch.setattr(vrt_analytics, "vectorizer", vrt_analytics.CorpusVectorizer())
+    result = vrt_analytics.analyze(s1)
+    expected = cosine_similarity(TfidfVectorizer().fit_transform([r["response"] for r in s1]))
+    np.testing.assert_allclose(result["similarity_matrix"], expected, atol=1e-9)
+    np.testing.assert_allclose(result["contradiction_matrix"], 1 - expected, atol=1e-9)
+    assert result["consensus_scores"]["m0"] == pytest.approx(expected[0].mean())
+
+
+def test_analyze_many_matches_per_turn_results(monkeypatch):
+    turns = [answers("a b c", "a b d"), answers("only one"), answers("x y", "y z", "x z")]
+    monkeypatch.setattr(vrt_analytics, "vectorizer", vrt_analytics.CorpusVectorizer())
+    vrt_analytics.vectorizer.partial_fit([r["response"] for t in turns for r in t])
+    batch = vrt_analytics.analyze_many(turns, fit=False)
+    assert batch[1] == {}
+    for turn, result in zip(turns, batch):
+        if result:
+            assert result == vrt_analytics.analyze(turn, fit=False)
+
+
+def test_seed_corpus_fits_the_stored_answers(tmp_path, monkeypatch):
+    from backend import storage, storage_json
+
+    monkeypatch.setattr(storage_json, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage_json, "_index", None)
+    monkeypatch.setattr(storage, "_backend", storage._backend)
+    storage.use_backend("json")
+    stored = [answers("a b c", "a b d"), answers("only one")]
+    for i, s1 in enumerate(stored):
+        storage.import_conversation({"id": f"c{i}", "created_at": "2024-01-01", "title": "t", "messages": [
+            {"role": "user", "content": "q"},
+            {"role": "assistant", "stage1": s1, "stage2": [], "stage3": {"response": "r"}},
+        ]})
+    monkeypatch.setattr(vrt_analytics, "vectorizer", vrt_analytics.CorpusVectorizer())
+    assert vrt_analytics.seed_corpus() == 3
+
+    fitted = vrt_analytics.CorpusVectorizer()
+    fitted.partial_fit([r["response"] for s1 in stored for r in s1])
+    assert vrt_analytics.vectorizer.n_docs == 3
+    assert np.array_equal(vrt_analytics.vectorizer._df, fitted._df)
+
+
+def test_ranking_agreement_kendall_tau():
+    s2 = [
+        {"model": "a", "parsed_ranking": ["Response A", "Response B", "Response C"]},
+        {"model": "b", "parsed_ranking": ["Response A", "Response B", "Response C"]},
+        {"model": "c", "parsed_ranking": ["Response C", "Response B", "Response A"]},
+        {"model": "d", "parsed_ranking": []},
+    ]
+    agreement = vrt_analytics.ranking_agreement(s2)
+    assert agreement["rankers"] == ["a", "b", "c"]
+    tau = agreement["pairwise_tau"]
+    assert tau[0][1] == 1.0 and tau[0][2] == -1.0
+    assert agreement["mean_pairwise_tau"] == pytest.approx(-1 / 3)
+    assert vrt_analytics.ranking_agreement(s2[:1]) is None
@@ -0,0 +1,324 @@
+"""Tracing spans for council turns, exported in the OpenTelemetry JSON format.
+
+A turn is one trace: the request handler opens the root span, and the
+council run, its stages, model calls, storage writes, analytics and payload
+serialization open child spans below it:
+
+    council.turn
+      admission.wait
+      storage.add_user_message
+      council.run
+        stage.stage1
+          llm.query
+            llm.request
+              llm.queue
+        stage.matrices
+          vrt.analytics
+        ...
+      serialize.vrt_complete_frame
+      storage.add_assistant_message
+
+The current span lives in a context variable, so tasks started inside a
+span (DAG stages, parallel model calls, single-flight work) become its
+children without passing anything around. Outside a turn `span` does
+nothing.
+
+Finished spans are kept on their trace (for the Server-Timing header) and,
+with an exporter configured, buffered and written off the event loop like
+metrics: TRACE_EXPORTER=file appends one OTLP/JSON ExportTraceServiceRequest
+per line to TRACE_FILE, TRACE_EXPORTER=otlp posts the same body to an
+OpenTelemetry collector at TRACE_OTLP_ENDPOINT.
+"""
+
+import asyncio
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from . import metrics
+from .config import (
+    TRACE_EXPORTER,
+    TRACE_FILE,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_SERVICE_NAME,
+    TRACE_FLUSH_INTERVAL,
+    TRACE_MAX_BUFFER,
+)
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+# OTLP span kinds
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_buffer: deque = deque(maxlen=TRACE_MAX_BUFFER)
+_buffer_lock = threading.Lock()
+_write_lock = threading.Lock()
+_flusher: Optional[asyncio.Task] = None
+
+
+class Trace:
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        # Finished spans, in the order they ended
+        self.spans: List["Span"] = []
+
+
+class Span:
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None, kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events: List[tuple] = []
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, at_ns: Optional[int] = None, **attributes):
+        self.events.append((at_ns or time.time_ns(), name, attributes))
+
+    def fail(self, error: Any):
+        self.error = str(error) or type(error).__name__
+
+    def child(self, name: str, start_ns: int, end_ns: Optional[int] = None, **attributes) -> "Span":
+        """Record an already finished child span, e.g. time spent waiting before this point."""
+        span = Span(self.trace, name, self.span_id, attributes=attributes, start_ns=start_ns)
+        span.end(end_ns)
+        return span
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        self.trace.spans.append(self)
+        if TRACE_EXPORTER != "none":
+            with _buffer_lock:
+                if len(_buffer) == _buffer.maxlen:
+                    metrics.increment("trace_spans_dropped")
+                _buffer.append(self)
+
+
+class _NoSpan:
+    """Stands in for a span outside any turn; every call is a no-op."""
+
+    trace_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def event(self, name, at_ns=None, **attributes):
+        pass
+
+    def fail(self, error):
+        pass
+
+    def child(self, name, start_ns, end_ns=None, **attributes):
+        return self
+
+    def end(self, end_ns=None):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def current():
+    """The active span, or NO_SPAN outside a turn."""
+    return _current.get() or NO_SPAN
+
+
+def trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def start(name: str, traceparent: Optional[str] = None, **attributes) -> Span:
+    """Root span of a new trace; continues the caller's trace given a W3C `traceparent`."""
+    match = _TRACEPARENT.match((traceparent or "").strip().lower())
+    if match:
+        return Span(Trace(match.group(1)), name, match.group(2), KIND_SERVER, attributes)
+    return Span(Trace(), name, None, KIND_SERVER, attributes)
+
+
+@contextmanager
+def activate(span: Span, end_on_error: bool = False) -> Iterator[Span]:
+    """Make `span` the current span inside the block, without ending it.
+
+    With `end_on_error`, an exception leaving the block ends the span and
+    is recorded on it.
+    """
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        if end_on_error:
+            if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+                span.set(cancelled=True)
+            else:
+                span.fail(e)
+            span.end()
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Exited from another context (an async generator closed elsewhere)
+            pass
+
+
+@contextmanager
+def turn(name: str, traceparent: Optional[str] = None, **attributes) -> Iterator[Span]:
+    """Start, activate and end the root span of a turn."""
+    root = start(name, traceparent, **attributes)
+    with activate(root, end_on_error=True):
+        yield root
+    root.end()
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes) -> Iterator[Any]:
+    """Child span of the current one for the duration of the block (NO_SPAN outside a turn)."""
+    parent = _current.get()
+    if parent is None:
+        yield NO_SPAN
+        return
+    child = Span(parent.trace, name, parent.span_id, kind, attributes)
+    with activate(child, end_on_error=True):
+        yield child
+    child.end()
+
+
+def server_timing(root: Span) -> str:
+    """Server-Timing header value: per-stage, admission, storage and serialization time, and the total."""
+    totals: Dict[str, float] = {}
+    for s in root.trace.spans:
+        if s.name.startswith("stage."):
+            key = s.name[len("stage."):]
+        elif s.name == "admission.wait":
+            key = "admission"
+        elif s.name.startswith("storage."):
+            key = "storage"
+        elif s.name.startswith("serialize."):
+            key = "serialize"
+        else:
+            continue
+        totals[key] = totals.get(key, 0.0) + s.duration_ms
+    totals["total"] = root.duration_ms
+    return ", ".join(f"{key};dur={ms:.1f}" for key, ms in totals.items())
+
+
+def _value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _value(v)} for k, v in attributes.items() if v is not None]
+
+
+def to_otlp(span: Span) -> Dict[str, Any]:
+    out = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _attributes(span.attributes),
+        "events": [{"timeUnixNano": str(t), "name": name, "attributes": _attributes(attrs)}
+                   for t, name, attrs in span.events],
+        "status": {"code": STATUS_ERROR, "message": span.error} if span.error is not None else {},
+    }
+    if span.parent_id:
+        out["parentSpanId"] = span.parent_id
+    return out
+
+
+def export_request(spans: List[Span]) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for `spans`."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": _attributes({"service.name": TRACE_SERVICE_NAME})},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": [to_otlp(s) for s in spans]}],
+    }]}
+
+
+def flush() -> int:
+    """Export all buffered spans. Blocking; returns spans exported."""
+    with _buffer_lock:
+        batch = list(_buffer)
+        _buffer.clear()
+    if not batch:
+        return 0
+    body = export_request(batch)
+    with _write_lock:
+        try:
+            if TRACE_EXPORTER == "otlp":
+                httpx.post(TRACE_OTLP_ENDPOINT, json=body, timeout=10).raise_for_status()
+            else:
+                os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+                with open(TRACE_FILE, "a") as f:
+                    f.write(json.dumps(body, separators=(",", ":")) + "\n")
+        except Exception as e:
+            print(f"Failed to export {len(batch)} spans: {e}")
+            metrics.increment("trace_spans_dropped", len(batch))
+            return 0
+    return len(batch)
+
+
+async def flush_async() -> int:
+    return await asyncio.to_thread(flush)
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+        await flush_async()
+
+
+async def start_exporter():
+    global _flusher
+    if TRACE_EXPORTER != "none" and _flusher is None:
+        _flusher = asyncio.create_task(_flush_loop())
+
+
+async def stop_exporter():
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except asyncio.CancelledError:
+            pass
+        _flusher = None
+    if TRACE_EXPORTER != "none":
+        await flush_async()
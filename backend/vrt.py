@@ -0,0 +1,86 @@
+"""Visual Reasoning Tree helpers shared by the council, storage and API layers.
+
+Stage 1 answers, Stage 2 rankings and the Stage 3 synthesis already carry
+their full text on the message. VRT nodes for them store a `text_ref` naming
+the stage instead of a second copy; the node is matched to its stage entry by
+`node_id`. `hydrate_vrt` puts the texts back when a client asks for them.
+"""
+
+import json
+
+# Stage field on the message -> key holding that entry's text
+STAGE_TEXT_KEYS = {"stage1": "response", "stage2": "ranking", "stage3": "response"}
+
+
+def _stage_entries(message, stage):
+    entries = message.get(stage) or []
+    return [entries] if isinstance(entries, dict) else entries
+
+
+def _texts_by_node(message):
+    texts = {}
+    for stage, key in STAGE_TEXT_KEYS.items():
+        for entry in _stage_entries(message, stage):
+            if entry.get("node_id") is not None:
+                texts[entry["node_id"]] = (stage, entry.get(key, ""))
+    return texts
+
+
+def compact_vrt(vrt, message):
+    """Drop node texts that duplicate a stage entry of `message`."""
+    if not vrt or not vrt.get("nodes"):
+        return vrt
+    texts = _texts_by_node(message)
+    compact = dict(vrt)
+    nodes = []
+    for node in vrt["nodes"]:
+        ref = texts.get(node["id"])
+        if ref is not None and node.get("text") == ref[1]:
+            node = {k: v for k, v in node.items() if k != "text"}
+            node["text_ref"] = ref[0]
+        nodes.append(node)
+    compact["nodes"] = nodes
+    return compact
+
+
+def hydrate_vrt(vrt, message):
+    """Inverse of `compact_vrt`: resolve every `text_ref` back into `text`."""
+    if not vrt or not vrt.get("nodes"):
+        return vrt
+    texts = _texts_by_node(message)
+    hydrated = dict(vrt)
+    nodes = []
+    for node in vrt["nodes"]:
+        if "text_ref" in node:
+            node = {k: v for k, v in node.items() if k != "text_ref"}
+            node["text"] = texts.get(node["id"], (None, ""))[1]
+        nodes.append(node)
+    hydrated["nodes"] = nodes
+    return hydrated
+
+
+def slim_message(message, index):
+    """Message view for listings: VRT payload replaced by a `has_vrt` flag."""
+    slim = {k: v for k, v in message.items() if k != "vrt"}
+    slim["index"] = index
+    if message.get("role") == "assistant":
+        slim["has_vrt"] = bool(message.get("vrt"))
+    return slim
+
+
+def page_messages(messages, before=None, limit=None, include_vrt=False):
+    """Select up to `limit` messages with index < `before`, oldest first."""
+    end = len(messages) if before is None else max(0, min(before, len(messages)))
+    start = 0 if limit is None else max(0, end - limit)
+    if include_vrt:
+        return [dict(messages[i], index=i) for i in range(start, end)]
+    return [slim_message(messages[i], i) for i in range(start, end)]
+
+
+def vrt_complete_frame(vrt, message):
+    """The `vrt_complete` SSE frame: compacts and serializes in one go, so it can run off the event loop."""
+    return sse_frame({"type": "vrt_complete", "vrt": compact_vrt(vrt, message)})
+
+
+def sse_frame(event):
+    return f"data: {json.dumps(event)}\n\n"
@@ -0,0 +1,212 @@
+"""Consensus analytics for the Visual Reasoning Tree (Task C).
+
+Stage 1 answers are embedded as TF-IDF vectors whose IDF comes from the
+whole corpus of answers seen so far: a HashingVectorizer needs no
+vocabulary, and document frequencies are updated incrementally with every
+turn instead of refitting a TfidfVectorizer per request. `seed_corpus`
+fits them on the stored conversations when the server starts. From those vectors
+this computes the similarity / contradiction matrices and consensus scores,
+all as NumPy batch operations, and from the Stage 2 rankings the Kendall
+tau between each pair of rankers.
+
+`analyze_many` handles many turns with a single transform, which is what
+`recompute_conversations` uses to refresh analytics for stored history:
+
+    python -m backend.vrt_analytics            # every conversation
+    python -m backend.vrt_analytics <id> ...   # selected conversations
+"""
+
+import argparse
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from . import compute, tracing
+from .ranking import kendall_tau
+
+N_FEATURES = 2 ** 18
+
+
+class CorpusVectorizer:
+    """TF-IDF over a hashed vocabulary with corpus-wide, incrementally updated IDF."""
+
+    def __init__(self, n_features: int = N_FEATURES):
+        self._hasher = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+        self._df = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+        self._lock = threading.Lock()
+
+    def counts(self, texts: Sequence[str]) -> sparse.csr_matrix:
+        return self._hasher.transform(texts).tocsr()
+
+    def partial_fit_counts(self, counts: sparse.csr_matrix):
+        present = counts.copy()
+        present.data[:] = 1
+        with self._lock:
+            self._df += np.asarray(present.sum(axis=0)).ravel().astype(np.int64)
+            self.n_docs += counts.shape[0]
+
+    def partial_fit(self, texts: Sequence[str]):
+        self.partial_fit_counts(self.counts(texts))
+
+    def weight(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """IDF-weight and L2-normalize count rows (smoothed IDF, as TfidfVectorizer)."""
+        weighted = counts.astype(np.float64)
+        with self._lock:
+            # Only the columns present; the full IDF vector is never materialized
+            weighted.data *= np.log((1 + self.n_docs) / (1 + self._df[weighted.indices])) + 1
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ weighted
+
+    def transform(self, texts: Sequence[str], fit: bool = True) -> sparse.csr_matrix:
+        counts = self.counts(texts)
+        if fit:
+            self.partial_fit_counts(counts)
+        return self.weight(counts)
+
+
+vectorizer = CorpusVectorizer()
+
+
+def warm_up():
+    """Touch the vectorizer once so scikit-learn/SciPy imports and setup happen at startup."""
+    vectorizer.transform(["warm up"], fit=False)
+
+
+def seed_corpus() -> int:
+    """Fit the corpus IDF on the Stage 1 answers of every stored conversation.
+
+    Called once at startup, so the IDF does not restart from nothing with
+    each process. Returns the number of answers fitted.
+    """
+    from . import storage
+
+    fitted = 0
+    for meta in storage.list_conversations():
+        convo = storage.get_conversation(meta["id"])
+        if not convo:
+            continue
+        texts = [r["response"] for msg in convo["messages"] if msg.get("role") == "assistant"
+                 for r in msg.get("stage1") or []]
+        if texts:
+            vectorizer.partial_fit(texts)
+            fitted += len(texts)
+    return fitted
+
+
+def _matrices(sim: np.ndarray, stage1: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "similarity_matrix": sim.tolist(),
+        "contradiction_matrix": (1 - sim).tolist(),
+        # Average similarity to all answers (self included)
+        "consensus_scores": {r["model"]: s for r, s in zip(stage1, sim.mean(axis=1).tolist())},
+    }
+
+
+def hash_counts(texts: Sequence[str]) -> sparse.csr_matrix:
+    """Term counts of `texts`: the tokenizing, CPU-heavy half, safe to run in a worker process."""
+    return vectorizer.counts(texts)
+
+
+def analyze_many(turns: Iterable[List[Dict[str, Any]]], fit: bool = True) -> List[Dict[str, Any]]:
+    """Similarity/contradiction/consensus for many Stage 1 answer sets in one transform.
+
+    Returns one dict per turn; turns with fewer than two answers get {}.
+    """
+    turns = list(turns)
+    texts = [r["response"] for s1 in turns for r in s1]
+    if not texts:
+        return [{} for _ in turns]
+    return analyze_counts(turns, hash_counts(texts), fit)
+
+
+def analyze_counts(turns: List[List[Dict[str, Any]]], counts: sparse.csr_matrix,
+                   fit: bool = True) -> List[Dict[str, Any]]:
+    """`analyze_many` from precomputed `hash_counts` of all the turns' answers."""
+    if fit:
+        vectorizer.partial_fit_counts(counts)
+    X = vectorizer.weight(counts)
+    out = []
+    start = 0
+    for s1 in turns:
+        n = len(s1)
+        if n > 1:
+            block = X[start:start + n]
+            sim = np.clip((block @ block.T).toarray(), 0.0, 1.0)
+            out.append(_matrices(sim, s1))
+        else:
+            out.append({})
+        start += n
+    return out
+
+
+def analyze(stage1: List[Dict[str, Any]], fit: bool = True) -> Dict[str, Any]:
+    return analyze_many([stage1], fit=fit)[0]
+
+
+async def analyze_async(stage1: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """`analyze` with tokenizing on the compute pool; the corpus IDF stays in this process."""
+    if len(stage1) < 2:
+        return {}
+    with tracing.span("vrt.analytics", responses=len(stage1)):
+        counts = await compute.run_cpu(hash_counts, [r["response"] for r in stage1])
+        return analyze_counts([stage1], counts)[0]
+
+
+def ranking_agreement(stage2: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Kendall tau between each pair of rankers over the responses both ranked.
+
+    How much the rankers agree with each other, as opposed to each ranker's
+    tau to the consensus order (`tau_to_consensus` in ranking.py); both use
+    `ranking.kendall_tau`. None with fewer than two usable rankings.
+    """
+    rankings = [(r["model"], r.get("parsed_ranking") or []) for r in stage2]
+    rankings = [(m, list(dict.fromkeys(p))) for m, p in rankings if len(set(p)) > 1]
+    if len(rankings) < 2:
+        return None
+    tau = [[kendall_tau(a, b) for _, b in rankings] for _, a in rankings]
+    pairs = [tau[i][j] for i in range(len(rankings)) for j in range(len(rankings))
+             if i != j and tau[i][j] is not None]
+    return {
+        "rankers": [m for m, _ in rankings],
+        "pairwise_tau": tau,
+        "mean_pairwise_tau": sum(pairs) / len(pairs) if pairs else None,
+    }
+
+
+def recompute_conversations(ids: Optional[Sequence[str]] = None) -> int:
+    """Refresh the analytics of every stored VRT (of `ids`, or all conversations).
+
+    The corpus IDF is fitted on all the answers first, then every turn is
+    analyzed in one batch. Returns the number of messages updated.
+    """
+    from . import storage
+
+    if ids is None:
+        ids = [c["id"] for c in storage.list_conversations()]
+    convos = [c for c in (storage.get_conversation(cid) for cid in ids) if c]
+    targets = [(convo, msg) for convo in convos for msg in convo["messages"]
+               if msg.get("role") == "assistant" and msg.get("vrt") and msg.get("stage1")]
+    stage1s = [msg["stage1"] for _, msg in targets]
+    vectorizer.partial_fit([r["response"] for s1 in stage1s for r in s1])
+    for (_, msg), result in zip(targets, analyze_many(stage1s, fit=False)):
+        msg["vrt"].update(result)
+        agreement = ranking_agreement(msg.get("stage2") or [])
+        if agreement:
+            msg["vrt"]["ranking_agreement"] = agreement
+    touched = {id(convo): convo for convo, _ in targets}
+    for convo in touched.values():
+        storage.import_conversation(convo, overwrite=True)
+    return len(targets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute VRT analytics for stored conversations")
+    parser.add_argument("ids", nargs="*", help="conversation ids (default: all)")
+    args = parser.parse_args()
+    count = recompute_conversations(args.ids or None)
+    print(f"Recomputed analytics for {count} messages")
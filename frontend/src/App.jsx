@@ -40,6 +40,11 @@ function App() {
   const loadConversation = async (id) => {
     try {
       const data = await api.getConversation(id);
+      // Messages come without VRTs; fetch only the latest one for the tree panel
+      const latest = data.messages.findLast(m => m.has_vrt);
+      if (latest) {
+        latest.vrt = await api.getMessageVRT(id, latest.index);
+      }
       setCurrentConv(data);
     } catch (e) {
       console.error(e);
@@ -107,6 +112,20 @@ function App() {
 
           switch (type) {
             case 'stage1_start': last.loading.stage1 = true; break;
+            case 'stage1_delta': {
+              // Show each answer as it streams in, one entry per role
+              const entries = last.stage1 || [];
+              const entry = entries.find(r => r.role === data.role);
+              if (entry) entry.response += data.delta;
+              else entries.push({ role: data.role, model: data.model, response: data.delta });
+              last.stage1 = [...entries];
+              break;
+            }
+            case 'stage1_model_complete': {
+              const entries = (last.stage1 || []).filter(r => r.role !== data.role);
+              last.stage1 = [...entries, data.data];
+              break;
+            }
             case 'stage1_complete':
               last.stage1 = data.data;
               last.loading.stage1 = false;
@@ -120,6 +139,9 @@ function App() {
               last.loading.stage3 = true;
               break;
             case 'stage3_start': last.loading.stage3 = true; break;
+            case 'stage3_delta':
+              last.stage3 = { model: data.model, response: (last.stage3?.response || '') + data.delta };
+              break;
             case 'stage3_complete':
               last.stage3 = data.data;
               last.loading.stage3 = false;
@@ -142,7 +164,15 @@ function App() {
     }
   };
 
-  const handleShowHeatmap = (vrt) => {
+  const handleShowHeatmap = async (msg) => {
+    let vrt = msg.vrt;
+    if (!vrt && msg.has_vrt) {
+      try {
+        vrt = await api.getMessageVRT(currentId, msg.index);
+      } catch (e) {
+        console.error(e);
+      }
+    }
     if (vrt?.similarity_matrix) {
       // Get labels from VRT nodes
       const labels = vrt.nodes
@@ -209,7 +239,7 @@ function App() {
                 <MessageBubble
                   key={idx}
                   message={msg}
-                  onShowHeatmap={() => handleShowHeatmap(msg.vrt)}
+                  onShowHeatmap={() => handleShowHeatmap(msg)}
                 />
               ))}
               {isLoading && (
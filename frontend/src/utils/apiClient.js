@@ -21,6 +21,12 @@ export const api = {
         return response.json();
     },
 
+    async getMessageVRT(id, idx) {
+        const response = await fetch(`${API_BASE}/api/conversations/${id}/messages/${idx}/vrt`);
+        if (!response.ok) throw new Error('Failed to get reasoning tree');
+        return response.json();
+    },
+
     async renameConversation(id, title) {
         const response = await fetch(`${API_BASE}/api/conversations/${id}`, {
             method: 'PATCH',